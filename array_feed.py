@@ -0,0 +1,134 @@
+import array
+import os
+
+import backtrader as bt
+import numpy as np
+
+# Ordinal of 1970-01-01 in backtrader's date numbers (days since 0001-01-01 plus one)
+EPOCH_ORDINAL = 719163
+# Rows converted to Python floats at once when bars are loaded one by one (exactbars)
+CHUNK_SIZE = 1 << 16
+
+LINES = ("open", "high", "low", "close", "volume", "openinterest")
+
+# backtrader timeframe and compression of the rollups.TIMEFRAMES
+TIMEFRAMES = {
+    "1m": (bt.TimeFrame.Minutes, 1),
+    "5m": (bt.TimeFrame.Minutes, 5),
+    "15m": (bt.TimeFrame.Minutes, 15),
+    "1h": (bt.TimeFrame.Minutes, 60),
+    "1d": (bt.TimeFrame.Days, 1),
+}
+
+
+def _value_lines(feed):
+    """Names of the lines of feed filled from columns: OHLCV plus any lines a subclass declares."""
+    return [name for name in feed.lines.getlinealiases() if name != "datetime"]
+
+
+def epoch_to_num(times):
+    """int64 epoch seconds or datetime64 values -> backtrader date numbers (float64)."""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        times = times.astype("datetime64[s]").astype(np.int64)
+    days, seconds = np.divmod(times.astype(np.int64), 86400)
+    return (days + EPOCH_ORDINAL).astype(np.float64) + seconds / 86400.0
+
+
+def open_columns(path):
+    """Column arrays of a bar_cache directory (datetime.npy, open.npy, ...), memory-mapped."""
+    columns = {}
+    for file in sorted(os.listdir(path)):
+        if file.endswith(".npy"):
+            columns[file[:-len(".npy")]] = np.load(os.path.join(path, file), mmap_mode="r")
+    return columns
+
+
+class ArrayData(bt.feed.DataBase):
+    """Data feed over NumPy column arrays, no pandas involved.
+
+    dataname is a dict of arrays (datetime as int64 epoch seconds or
+    datetime64, open/high/low/close/volume, optional openinterest) such as
+    bar_cache.load_bars() returns, or the path of a directory of .npy files
+    that is memory-mapped. Subclasses may declare more lines, they are
+    filled from the columns of the same names (NaN when a column is missing).
+
+    With preload (the cerebro default) each line buffer is filled from the
+    arrays in one copy. With exactbars the bars are delivered one at a time
+    from chunks of CHUNK_SIZE rows, so a memory-mapped multi-year series is
+    never held in memory as a whole.
+    """
+
+    params = (
+        ("timeframe", bt.TimeFrame.Minutes),
+    )
+
+    def start(self):
+        super().start()
+        columns = self.p.dataname
+        if isinstance(columns, (str, os.PathLike)):
+            columns = open_columns(columns)
+        self._columns = columns
+        self._names = _value_lines(self)
+        self._times = columns["datetime"]
+        self._rows = len(self._times)
+        self._pos = 0
+        self._chunk_end = 0
+        self._chunk = None
+
+    def _window(self, nums):
+        """[lo, hi) of the rows within fromdate/todate."""
+        lo = int(np.searchsorted(nums, self.fromdate, side="left"))
+        hi = int(np.searchsorted(nums, self.todate, side="right"))
+        return lo, max(lo, hi)
+
+    def preload(self):
+        # filters and input time zones need the bar by bar path of DataBase.load()
+        if self._filters or self._tzinput:
+            return super().preload()
+
+        nums = epoch_to_num(self._times)
+        lo, hi = self._window(nums)
+        self._fill(self.lines.datetime, nums[lo:hi])
+        for name in self._names:
+            line = getattr(self.lines, name)
+            if name in self._columns:
+                self._fill(line, self._columns[name][lo:hi])
+            else:
+                self._fill(line, np.full(hi - lo, np.nan))
+        self._pos = self._rows
+        self.home()
+
+    @staticmethod
+    def _fill(line, values):
+        line.array = array.array("d", np.ascontiguousarray(values, dtype=np.float64).tobytes())
+
+    def _load(self):
+        if self._pos >= self._chunk_end:
+            if self._pos >= self._rows:
+                return False
+            self._load_chunk()
+        i = self._pos - self._chunk_start
+        self._pos += 1
+        values = self._chunk
+        self.lines.datetime[0] = values["datetime"][i]
+        for name in self._names:
+            getattr(self.lines, name)[0] = values[name][i]
+        return True
+
+    def _load_chunk(self):
+        self._chunk_start = self._pos
+        self._chunk_end = min(self._pos + CHUNK_SIZE, self._rows)
+        rows = slice(self._chunk_start, self._chunk_end)
+        chunk = {"datetime": epoch_to_num(self._times[rows]).tolist()}
+        for name in self._names:
+            if name in self._columns:
+                chunk[name] = np.asarray(self._columns[name][rows], dtype=np.float64).tolist()
+            else:
+                chunk[name] = [float("nan")] * (self._chunk_end - self._chunk_start)
+        self._chunk = chunk
+
+
+def frame_columns(df):
+    """Columns of a bars DataFrame (datetime, open, high, low, close, volume) as arrays, without copies."""
+    return {name: df[name].to_numpy() for name in df.columns if name in ("datetime",) + LINES}
@@ -0,0 +1,279 @@
+import argparse
+import itertools
+import queue
+import threading
+import time
+
+import coverage_index
+from test_connection import PACING_CODES, TERMINAL_CODES, HistoricalDataApp, make_contract, run_loop
+
+# IB pacing for historical data: no more than 60 requests in 10 minutes and
+# no more than 6 in 2 seconds. A bucket of 6 refilled at 54 per 10 minutes
+# never exceeds either.
+RATE = 54 / 600
+BURST = 6
+MAX_IN_FLIGHT = 10
+RETRIES = 5
+RETRY_DELAY = 15.0
+REQUEST_TIMEOUT = 600.0
+
+# errorCode 162 is used both for pacing violations and for "no data";
+# error() codes outside TERMINAL_CODES are notices, the request goes on
+_NO_DATA = "HMDS query returned no data"
+# How often run() checks for timed out requests while it waits
+_POLL_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Blocking rate limiter: acquire() takes one token, tokens refill at rate per second."""
+
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BackfillRequest:
+    """One reqHistoricalData call and its outcome."""
+
+    def __init__(self, symbol, end="", duration="20 W", bar_size="1 min", use_rth=0, window=None):
+        self.symbol = symbol
+        self.end = end
+        self.duration = duration
+        self.bar_size = bar_size
+        self.use_rth = use_rth
+        self.window = window  # (first, last) sessions from coverage_index.plan_windows, if planned
+        self.status = "pending"  # pending, active, done, failed
+        self.attempts = 0
+        self.bars = 0
+        self.error = None
+        self.submitted = None
+
+    def __repr__(self):
+        return (f"BackfillRequest({self.symbol!r}, end={self.end!r}, duration={self.duration!r}, "
+                f"status={self.status!r}, bars={self.bars}, attempts={self.attempts})")
+
+
+class BackfillApp(HistoricalDataApp):
+    """HistoricalDataApp that reports request completion to a BackfillScheduler."""
+
+    def __init__(self, scheduler):
+        super().__init__(symbol=None)
+        self.scheduler = scheduler
+
+    def historicalData(self, reqId, bar):
+        # bars still arriving for a request that timed out, failed or was
+        # cancelled have no symbol any more
+        if reqId not in self.requests:
+            return
+        super().historicalData(reqId, bar)
+        self.scheduler.bar_received(reqId)
+
+    def historicalDataEnd(self, reqId, start, end):
+        self.scheduler.finished(reqId)
+
+    def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=""):
+        if not self.scheduler.failed(reqId, errorCode, errorString):
+            super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
+
+
+class BackfillScheduler:
+    """Runs many historical data requests over one TWS connection.
+
+    Up to max_in_flight requests are outstanding at once, new ones are paced by
+    a TokenBucket. Pacing errors and timeouts put the request back after
+    retry_delay * attempt seconds, up to retries attempts. Completion is
+    signalled with events, run() returns once every request is done or failed.
+    """
+
+    def __init__(self, requests, host="127.0.0.1", port=7497, client_id=0,
+                 max_in_flight=MAX_IN_FLIGHT, bucket=None, retries=RETRIES,
+                 retry_delay=RETRY_DELAY, request_timeout=REQUEST_TIMEOUT):
+        self.requests = list(requests)
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.bucket = bucket or TokenBucket()
+        self.slots = threading.Semaphore(max_in_flight)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.request_timeout = request_timeout
+
+        self.app = BackfillApp(self)
+        self.pending = queue.Queue()
+        self.active = {}  # reqId -> BackfillRequest
+        self.lock = threading.Lock()
+        self.remaining = len(self.requests)
+        self.all_done = threading.Event()
+        self.req_ids = itertools.count(1)
+
+    def run(self, connect_timeout=10.0):
+        if not self.requests:
+            return self.requests
+        self.app.connect(self.host, self.port, clientId=self.client_id)
+        api_thread = threading.Thread(target=run_loop, args=(self.app,), daemon=True)
+        api_thread.start()
+        if not self.app.connected.wait(connect_timeout):
+            self.app.disconnect()
+            raise ConnectionError(f"TWS at {self.host}:{self.port} did not answer")
+
+        try:
+            for request in self.requests:
+                self.pending.put(request)
+            while not self.all_done.is_set():
+                try:
+                    request = self.pending.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    self._expire()
+                    continue
+                if request is None:
+                    break
+                self._submit(request)
+        finally:
+            self.app.writer.close()
+            self.app.disconnect()
+        return self.requests
+
+    def _submit(self, request):
+        # with every slot taken by a request TWS never answers, only the
+        # timeout frees one
+        while not self.slots.acquire(timeout=_POLL_INTERVAL):
+            self._expire()
+        self.bucket.acquire()
+        req_id = next(self.req_ids)
+        with self.lock:
+            request.status = "active"
+            request.attempts += 1
+            request.submitted = time.monotonic()
+            self.active[req_id] = request
+            self.app.requests[req_id] = request.symbol
+        self.app.reqHistoricalData(
+            reqId=req_id,
+            contract=make_contract(request.symbol),
+            endDateTime=request.end,
+            durationStr=request.duration,
+            barSizeSetting=request.bar_size,
+            whatToShow="TRADES",
+            useRTH=request.use_rth,
+            formatDate=1,
+            keepUpToDate=False,
+            chartOptions=[]
+        )
+
+    def _release(self, req_id):
+        with self.lock:
+            request = self.active.pop(req_id, None)
+            self.app.requests.pop(req_id, None)
+        if request is not None:
+            self.slots.release()
+        return request
+
+    def _complete(self, request, status, error=None):
+        request.status = status
+        request.error = error
+        print(f"{request.symbol} {request.end or 'now'} {request.duration}: {status}, {request.bars} bars"
+              + (f" ({error})" if error else ""))
+        with self.lock:
+            self.remaining -= 1
+            last = self.remaining == 0
+        if last:
+            self.all_done.set()
+            self.pending.put(None)
+
+    def _retry(self, request, error):
+        if request.attempts >= self.retries:
+            self._complete(request, "failed", error)
+            return
+        request.status = "pending"
+        timer = threading.Timer(self.retry_delay * request.attempts, self.pending.put, args=(request,))
+        timer.daemon = True
+        timer.start()
+
+    def _expire(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [req_id for req_id, request in self.active.items()
+                       if now - request.submitted > self.request_timeout]
+        for req_id in expired:
+            self.app.cancelHistoricalData(req_id)
+            request = self._release(req_id)
+            if request is not None:
+                self._retry(request, "timeout")
+
+    def bar_received(self, req_id):
+        request = self.active.get(req_id)
+        if request is not None:
+            request.bars += 1
+
+    def finished(self, req_id):
+        request = self._release(req_id)
+        if request is not None:
+            self._complete(request, "done")
+
+    def record_covered(self):
+        """Record the windows of done requests (bars or "no data") in coverage_index.
+
+        Only after run() and only if every bar was written, so a failed batch
+        is requested again on the next run.
+        """
+        if self.app.writer.rows_failed:
+            return 0
+        done = [request for request in self.requests if request.status == "done" and request.window]
+        for request in done:
+            coverage_index.record_requested(request.symbol, *request.window)
+        return len(done)
+
+    def failed(self, req_id, code, message):
+        """Handle an error() callback, returns False unless it ends one of the requests."""
+        if code not in TERMINAL_CODES:
+            return False
+        request = self._release(req_id)
+        if request is None:
+            return False
+        if code == 162 and _NO_DATA in message:
+            self._complete(request, "done")
+        elif code in PACING_CODES:
+            self._retry(request, f"{code}: {message}")
+        else:
+            self._complete(request, "failed", f"{code}: {message}")
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill historical_data for many symbols from TWS")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--full", action="store_true",
+                        help="request the whole --duration instead of only the sessions missing in historical_data")
+    parser.add_argument("--duration", default="20 W")
+    parser.add_argument("--port", type=int, default=7497)
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    args = parser.parse_args()
+
+    if args.full:
+        backfill = [BackfillRequest(symbol, duration=args.duration) for symbol in args.symbols]
+    else:
+        backfill = [BackfillRequest(symbol, *coverage_index.window_request(first, last), window=(first, last))
+                    for symbol in args.symbols for first, last in coverage_index.plan_windows(symbol)]
+    print(f"{len(backfill)} requests for {len(args.symbols)} symbols.")
+
+    scheduler = BackfillScheduler(backfill, port=args.port, max_in_flight=args.max_in_flight)
+    done = scheduler.run()
+    scheduler.record_covered()
+    failed = [request for request in done if request.status == "failed"]
+    print(f"Done: {len(done) - len(failed)} requests, failed: {len(failed)}.")
+    for request in failed:
+        print(f"  {request}")
@@ -0,0 +1,192 @@
+import numpy as np
+
+import profiling
+
+# Bars scanned at once when looking for an exit, doubled on every miss so
+# long trades cost O(length) and short ones don't touch the rest of the series
+_SCAN_CHUNK = 256
+
+
+def crossover_signals(sma, wma, start=2):
+    """Boolean arrays of SMA/WMA crosses: up (entry) and down (exit).
+
+    A cross on bar i compares bar i with bar i - 1, bars before `start`
+    never signal (iterative_backtest starts its loop at 2).
+    NaN never crosses, the same as the comparisons in the loop.
+    """
+    sma = np.asarray(sma, dtype=np.float64)
+    wma = np.asarray(wma, dtype=np.float64)
+    n = len(sma)
+    cross_up = np.zeros(n, dtype=bool)
+    cross_down = np.zeros(n, dtype=bool)
+    if n > 1:
+        cross_up[1:] = (sma[:-1] < wma[:-1]) & (sma[1:] > wma[1:])
+        cross_down[1:] = (sma[:-1] > wma[:-1]) & (sma[1:] < wma[1:])
+    cross_up[:start] = False
+    cross_down[:start] = False
+    return cross_up, cross_down
+
+
+def _first_exit(close, cross_down, start, stop_price, flat=None):
+    # Exit on the first bar where exactly one of cross/stop fires:
+    # when both fire on the same bar the position is kept.
+    # Bars where flat is set are skipped, like MyStrategy does.
+    n = len(close)
+    lo = start
+    size = _SCAN_CHUNK
+    while lo < n:
+        hi = min(lo + size, n)
+        hit = (close[lo:hi] < stop_price) != cross_down[lo:hi]
+        if flat is not None:
+            hit &= ~flat[lo:hi]
+        hit = np.flatnonzero(hit)
+        if hit.size:
+            return lo + int(hit[0])
+        lo = hi
+        size *= 2
+    return -1
+
+
+@profiling.profiled("backtest")
+def crossover_backtest(close, sma, wma, stop_loss=0.99, times=None, start=2):
+    """Array version of iterative_backtest.
+
+    Enters at the close of a bar where SMA crosses WMA upwards, exits at the
+    close when it crosses back down, or at entry * stop_loss when the close
+    falls below that price. The bar loop only runs between events, all bar
+    conditions are evaluated vectorized.
+
+    Returns (entry_signal, exit_signal, entry_price, trades): two bool arrays,
+    a float array with the entry price on entry bars (NaN elsewhere) and a list
+    of trade dicts in the iterative_backtest format. `times` (optional) fills
+    entry_time/exit_time. The last trade has no exit_* keys if still open.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    profiling.count("bars_backtested", n)
+    cross_up, cross_down = crossover_signals(sma, wma, start)
+    up_idx = np.flatnonzero(cross_up)
+
+    entry_signal = np.zeros(n, dtype=bool)
+    exit_signal = np.zeros(n, dtype=bool)
+    entry_price = np.full(n, np.nan)
+    trades = []
+
+    k = 0
+    while k < len(up_idx):
+        i = int(up_idx[k])
+        price = close[i]
+        entry_signal[i] = True
+        entry_price[i] = price
+        trade = {"entry_index": i}
+        if times is not None:
+            trade["entry_time"] = times[i]
+        trade["entry_price"] = price
+        trades.append(trade)
+
+        stop_price = price * stop_loss
+        j = _first_exit(close, cross_down, i + 1, stop_price)
+        if j < 0:
+            break
+
+        exit_signal[j] = True
+        trade["exit_index"] = j
+        if times is not None:
+            trade["exit_time"] = times[j]
+        trade["exit_price"] = close[j] if cross_down[j] else stop_price
+
+        k = int(np.searchsorted(up_idx, j + 1))
+
+    return entry_signal, exit_signal, entry_price, trades
+
+
+@profiling.profiled("backtest")
+def limit_order_backtest(bars, signals, cash=7000, stop_loss=0.99, limit_valid_bars=3, start=0):
+    """Array version of MyStrategy/FastStrategy with backtrader's broker.
+
+    bars are column arrays (open, low, close, optionally datetime), signals
+    the strategy_signals() of them. Replays what cerebro does with
+    AllInSizer and the default broker, without commission:
+
+    - on an entry bar e (from `start`, the first bar next() sees) while flat
+      and without a pending order, a limit buy at close[e] of
+      int(cash / close[e]) shares; no shares or no cash for them
+      (the broker's Margin) means no order
+    - it fills on the first of the bars e+1 .. e+limit_valid_bars+1 whose
+      low reaches the limit, at the open if that is below the limit, else at
+      the limit; unfilled it is cancelled on the last one and entries are
+      looked for again from the next bar
+    - from the fill bar on, the position is closed at the next bar's open
+      after the first non-flat bar where exactly one of the exit signal and
+      close < limit * stop_loss is true (the stop is relative to the limit,
+      not to the fill price); an entry can be taken on that next bar again
+
+    Returns (trades, cash, value): trade dicts like crossover_backtest's
+    with size and pnl (TradeList's pnlcomm) added, the broker cash and
+    value after the last bar. The last trade has no exit_* keys if open.
+    """
+    open_ = np.asarray(bars["open"], dtype=np.float64)
+    low = np.asarray(bars["low"], dtype=np.float64)
+    close = np.asarray(bars["close"], dtype=np.float64)
+    times = bars.get("datetime")
+    entry = np.asarray(signals["entry"], dtype=bool)
+    exit_ = np.asarray(signals["exit"], dtype=bool)
+    flat = np.asarray(signals["flat"], dtype=bool)
+    n = len(close)
+    profiling.count("bars_backtested", n)
+    entry_idx = np.flatnonzero(entry)
+
+    cash = float(cash)
+    trades = []
+    position = None
+    i = start
+    while True:
+        k = int(np.searchsorted(entry_idx, i))
+        if k == len(entry_idx):
+            break
+        e = int(entry_idx[k])
+        limit = close[e]
+        size = int(cash / limit)
+        # the broker checks the cash at the limit price when it accepts the order
+        if size <= 0 or cash - size * limit < 0.0:
+            i = e + 1
+            continue
+
+        last = e + limit_valid_bars + 1
+        hit = np.flatnonzero(low[e + 1:last + 1] <= limit)
+        if not hit.size:
+            # cancelled on bar `last`, which next() then leaves alone
+            i = last + 1
+            continue
+        f = e + 1 + int(hit[0])
+        price = open_[f] if open_[f] <= limit else limit
+        cash -= size * price
+        trade = {"entry_index": f}
+        if times is not None:
+            trade["entry_time"] = times[f]
+        trade["entry_price"] = price
+        trade["size"] = size
+        trades.append(trade)
+
+        x = _first_exit(close, exit_, f, limit * stop_loss, flat)
+        if x < 0 or x + 1 >= n:
+            position = trade
+            break
+        # market close at the next open
+        exit_price = open_[x + 1]
+        cash += size * price + size * (exit_price - price)
+        trade["exit_index"] = x + 1
+        if times is not None:
+            trade["exit_time"] = times[x + 1]
+        trade["exit_price"] = exit_price
+        # the Trade's own price is the average (size * price) / size, which
+        # can be one ulp off the fill price the broker's cash uses
+        trade["pnl"] = size * (exit_price - size * price / size)
+        i = x + 1
+
+    value = cash
+    if position is not None:
+        # the broker's value of an open long: unlevered value plus the unrealized pnl
+        unrealized = position["size"] * (close[-1] - position["entry_price"])
+        value = cash + ((position["size"] * close[-1] - unrealized) / 1.0 + unrealized)
+    return trades, float(cash), float(value)
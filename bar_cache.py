@@ -0,0 +1,279 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import db
+import profiling
+from bars import COLUMNS, SELECT, fill_columns, stream_columns, to_frame
+
+CACHE_DIR = os.environ.get("BAR_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bar_cache"))
+
+# Per-day row count and checksum, computed by the server. Comparing them with
+# the ones saved at the last sync finds days rewritten by ON DUPLICATE KEY UPDATE
+# without transferring the rows.
+_DAY_DIGESTS = """
+SELECT DATE(datetime) AS day, COUNT(*),
+       BIT_XOR(CRC32(CONCAT_WS('|', datetime, open, high, low, close, volume)))
+FROM historical_data WHERE symbol = ?{where}
+GROUP BY day
+"""
+
+# A warm sync compares the digests of the last VERIFY_DAYS days only, rows
+# are rewritten around the top-up boundary. The whole history is compared
+# with sync(verify_days=None), and anyway once per FULL_VERIFY_INTERVAL seconds.
+VERIFY_DAYS = 10
+FULL_VERIFY_INTERVAL = 7 * 86400
+
+# How many versions of changed_from are kept in the metadata, derived caches
+# older than that are rebuilt instead of extended
+CHANGE_HISTORY = 100
+
+
+def _symbol_dir(symbol, cache_dir):
+    return os.path.join(cache_dir, symbol)
+
+
+def _query(conn, sql, params, total=None):
+    cursor = conn.cursor(buffered=False)
+    bars = fill_columns(stream_columns(cursor, sql, params), total)
+    cursor.close()
+    return bars
+
+
+def _concat(parts):
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+def _take(bars, index):
+    return {name: bars[name][index] for name in COLUMNS}
+
+
+def read_cache(symbol, cache_dir=CACHE_DIR):
+    """Cached bars as memory-mapped arrays and the cache metadata, or (None, None)."""
+    path = _symbol_dir(symbol, cache_dir)
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    bars = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+    return bars, meta
+
+
+def write_meta(symbol, meta, cache_dir=CACHE_DIR):
+    """Replace only the metadata of the cache of symbol."""
+    meta_path = os.path.join(_symbol_dir(symbol, cache_dir), "meta.json")
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def write_cache(symbol, bars, meta, cache_dir=CACHE_DIR):
+    """Replace the cache of symbol, the old one stays intact until the new one is complete."""
+    path = _symbol_dir(symbol, cache_dir)
+    tmp_path = path + ".tmp"
+    old_path = path + ".old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in COLUMNS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(bars[name]))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _day_digests(cursor, symbol, since=None, until=None):
+    where, params = "", [symbol]
+    if since is not None:
+        where += " AND datetime >= ?"
+        params.append(from_epoch(since))
+    if until is not None:
+        where += " AND datetime <= ?"
+        params.append(from_epoch(until))
+    cursor.execute(_DAY_DIGESTS.format(where=where), params)
+    return {str(day): [int(count), int(checksum)] for day, count, checksum in cursor.fetchall()}
+
+
+def from_epoch(seconds):
+    return datetime(1970, 1, 1) + timedelta(seconds=int(seconds))
+
+
+def _day_epoch(day):
+    return int((datetime.fromisoformat(day) - datetime(1970, 1, 1)).total_seconds())
+
+
+def sync(symbol, verify=True, cache_dir=CACHE_DIR, verify_days=VERIFY_DAYS):
+    """Bring the cache of symbol up to date with historical_data.
+
+    A cold start loads everything with one query. Afterwards only rows newer
+    than the last cached datetime are fetched; with verify=True the per-day
+    digests of the last verify_days days (all of them with verify_days=None
+    or when the last full check is older than FULL_VERIFY_INTERVAL) are
+    compared with the saved ones as well and rewritten days are fetched again.
+    A cache without saved digests (synced with verify=False) only records them.
+    Digests are always taken before the rows they describe, so a write racing
+    with the sync shows up as a mismatch on the next one.
+    Returns the number of rows fetched.
+    """
+    cached, meta = read_cache(symbol, cache_dir)
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        now = int(time.time())
+        verified_at = (meta or {}).get("verified_at")
+
+        if cached is None or not meta["rows"]:
+            days = _day_digests(cursor, symbol) if verify else None
+            verified_at = now if verify else None
+            # the digests give the row count, so the arrays can be preallocated
+            total = sum(count for count, _ in days.values()) if days is not None else None
+            bars = _query(conn, f"{SELECT} WHERE symbol = ? ORDER BY datetime", (symbol,), total)
+            fetched = len(bars["datetime"])
+            changed_from = 0
+            version = (meta or {}).get("version", 0) + 1
+        else:
+            cached = {name: np.asarray(cached[name]) for name in COLUMNS}
+            times = cached["datetime"]
+            last = int(times[-1])
+            last_day = last - last % 86400
+            parts = [cached]
+            fetched = 0
+            changed_from = meta["rows"]
+            days = None
+
+            if verify:
+                saved = meta.get("days")
+                full = (verify_days is None or saved is None
+                        or now - (verified_at or 0) >= FULL_VERIFY_INTERVAL)
+                since = None if full else last_day - verify_days * 86400
+                current = _day_digests(cursor, symbol, since=since, until=last)
+                if saved is None:
+                    # nothing to compare with, the digests become the reference
+                    saved = current
+                older = {day: digest for day, digest in saved.items() if since is not None and _day_epoch(day) < since}
+                checked = {day: digest for day, digest in saved.items() if day not in older}
+                stale = sorted(day for day in set(current) | set(checked) if current.get(day) != checked.get(day))
+                days = {**older, **current, **_day_digests(cursor, symbol, since=last_day)}
+                if full:
+                    verified_at = now
+                if stale:
+                    # Drop cached rows of rewritten days and fetch them again
+                    keep = np.ones(len(times), dtype=bool)
+                    for day in stale:
+                        start = _day_epoch(day)
+                        lo, hi = np.searchsorted(times, [start, start + 86400])
+                        keep[lo:hi] = False
+                        changed_from = min(changed_from, int(lo))
+                        parts.append(_query(conn,
+                                            f"{SELECT} WHERE symbol = ? AND datetime >= ? AND datetime < ? "
+                                            f"AND datetime <= ? ORDER BY datetime",
+                                            (symbol, from_epoch(start), from_epoch(start + 86400),
+                                             from_epoch(last))))
+                        fetched += len(parts[-1]["datetime"])
+                    parts[0] = _take(cached, keep)
+
+            new = _query(conn, f"{SELECT} WHERE symbol = ? AND datetime > ? ORDER BY datetime",
+                         (symbol, from_epoch(last)))
+            fetched += len(new["datetime"])
+            parts.append(new)
+
+            if fetched == 0 and len(parts) == 2:
+                if verify and (days != meta.get("days") or verified_at != meta.get("verified_at")):
+                    write_meta(symbol, {**meta, "days": days, "verified_at": verified_at}, cache_dir)
+                return 0
+
+            bars = _concat(parts)
+            if len(parts) > 2:
+                bars = _take(bars, np.argsort(bars["datetime"], kind="stable"))
+            version = meta["version"] + 1
+            if days is None:
+                days = meta.get("days")
+
+        cursor.close()
+    finally:
+        conn.close()
+
+    rows = len(bars["datetime"])
+    changed_from = min(changed_from, rows)
+    changes = {**((meta or {}).get("changes") or {}), str(version): changed_from}
+    changes = dict(sorted(changes.items(), key=lambda item: int(item[0]))[-CHANGE_HISTORY:])
+    write_cache(symbol, bars, {
+        "symbol": symbol,
+        "rows": rows,
+        "last_datetime": int(bars["datetime"][-1]) if rows else None,
+        "version": version,
+        # first row that differs from the previous version, == previous rows for a pure append
+        "changed_from": changed_from,
+        # changed_from of the recent versions, {version: changed_from}
+        "changes": changes,
+        "days": days,
+        # time.time() of the last comparison of every day's digest
+        "verified_at": verified_at,
+    }, cache_dir)
+    return fetched
+
+
+def unchanged_rows(meta, times, version, rows, last_datetime):
+    """Number of leading rows of the cached bars that are the same as in an older version.
+
+    meta is the current cache metadata and times its datetime column; the
+    older version had `rows` rows, the last one at last_datetime. Caches
+    derived from the bars keep these rows and recompute the rest.
+    """
+    valid = rows
+    if version != meta["version"]:
+        changes = meta.get("changes") or {}
+        newer = range(version + 1, meta["version"] + 1)
+        if not newer or any(str(v) not in changes for v in newer):
+            return 0
+        valid = min([valid] + [changes[str(v)] for v in newer])
+    valid = min(valid, len(times))
+    # a rebuilt bar cache restarts its version count, the last row catches that
+    if rows <= len(times) and rows and int(times[rows - 1]) != last_datetime:
+        return 0
+    return valid
+
+
+def load_bars(symbol, sync_first=True, verify=True, cache_dir=CACHE_DIR, start=None, end=None, timeframe="1m"):
+    """Bars of symbol as a dict of memory-mapped column arrays, synced with the DB first.
+
+    start/end (datetime-like, end exclusive) select a range by binary search,
+    only that slice of the files is ever read. timeframe is one of
+    rollups.TIMEFRAMES, other than "1m" the pre-aggregated bars are read
+    after bringing them up to date with the minute bars.
+    """
+    if sync_first:
+        with profiling.stage("sync"):
+            sync(symbol, verify=verify, cache_dir=cache_dir)
+    with profiling.stage("read_cache"):
+        if timeframe == "1m":
+            bars, _ = read_cache(symbol, cache_dir)
+        else:
+            import rollups
+            rollups.sync_rollups(symbol, (timeframe,), cache_dir)
+            bars = rollups.read_rollup(symbol, timeframe, cache_dir)
+    if start is None and end is None:
+        return bars
+    times = bars["datetime"]
+    lo = np.searchsorted(times, _to_seconds(start)) if start is not None else 0
+    hi = np.searchsorted(times, _to_seconds(end)) if end is not None else len(times)
+    return {name: values[lo:hi] for name, values in bars.items()}
+
+
+def _to_seconds(value):
+    return pd.Timestamp(value).to_datetime64().astype("datetime64[s]").astype(np.int64)
+
+
+def load_frame(symbol, sync_first=True, verify=True, cache_dir=CACHE_DIR, start=None, end=None, timeframe="1m"):
+    """Bars of symbol as a DataFrame (datetime, open, high, low, close, volume)."""
+    return to_frame(load_bars(symbol, sync_first, verify, cache_dir, start, end, timeframe))
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+import db
+import profiling
+
+# datetime is stored as int64 seconds since the epoch of the naive
+# (exchange local) timestamps, the same values historical_data holds
+COLUMNS = {
+    "datetime": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64,
+}
+PRICE_COLUMNS = ("open", "high", "low", "close")
+
+CHUNK_SIZE = 100_000
+
+SELECT = "SELECT datetime, open, high, low, close, volume FROM historical_data"
+
+
+def to_epoch(values):
+    """datetime values from the DB (datetime objects or '%Y%m%d %H:%M:%S' strings) to int64 seconds."""
+    if len(values) and isinstance(values[0], str):
+        with profiling.stage("to_datetime"):
+            values = pd.to_datetime(pd.Series(values), format="%Y%m%d %H:%M:%S").to_numpy()
+    return np.asarray(values, dtype="datetime64[s]").astype(np.int64)
+
+
+def empty_columns(size=0, price_dtype=np.float64):
+    return {name: np.empty(size, dtype=price_dtype if name in PRICE_COLUMNS else dtype)
+            for name, dtype in COLUMNS.items()}
+
+
+def rows_to_columns(rows, price_dtype=np.float64):
+    """Rows of (datetime, open, high, low, close, volume) to a dict of typed arrays."""
+    if not rows:
+        return empty_columns(price_dtype=price_dtype)
+    columns = list(zip(*rows))
+    bars = {"datetime": to_epoch(columns[0])}
+    for name, values in zip(list(COLUMNS)[1:], columns[1:]):
+        dtype = price_dtype if name in PRICE_COLUMNS else COLUMNS[name]
+        bars[name] = np.asarray(values, dtype=np.float64).astype(dtype)
+    return bars
+
+
+def stream_columns(cursor, sql, params=(), chunk_size=CHUNK_SIZE, price_dtype=np.float64):
+    """Execute sql and yield its rows as dicts of typed arrays, chunk_size rows at a time.
+
+    With an unbuffered cursor only one chunk of Python row objects exists at a time.
+    """
+    with profiling.stage("db_query"):
+        cursor.execute(sql, params)
+    while True:
+        with profiling.stage("db_fetch"):
+            rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        profiling.count("rows_fetched", len(rows))
+        with profiling.stage("convert"):
+            columns = rows_to_columns(rows, price_dtype)
+        yield columns
+
+
+def fill_columns(chunks, total=None, price_dtype=np.float64):
+    """Collect chunks into one dict of arrays.
+
+    With total known the arrays are preallocated and filled in place, so the
+    peak is the final size plus one chunk (rows beyond total are appended at
+    the end). Without it chunks are concatenated at the end.
+    """
+    if total is None:
+        parts = list(chunks)
+        if not parts:
+            return empty_columns(price_dtype=price_dtype)
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+    bars = empty_columns(total, price_dtype)
+    filled = 0
+    overflow = []
+    for chunk in chunks:
+        size = min(len(chunk["datetime"]), total - filled)
+        for name in COLUMNS:
+            bars[name][filled:filled + size] = chunk[name][:size]
+        filled += size
+        if size < len(chunk["datetime"]):
+            # rows inserted after total was counted
+            overflow.append({name: values[size:] for name, values in chunk.items()})
+    if overflow:
+        return {name: np.concatenate([bars[name]] + [part[name] for part in overflow]) for name in COLUMNS}
+    if filled < total:
+        bars = {name: values[:filled] for name, values in bars.items()}
+    return bars
+
+
+def iter_bars(symbol, chunk_size=CHUNK_SIZE, price_dtype=np.float64):
+    """Stream all bars of symbol from historical_data as chunks of typed arrays.
+
+    Lets downstream stages process the history without ever holding all of it.
+    """
+    conn = db.connect()
+    try:
+        cursor = conn.cursor(buffered=False)
+        yield from stream_columns(cursor, f"{SELECT} WHERE symbol = ? ORDER BY datetime", (symbol,),
+                                  chunk_size, price_dtype)
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def load_bars(symbol, chunk_size=CHUNK_SIZE, price_dtype=np.float64):
+    """All bars of symbol as preallocated typed arrays, streamed in chunks."""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM historical_data WHERE symbol = ?", (symbol,))
+        total = cursor.fetchone()[0]
+        cursor.close()
+
+        cursor = conn.cursor(buffered=False)
+        bars = fill_columns(stream_columns(cursor, f"{SELECT} WHERE symbol = ? ORDER BY datetime", (symbol,),
+                                           chunk_size, price_dtype), total, price_dtype)
+        cursor.close()
+        return bars
+    finally:
+        conn.close()
+
+
+def _range_query(symbols, start, end, with_symbol):
+    """Parameterized SELECT over symbols and [start, end), served by the (symbol, datetime) key."""
+    columns = "symbol, datetime, open, high, low, close, volume" if with_symbol else \
+        "datetime, open, high, low, close, volume"
+    sql = f"SELECT {columns} FROM historical_data WHERE symbol IN ({', '.join('?' * len(symbols))})"
+    params = list(symbols)
+    if start is not None:
+        sql += " AND datetime >= ?"
+        params.append(pd.Timestamp(start).to_pydatetime())
+    if end is not None:
+        sql += " AND datetime < ?"
+        params.append(pd.Timestamp(end).to_pydatetime())
+    return sql + " ORDER BY symbol, datetime", params
+
+
+def query_bars(symbol, start=None, end=None, chunk_size=CHUNK_SIZE, price_dtype=np.float64):
+    """Bars of one symbol with start <= datetime < end (either may be None) as typed arrays.
+
+    The cost depends on the size of the range, not on the history in the table.
+    """
+    sql, params = _range_query([symbol], start, end, with_symbol=False)
+    conn = db.connect()
+    try:
+        cursor = conn.cursor(buffered=False)
+        bars = fill_columns(stream_columns(cursor, sql, params, chunk_size, price_dtype), price_dtype=price_dtype)
+        cursor.close()
+        return bars
+    finally:
+        conn.close()
+
+
+def query_aligned(symbols, start=None, end=None, fields=PRICE_COLUMNS + ("volume",)):
+    """Bars of several symbols in one round trip, aligned on a common datetime index.
+
+    Returns a DataFrame indexed by datetime with (field, symbol) columns; a
+    symbol without a bar at some minute has NaN there.
+    """
+    sql, params = _range_query(list(symbols), start, end, with_symbol=True)
+    conn = db.connect()
+    try:
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(sql, params)
+        parts = []
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            part = rows_to_columns([row[1:] for row in rows])
+            part["symbol"] = np.array([row[0] for row in rows], dtype=object)
+            parts.append(part)
+        cursor.close()
+    finally:
+        conn.close()
+
+    if parts:
+        long = pd.DataFrame({name: np.concatenate([part[name] for part in parts])
+                             for name in ("symbol",) + tuple(COLUMNS)})
+    else:
+        long = pd.DataFrame(empty_columns()).assign(symbol=pd.Series(dtype=object))
+    long["datetime"] = (long["datetime"].to_numpy() * 1_000_000_000).astype("datetime64[ns]")
+    wide = long.pivot(index="datetime", columns="symbol", values=list(fields))
+    return wide.reindex(columns=pd.MultiIndex.from_product([list(fields), list(symbols)]))
+
+
+@profiling.profiled("to_frame")
+def to_frame(bars):
+    """Column arrays to the DataFrame layout the scripts use (datetime, open, high, low, close, volume)."""
+    frame = {"datetime": (np.asarray(bars["datetime"]) * 1_000_000_000).astype("datetime64[ns]")}
+    for name in list(COLUMNS)[1:]:
+        frame[name] = np.asarray(bars[name])
+    return pd.DataFrame(frame)
@@ -0,0 +1,553 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from queue import Empty
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+import array_feed
+import bar_cache
+import bars
+import db
+import ingest
+import rollups
+from backtest import limit_order_backtest
+from stats import compound, trade_stats
+from synthetic import minute_bars
+from test_backtrader import build_cerebro, strategy_signals, summarize
+from test_strategy import calculate_moving_averages, iterative_backtest, iterative_backtest_iloc
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_backtest(n, reference_bars):
+    """Speed of iterative_backtest (arrays) vs iterative_backtest_iloc, their parity is tests/test_backtest.py."""
+    df = calculate_moving_averages(minute_bars(n)).dropna().reset_index(drop=True)
+
+    fast_trades = []
+    fast_df, fast_time = timed(iterative_backtest, df.copy(), fast_trades)
+
+    ref_df = df.iloc[:reference_bars].reset_index(drop=True)
+    ref_df, ref_time = timed(iterative_backtest_iloc, ref_df, [])
+
+    ref_per_bar = ref_time / max(len(ref_df), 1)
+    print(f"bars: {len(df)}, trades: {len(fast_trades)}")
+    print(f"iterative_backtest:      {fast_time:.3f}s")
+    print(f"iterative_backtest_iloc: {ref_time:.3f}s on {len(ref_df)} bars, "
+          f"~{ref_per_bar * len(df):.1f}s extrapolated")
+    print(f"speedup: ~{ref_per_bar * len(df) / fast_time:.0f}x")
+
+
+def _child_result(process, queue, poll=1.0):
+    """What a measuring child process puts on queue, None if it dies without (its traceback is on stderr)."""
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Empty:
+            if process.exitcode is not None:
+                # the result may still be in the pipe when the exit is noticed
+                try:
+                    return queue.get(timeout=poll)
+                except Empty:
+                    return None
+
+
+def _rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def _load_read_sql(symbol):
+    conn = db.connect()
+    df = pd.read_sql(f"{bars.SELECT} WHERE symbol = '{symbol}' ORDER BY datetime", conn)
+    conn.close()
+    df["datetime"] = pd.to_datetime(df["datetime"], format="%Y%m%d %H:%M:%S")
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _load_stream(symbol, price_dtype):
+    loaded = bars.load_bars(symbol, price_dtype=price_dtype)
+    return sum(values.nbytes for values in loaded.values())
+
+
+LOAD_MODES = {
+    "read_sql": _load_read_sql,
+    "stream64": lambda symbol: _load_stream(symbol, np.float64),
+    "stream32": lambda symbol: _load_stream(symbol, np.float32),
+}
+
+
+def _measure_load(mode, symbol, queue):
+    baseline = _rss_kb()
+    size, seconds = timed(LOAD_MODES[mode], symbol)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((seconds, peak - baseline, size // 1024))
+
+
+def bench_load(symbol):
+    """Time and peak RSS of loading one symbol: pd.read_sql vs the streaming loader.
+
+    Every mode runs in a fresh process, so the peaks don't mask each other.
+    """
+    context = mp.get_context("spawn")
+    print(f"{'mode':<10} {'seconds':>8} {'peak RSS, MB':>13} {'final, MB':>10} {'peak/final':>11}")
+    for mode in LOAD_MODES:
+        queue = context.Queue()
+        process = context.Process(target=_measure_load, args=(mode, symbol, queue))
+        process.start()
+        result = _child_result(process, queue)
+        process.join()
+        if result is None:
+            print(f"{mode:<10} failed, exit code {process.exitcode}")
+            continue
+        seconds, peak_kb, final_kb = result
+        print(f"{mode:<10} {seconds:>8.2f} {peak_kb / 1024:>13.1f} {final_kb / 1024:>10.1f} "
+              f"{peak_kb / max(final_kb, 1):>11.2f}")
+
+
+# mode -> (data given to the feed, cerebro.run() arguments)
+FEED_MODES = {
+    "pandas": ("frame", "pandas", {}),
+    "array": ("arrays", "array", {}),
+    "pandas-exactbars": ("frame", "pandas", {"exactbars": 1}),
+    "memmap-exactbars": ("path", "array", {"exactbars": 1}),
+}
+
+
+def _measure_feed(mode, path, queue):
+    data, feed, run_kwargs = FEED_MODES[mode]
+    baseline = _rss_kb()
+    columns = array_feed.open_columns(path)
+    if data == "frame":
+        data = bars.to_frame(columns)
+    elif data == "arrays":
+        data = {name: np.array(values) for name, values in columns.items()}
+    else:
+        data = path
+    cerebro = build_cerebro(data, stdstats=False, feed=feed)
+    results, seconds = timed(cerebro.run, **run_kwargs)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((seconds, peak - baseline, summarize(cerebro, results)["final_deposit"]))
+
+
+def bench_feed(n):
+    """cerebro.run() with PandasData vs ArrayData on the same synthetic bars.
+
+    Every mode runs in a fresh process, peak RSS includes the bars in the
+    form the feed gets them. A mode whose process dies is reported as failed.
+    That the feeds trade the same is checked in tests/test_feeds.py.
+    """
+    df = minute_bars(n)
+    with tempfile.TemporaryDirectory() as path:
+        np.save(os.path.join(path, "datetime.npy"),
+                df["datetime"].to_numpy(dtype="datetime64[s]").astype(np.int64))
+        for column in ("open", "high", "low", "close", "volume"):
+            np.save(os.path.join(path, f"{column}.npy"), df[column].to_numpy())
+
+        context = mp.get_context("spawn")
+        print(f"{'mode':<18} {'seconds':>8} {'bars/s':>9} {'peak RSS, MB':>13} {'final deposit':>14}")
+        for mode in FEED_MODES:
+            queue = context.Queue()
+            process = context.Process(target=_measure_feed, args=(mode, path, queue))
+            process.start()
+            result = _child_result(process, queue)
+            process.join()
+            if result is None:
+                print(f"{mode:<18} failed, exit code {process.exitcode}")
+                continue
+            seconds, peak_kb, deposit = result
+            print(f"{mode:<18} {seconds:>8.2f} {n / seconds:>9.0f} {peak_kb / 1024:>13.1f} {deposit:>14.2f}")
+
+
+def _transactions(df, fast, **strategy_params):
+    cerebro = build_cerebro(df, stdstats=False, fast=fast, **strategy_params)
+    cerebro.addanalyzer(bt.analyzers.Transactions, _name="tx")
+    results, seconds = timed(cerebro.run)
+    return results[0].analyzers.tx.get_analysis(), summarize(cerebro, results), seconds
+
+
+def bench_strategy(n, seeds, **strategy_params):
+    """Speed of MyStrategy vs FastStrategy, their parity is tests/test_fast_strategy.py."""
+    for seed in seeds:
+        df = minute_bars(n, seed=seed)
+        slow_tx, slow_summary, slow_time = _transactions(df, False, **strategy_params)
+        _, _, fast_time = _transactions(df, True, **strategy_params)
+        print(f"seed {seed}: {len(slow_tx)} transactions, {slow_summary['trades']} trades, "
+              f"MyStrategy {slow_time:.2f}s, FastStrategy {fast_time:.2f}s, "
+              f"speedup {slow_time / fast_time:.1f}x")
+
+
+def bench_fills(n, seeds, cash=7000, **strategy_params):
+    """Speed of limit_order_backtest vs FastStrategy in cerebro, their parity is tests/test_fills.py."""
+    params = {"sma_period": 10, "wma_period": 110, **strategy_params}
+    for seed in seeds:
+        columns = array_feed.frame_columns(minute_bars(n, seed=seed))
+        signals = strategy_signals(columns, params["sma_period"], params["wma_period"])
+        cerebro = build_cerebro(columns, cash=cash, stdstats=False, fast=True, signals=signals, **params)
+        _, cerebro_time = timed(cerebro.run)
+
+        fill_params = {key: params[key] for key in ("stop_loss", "limit_valid_bars") if key in params}
+        start = max(params["sma_period"], params["wma_period"]) - 1
+        (trades, _, value), array_time = timed(limit_order_backtest, columns, signals, cash,
+                                               start=start, **fill_params)
+        closed = sum("exit_index" in trade for trade in trades)
+        print(f"seed {seed}: {closed} trades{', one open' if len(trades) > closed else ''}, "
+              f"value {value:.2f}, FastStrategy {cerebro_time:.2f}s, limit_order_backtest "
+              f"{array_time * 1000:.1f} ms, speedup {cerebro_time / array_time:.0f}x")
+
+
+def bench_stats(trades):
+    """Speed of stats.trade_stats on many trades, its parity with TradeAnalyzer is tests/test_stats.py."""
+    pnl = np.random.default_rng(0).normal(0.5, 10.0, trades)
+    _, seconds = timed(trade_stats, pnl, 1e6)
+    print(f"trade_stats on {trades} trades: {seconds * 1000:.1f} ms")
+
+
+def _resample(df, timeframe):
+    # what the rollups replace: 5m and 15m buckets from midnight already fall on 9:30, 1h ones need the offset
+    seconds = rollups.TIMEFRAMES[timeframe]
+    offset = "0min" if seconds == 86400 or rollups.SESSION_OPEN % seconds == 0 else \
+        f"{rollups.SESSION_OPEN % seconds}s"
+    resampled = df.resample(f"{seconds}s", on="datetime", offset=offset).agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+    return resampled.dropna().reset_index()
+
+
+def bench_rollups(n, appended):
+    """Syncing the rollups (full and after an append), then reading them vs resampling the minutes on every run.
+
+    That the rollups equal pandas resample is checked in tests/test_rollups.py.
+    """
+    df = minute_bars(n)
+    columns = _columns(df)
+    with tempfile.TemporaryDirectory() as tmp:
+        # the history without the last `appended` minutes, then the append as a new cache version
+        base = n - appended
+        bar_cache.write_cache("BENCH", {name: values[:base] for name, values in columns.items()},
+                              {"rows": base, "version": 1, "changes": {"1": 0}}, tmp)
+        _, full_time = timed(rollups.sync_rollups, "BENCH", rollups.ROLLUPS, tmp)
+        bar_cache.write_cache("BENCH", columns, {"rows": n, "version": 2, "changes": {"1": 0, "2": base}}, tmp)
+        aggregated, append_time = timed(rollups.sync_rollups, "BENCH", rollups.ROLLUPS, tmp)
+        print(f"sync_rollups: {full_time:.3f}s for {base} minutes, {append_time:.3f}s after appending "
+              f"{appended}")
+
+        print(f"{'timeframe':<10} {'bars':>9} {'resample s':>11} {'load s':>9} {'MB read':>9}")
+        for timeframe in rollups.ROLLUPS:
+            _, resample_time = timed(_resample, df, timeframe)
+            frame, load_time = timed(bar_cache.load_frame, "BENCH", sync_first=False, cache_dir=tmp,
+                                     timeframe=timeframe)
+            size = sum(values.nbytes for values in rollups.read_rollup("BENCH", timeframe, tmp).values())
+            print(f"{timeframe:<10} {len(frame):>9} {resample_time:>11.3f} {load_time:>9.3f} {size / 2 ** 20:>9.2f}")
+        print(f"minutes: {sum(values.nbytes for values in columns.values()) / 2 ** 20:.2f} MB, "
+              f"buckets aggregated by the append: {aggregated}")
+
+
+def synthetic_rows(n, symbol):
+    df = minute_bars(n)
+    return list(zip([symbol] * n, df["datetime"].dt.to_pydatetime(), df["open"].tolist(), df["high"].tolist(),
+                    df["low"].tolist(), df["close"].tolist(), df["volume"].tolist()))
+
+
+def bench_ingest(n, commit_rows, symbol="__BENCH__"):
+    """Rows per second of every ingest mode, against the local MariaDB.
+
+    Each mode first inserts n new rows, then upserts the same n rows again
+    (the ON DUPLICATE KEY UPDATE path). The scratch symbol is deleted afterwards.
+    """
+    rows = synthetic_rows(n, symbol)
+    print(f"{'mode':<12} {'insert rows/s':>14} {'update rows/s':>14}")
+    for mode in ingest.MODES:
+        conn = ingest.connect(mode)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM historical_data WHERE symbol = ?", (symbol,))
+            conn.commit()
+            _, insert_time = timed(ingest.upsert_rows, conn, rows, mode, commit_rows)
+            _, update_time = timed(ingest.upsert_rows, conn, rows, mode, commit_rows)
+            cursor.execute("DELETE FROM historical_data WHERE symbol = ?", (symbol,))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        print(f"{mode:<12} {n / insert_time:>14.0f} {n / update_time:>14.0f}")
+
+
+# Benchmark suite: every stage on synthetic bars, without MariaDB or TWS.
+# Each (stage, bars) pair runs in a fresh process and appends one JSON line
+# to the output file, so runs on different commits can be diffed.
+SUITE_SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+SUITE_OUTPUT = "bench_output.txt"
+# cerebro.run() takes ~50 us per bar, larger sizes are skipped unless asked for
+CEREBRO_MAX_BARS = 1_000_000
+
+
+class _NullConnection:
+    """Stand-in DB connection for the store stage: accepts and drops every statement."""
+
+    def cursor(self, *args, **kwargs):
+        return self
+
+    def execute(self, *args):
+        pass
+
+    def executemany(self, sql, rows):
+        pass
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _columns(df):
+    columns = {"datetime": df["datetime"].to_numpy(dtype="datetime64[s]").astype(np.int64)}
+    for name in list(bars.COLUMNS)[1:]:
+        columns[name] = df[name].to_numpy(dtype=bars.COLUMNS[name])
+    return columns
+
+
+def _sqlite_bars(df):
+    """historical_data of an in-memory SQLite database, the stand-in for MariaDB."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE historical_data (symbol TEXT, datetime TEXT, open REAL, high REAL, "
+                 "low REAL, close REAL, volume INTEGER, PRIMARY KEY (symbol, datetime))")
+    times = df["datetime"].dt.strftime("%Y%m%d %H:%M:%S")
+    conn.executemany("INSERT INTO historical_data VALUES ('BENCH', ?, ?, ?, ?, ?, ?)",
+                     zip(times, df["open"].tolist(), df["high"].tolist(), df["low"].tolist(),
+                         df["close"].tolist(), df["volume"].tolist()))
+    conn.commit()
+    return conn
+
+
+def _stage_load_cache(df, tmp):
+    bar_cache.write_cache("BENCH", _columns(df), {"rows": len(df), "version": 1}, tmp)
+    return lambda: bar_cache.load_frame("BENCH", sync_first=False, cache_dir=tmp)
+
+
+def _stage_load_db(df, tmp):
+    conn = _sqlite_bars(df)
+
+    def run():
+        cursor = conn.cursor()
+        loaded = bars.fill_columns(bars.stream_columns(
+            cursor, f"{bars.SELECT} WHERE symbol = ? ORDER BY datetime", ("BENCH",)), len(df))
+        cursor.close()
+        return loaded
+    return run
+
+
+def _stage_indicators(df, tmp):
+    return lambda: calculate_moving_averages(df)
+
+
+def _with_averages(df):
+    return calculate_moving_averages(df).dropna().reset_index(drop=True)
+
+
+def _stage_backtest(df, tmp):
+    df = _with_averages(df)
+    return lambda: iterative_backtest(df, [])
+
+
+def _stage_stats(df, tmp):
+    trades = []
+    iterative_backtest(_with_averages(df), trades)
+    # the last trade may still be open
+    closed = [trade for trade in trades if "exit_price" in trade]
+    entry = np.array([trade["entry_price"] for trade in closed])
+    exit_ = np.array([trade["exit_price"] for trade in closed])
+
+    def run():
+        _, equity = compound(entry, exit_)
+        return trade_stats(np.diff(equity))
+    return run
+
+
+def _stage_cerebro(df, tmp):
+    cerebro = build_cerebro(df, stdstats=False)
+    return cerebro.run
+
+
+def _stage_store(df, tmp):
+    columns = _columns(df)
+
+    def run():
+        # the rows are built as historicalData() builds them, one tuple per bar
+        writer = ingest.BarWriter(connect=_NullConnection)
+        for start in range(0, len(df), bars.CHUNK_SIZE):
+            chunk = slice(start, start + bars.CHUNK_SIZE)
+            times = columns["datetime"][chunk].astype("datetime64[s]").tolist()
+            for row in zip(times, *(columns[name][chunk].tolist() for name in list(bars.COLUMNS)[1:])):
+                writer.add(("BENCH",) + row)
+        writer.close()
+        return writer.stats()
+    return run
+
+
+SUITE_STAGES = {
+    "load_cache": _stage_load_cache,
+    "load_db": _stage_load_db,
+    "indicators": _stage_indicators,
+    "backtest": _stage_backtest,
+    "stats": _stage_stats,
+    "cerebro": _stage_cerebro,
+    "store": _stage_store,
+}
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return None
+
+
+def _reset_peak():
+    """Restart the peak RSS count (Linux), so the setup of a stage doesn't count as its peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _measure_stage(stage, n, queue):
+    with tempfile.TemporaryDirectory() as tmp:
+        run = SUITE_STAGES[stage](minute_bars(n), tmp)
+        baseline = _rss_kb()
+        exact_peak = _reset_peak()
+        _, seconds = timed(run)
+        peak = _status_kb("VmHWM") if exact_peak else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({"seconds": seconds, "peak_mb": max(peak - baseline, 0) / 1024, "peak_exact": exact_peak})
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(sizes=SUITE_SIZES, stages=tuple(SUITE_STAGES), output=SUITE_OUTPUT,
+                cerebro_max_bars=CEREBRO_MAX_BARS):
+    """Time and peak memory of every stage at every size, one JSON line each appended to output.
+
+    peak_mb is the memory a stage adds on top of its inputs.
+    """
+    context = mp.get_context("spawn")
+    run_info = {
+        "commit": _git_commit(),
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+    print(f"{'stage':<11} {'bars':>10} {'seconds':>9} {'bars/s':>11} {'peak, MB':>9}")
+    with open(output, "a") as out:
+        for n in sizes:
+            for stage in stages:
+                record = {**run_info, "stage": stage, "bars": n}
+                if stage == "cerebro" and n > cerebro_max_bars:
+                    record["skipped"] = f"more than {cerebro_max_bars} bars"
+                    print(f"{stage:<11} {n:>10} {'skipped':>9}")
+                else:
+                    queue = context.Queue()
+                    process = context.Process(target=_measure_stage, args=(stage, n, queue))
+                    process.start()
+                    result = _child_result(process, queue)
+                    process.join()
+                    if result is None:
+                        record["error"] = f"exit code {process.exitcode}"
+                        print(f"{stage:<11} {n:>10} {'failed':>9}, exit code {process.exitcode}")
+                    else:
+                        record.update(result)
+                        print(f"{stage:<11} {n:>10} {record['seconds']:>9.3f} {n / record['seconds']:>11.0f} "
+                              f"{record['peak_mb']:>9.1f}")
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backtest = commands.add_parser("backtest", help="array backtest vs df.iloc loop on synthetic bars")
+    backtest.add_argument("--bars", type=int, default=1_000_000)
+    backtest.add_argument("--reference-bars", type=int, default=50_000,
+                          help="bars for the slow df.iloc reference (it runs ~minutes per million)")
+
+    load = commands.add_parser("load", help="pd.read_sql vs streaming loader, needs the local MariaDB")
+    load.add_argument("--symbol", default="RGTI")
+
+    ingestion = commands.add_parser("ingest", help="historical_data write modes, needs the local MariaDB")
+    ingestion.add_argument("--rows", type=int, default=200_000)
+    ingestion.add_argument("--commit-rows", type=int, default=ingest.COMMIT_ROWS)
+
+    feed = commands.add_parser("feed", help="backtrader PandasData vs ArrayData on synthetic bars")
+    feed.add_argument("--bars", type=int, default=100_000)
+
+    strategy = commands.add_parser("strategy", help="MyStrategy vs FastStrategy speed on synthetic bars")
+    strategy.add_argument("--bars", type=int, default=100_000)
+    strategy.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    strategy.add_argument("--sma", type=int, default=10)
+    strategy.add_argument("--wma", type=int, default=110)
+
+    fills = commands.add_parser("fills", help="limit_order_backtest vs FastStrategy speed on synthetic bars")
+    fills.add_argument("--bars", type=int, default=100_000)
+    fills.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    fills.add_argument("--sma", type=int, default=10)
+    fills.add_argument("--wma", type=int, default=110)
+    fills.add_argument("--stop-loss", type=float, default=0.99)
+    fills.add_argument("--limit-valid-bars", type=int, default=3)
+
+    trade_statistics = commands.add_parser("stats", help="trade_stats speed on many trades")
+    trade_statistics.add_argument("--trades", type=int, default=1_000_000)
+
+    rollup = commands.add_parser("rollups", help="rollups vs pandas resample, incremental sync")
+    rollup.add_argument("--bars", type=int, default=1_000_000)
+    rollup.add_argument("--appended", type=int, default=960)
+
+    suite = commands.add_parser("suite", help="all stages on synthetic bars, JSON lines to --out")
+    suite.add_argument("--sizes", type=int, nargs="+", default=list(SUITE_SIZES))
+    suite.add_argument("--stages", nargs="+", choices=list(SUITE_STAGES), default=list(SUITE_STAGES))
+    suite.add_argument("--out", default=SUITE_OUTPUT)
+    suite.add_argument("--cerebro-max-bars", type=int, default=CEREBRO_MAX_BARS)
+
+    args = parser.parse_args()
+
+    if args.command == "backtest":
+        bench_backtest(args.bars, args.reference_bars)
+    elif args.command == "load":
+        bench_load(args.symbol)
+    elif args.command == "ingest":
+        bench_ingest(args.rows, args.commit_rows)
+    elif args.command == "feed":
+        bench_feed(args.bars)
+    elif args.command == "strategy":
+        bench_strategy(args.bars, args.seeds, sma_period=args.sma, wma_period=args.wma)
+    elif args.command == "fills":
+        bench_fills(args.bars, args.seeds, sma_period=args.sma, wma_period=args.wma, stop_loss=args.stop_loss,
+                    limit_valid_bars=args.limit_valid_bars)
+    elif args.command == "stats":
+        bench_stats(args.trades)
+    elif args.command == "rollups":
+        bench_rollups(args.bars, args.appended)
+    elif args.command == "suite":
+        bench_suite(args.sizes, args.stages, args.out, args.cerebro_max_bars)
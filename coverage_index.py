@@ -0,0 +1,186 @@
+from datetime import date, datetime, time, timedelta
+
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay,
+                                    USThanksgivingDay, nearest_workday)
+
+import db
+
+# Extended session as requested with useRTH=0: bars from 4:00, the last one at 19:59
+SESSION_START = time(4, 0)
+SESSION_END = time(19, 59)
+LOOKBACK_DAYS = 20 * 7  # "20 W", what a first download asks for
+MAX_WINDOW_DAYS = 30
+TIMEZONE = "US/Eastern"
+# Days of every window TWS has answered, with bars or "no data", per symbol
+REQUESTED_TABLE = "requested_sessions"
+
+
+class NYSECalendar(AbstractHolidayCalendar):
+    rules = [
+        Holiday("New Years Day", month=1, day=1, observance=nearest_workday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+def trading_days(start, end):
+    """Trading days from start to end inclusive, as dates."""
+    holidays = NYSECalendar().holidays(start=start, end=end)
+    return [day.date() for day in pd.bdate_range(start, end, freq="C", holidays=holidays)]
+
+
+def session_coverage(symbol):
+    """{day: (bars, first datetime, last datetime)} of symbol in historical_data."""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DATE(datetime) AS day, COUNT(*), MIN(datetime), MAX(datetime)
+            FROM historical_data WHERE symbol = ?
+            GROUP BY day
+        """, (symbol,))
+        coverage = {day: (count, first, last) for day, count, first, last in cursor.fetchall()}
+        cursor.close()
+        return coverage
+    finally:
+        conn.close()
+
+
+def _ensure_requested(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {REQUESTED_TABLE} (
+            symbol VARCHAR(16) NOT NULL,
+            day    DATE        NOT NULL,
+            PRIMARY KEY (symbol, day)
+        ) ENGINE = InnoDB
+    """)
+
+
+def requested_days(symbol):
+    """Days of symbol already answered by TWS (see record_requested)."""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        _ensure_requested(cursor)
+        cursor.execute(f"SELECT day FROM {REQUESTED_TABLE} WHERE symbol = ?", (symbol,))
+        days = {day for (day,) in cursor.fetchall()}
+        cursor.close()
+        return days
+    finally:
+        conn.close()
+
+
+def record_requested(symbol, first, last, today=None):
+    """Record the sessions first..last of symbol as answered.
+
+    Call it once TWS has answered the window (bars or "no data") and its
+    bars are stored. The days count as complete from then on even without
+    bars, e.g. a halt or a closure the calendar doesn't know, or a first
+    bar after 4:00 on the earliest day. Today's session is still running
+    and is never recorded.
+    """
+    today = today or date.today()
+    days = [(symbol, day) for day in trading_days(first, min(last, today - timedelta(days=1)))]
+    if not days:
+        return 0
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        _ensure_requested(cursor)
+        cursor.executemany(f"INSERT IGNORE INTO {REQUESTED_TABLE} (symbol, day) VALUES (?, ?)", days)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    return len(days)
+
+
+def complete_days(coverage, today=None, requested=()):
+    """Days of coverage whose session is fully stored, plus the requested ones.
+
+    Stocks without trades in a minute have no bar for it, so the bar count
+    can't tell. A day is complete when a later day is stored too (every
+    download runs up to its end time), or when its last bar is the last bar
+    of the session. The earliest day is where a "N W" download started, at
+    the time of day it was made, so it counts only if it starts with the session.
+    Days in requested (see requested_days) were answered already, whatever
+    bars they have, and are complete as long as they are before today.
+    """
+    today = today or date.today()
+    complete = {day for day in requested if day < today}
+    if not coverage:
+        return complete
+    earliest, latest = min(coverage), max(coverage)
+    stored = {day for day in coverage if day < latest}
+    if latest < today and coverage[latest][2].time() >= SESSION_END:
+        stored.add(latest)
+    if coverage[earliest][1].time() > SESSION_START:
+        stored.discard(earliest)
+    return complete | stored
+
+
+def missing_days(coverage, today=None, lookback_days=LOOKBACK_DAYS, requested=()):
+    """Trading days up to today that are not complete, from the first stored day
+    (or today - lookback_days for a new symbol)."""
+    today = today or date.today()
+    start = min(coverage) if coverage else today - timedelta(days=lookback_days)
+    complete = complete_days(coverage, today, requested)
+    return [day for day in trading_days(start, today) if day not in complete]
+
+
+def missing_windows(days, max_days=MAX_WINDOW_DAYS):
+    """Group sorted days into (first, last) windows of consecutive trading days,
+    at most max_days calendar days long."""
+    windows = []
+    all_days = trading_days(days[0], days[-1]) if days else []
+    position = {day: i for i, day in enumerate(all_days)}
+    for day in days:
+        if windows:
+            first, last = windows[-1]
+            if position[day] == position[last] + 1 and (day - first).days < max_days:
+                windows[-1] = (first, day)
+                continue
+        windows.append((day, day))
+    return windows
+
+
+def window_request(first, last, today=None, tz=TIMEZONE):
+    """endDateTime and durationStr that cover the sessions first..last.
+
+    A window ending today asks up to "now" (empty endDateTime).
+    """
+    today = today or date.today()
+    if last >= today:
+        return "", f"{(today - first).days + 1} D"
+    end = datetime.combine(last + timedelta(days=1), time(0, 0))
+    return f"{end:%Y%m%d %H:%M:%S} {tz}", f"{(last - first).days + 1} D"
+
+
+def plan_windows(symbol, today=None, lookback_days=LOOKBACK_DAYS, max_days=MAX_WINDOW_DAYS, coverage=None,
+                 requested=None):
+    """(first, last) day windows to request for symbol, only for missing sessions.
+
+    coverage and requested default to session_coverage() and requested_days() of symbol.
+    """
+    today = today or date.today()
+    if coverage is None:
+        coverage = session_coverage(symbol)
+    if requested is None:
+        requested = requested_days(symbol)
+    return missing_windows(missing_days(coverage, today, lookback_days, requested), max_days)
+
+
+def plan(symbol, today=None, lookback_days=LOOKBACK_DAYS, max_days=MAX_WINDOW_DAYS, coverage=None, requested=None):
+    """(endDateTime, durationStr) pairs to request for symbol, only for missing sessions."""
+    today = today or date.today()
+    return [window_request(first, last, today)
+            for first, last in plan_windows(symbol, today, lookback_days, max_days, coverage, requested)]
@@ -0,0 +1,232 @@
+import itertools
+import os
+import threading
+import time
+
+import profiling
+
+try:
+    import mariadb
+    Error = mariadb.Error
+except ImportError:
+    # Only talking to the DB needs the MariaDB client: the bar cache, the
+    # backtests and the benchmarks on synthetic bars import without it.
+    # Nothing can raise a driver error then, so `except db.Error` catches nothing.
+    mariadb = None
+    Error = ()
+
+DB_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 3306,
+    "user": "root",
+    "password": "password",
+    "database": "analysis"
+}
+
+# Connections per pool (one pool per process and set of connect options),
+# and how long connect() waits for one when all of them are in use
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+ACQUIRE_TIMEOUT = 30.0
+
+_pool_names = itertools.count()
+
+
+class Pool:
+    """Connections with DB_CONFIG plus options, shared by the threads of one process.
+
+    Connections are opened on demand up to size and handed out by
+    connection(); closing what it returns puts the connection back. When all
+    of them are in use, connection() waits up to acquire_timeout for one.
+    Sessions are not reset on the way back, so prepared statements survive
+    from one use to the next (see PooledConnection.prepared); a transaction
+    left open is rolled back instead.
+    """
+
+    def __init__(self, size=POOL_SIZE, acquire_timeout=ACQUIRE_TIMEOUT, **options):
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.pool = mariadb.ConnectionPool(pool_name=f"analysis-{os.getpid()}-{next(_pool_names)}",
+                                           pool_size=size, pool_reset_connection=False)
+        self.pool.set_config(**{**DB_CONFIG, **options})
+        self.free = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.opened = 0
+
+        self.acquired = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def connection(self):
+        """A connection of the pool, close() returns it."""
+        start = time.perf_counter()
+        if not self.free.acquire(blocking=False):
+            # saturated: every connection is in use
+            with profiling.stage("db_pool_wait"):
+                acquired = self.free.acquire(timeout=self.acquire_timeout)
+            with self.lock:
+                self.waited += 1
+                if not acquired:
+                    self.timeouts += 1
+            if not acquired:
+                raise mariadb.PoolError(f"no free connection in {self.acquire_timeout}s, all {self.size} in use")
+        try:
+            with self.lock:
+                conn = self._take()
+        except BaseException:
+            self.free.release()
+            raise
+
+        wait = time.perf_counter() - start
+        with self.lock:
+            self.acquired += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        profiling.count("db_connections_acquired")
+        return PooledConnection(self, conn)
+
+    def _take(self):
+        # the semaphore guarantees either an idle connection or room for a new one
+        if self.opened:
+            try:
+                conn = self.pool.get_connection()
+            except mariadb.PoolError:
+                conn = None
+            if conn is not None:
+                return conn
+        self.pool.add_connection()
+        self.opened += 1
+        return self.pool.get_connection()
+
+    def release(self, conn):
+        try:
+            conn.close()
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.free.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "opened": self.opened,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "mean_acquire_ms": self.wait_seconds / self.acquired * 1000 if self.acquired else 0.0,
+                "max_acquire_ms": self.max_wait_seconds * 1000,
+            }
+
+    def close(self):
+        self.pool.close()
+
+
+class PooledConnection:
+    """A connection borrowed from a Pool, otherwise used like a mariadb connection."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def prepared(self, sql):
+        """Prepared cursor for sql, reused for every execute of the same statement on this connection.
+
+        It belongs to the connection, the caller must not close it.
+        """
+        # cursors live with the mariadb connection, which outlives this wrapper
+        statements = _prepared.setdefault(id(self._conn), {})
+        cursor = statements.get(sql)
+        if cursor is None:
+            cursor = statements[sql] = self._conn.cursor(prepared=True)
+        return cursor
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.rollback()
+        except mariadb.Error:
+            # a broken connection goes back as well, the pool pings it before reuse;
+            # its statements died with the session
+            _prepared.pop(id(conn), None)
+        self._pool.release(conn)
+
+
+# Prepared cursors of the pooled connections, {id(connection): {sql: cursor}}
+_prepared = {}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Pools and prepared cursors a forked child inherited from its parent. The
+# child must not use them, and must not let them be deallocated either: the
+# connector's dealloc closes the connection, which sends COM_QUIT on the
+# socket the child shares with the parent and ends the parent's session.
+# This list is never cleared, so they live as long as the child.
+_inherited = []
+
+
+def _after_fork():
+    global _pools, _pools_lock, _prepared
+    # the child opens its own connections
+    _inherited.append((_pools, _prepared))
+    _pools = {}
+    _prepared = {}
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def pool(**options):
+    """The Pool of this process for the given connect options."""
+    if mariadb is None:
+        raise ModuleNotFoundError("the mariadb package is needed to connect to the database")
+    key = tuple(sorted(options.items()))
+    with _pools_lock:
+        found = _pools.get(key)
+        if found is None:
+            found = _pools[key] = Pool(**options)
+        return found
+
+
+def connect(**options):
+    """Pooled connection with DB_CONFIG, options (e.g. local_infile=True) override it.
+
+    close() returns it to the pool of this process.
+    """
+    return pool(**options).connection()
+
+
+def prepared(conn, sql):
+    """Cursor for executing sql repeatedly: the cached prepared cursor of a pooled connection."""
+    if isinstance(conn, PooledConnection):
+        return conn.prepared(sql)
+    return conn.cursor(prepared=True)
+
+
+def pool_stats():
+    """Acquire latency and saturation of every pool of this process, keyed by its options."""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {", ".join(f"{k}={v}" for k, v in key) or "default": found.stats() for key, found in pools.items()}
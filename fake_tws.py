@@ -0,0 +1,149 @@
+import socketserver
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Server version announced to the client. It is new enough for keepUpToDate
+# (synthetic realtime bars, 124) and old enough that historicalDataEnd still
+# comes inside the HISTORICAL_DATA message, which every ibapi version decodes.
+SERVER_VERSION = 124
+
+# Incoming message ids
+START_API = 71
+REQ_HISTORICAL_DATA = 20
+CANCEL_HISTORICAL_DATA = 25
+
+# Outgoing message ids
+HISTORICAL_DATA = 17
+ERR_MSG = 4
+NEXT_VALID_ID = 9
+MANAGED_ACCTS = 15
+
+PACING_VIOLATION = (162, "Historical Market Data Service error message:Historical data request pacing violation")
+NO_DATA = (162, "Historical Market Data Service error message:HMDS query returned no data")
+
+_DURATION_UNITS = {"S": 1, "D": 86400, "W": 7 * 86400}
+
+
+def _frame(*fields):
+    payload = "".join(f"{field}\0" for field in fields).encode()
+    return struct.pack("!I", len(payload)) + payload
+
+
+def _parse_end(end):
+    if not end:
+        return None
+    return datetime.strptime(" ".join(end.replace("-", " ").split()[:2]), "%Y%m%d %H:%M:%S")
+
+
+def _parse_duration(duration):
+    count, unit = duration.split()
+    return timedelta(seconds=int(count) * _DURATION_UNITS[unit])
+
+
+class FakeTWS(socketserver.ThreadingTCPServer):
+    """Local stand-in for TWS that replays canned bars to reqHistoricalData.
+
+    bars: {symbol: [(datetime, open, high, low, close, volume), ...]} sorted by time.
+    A request gets the bars in [endDateTime - durationStr, endDateTime); an empty
+    endDateTime means "now", i.e. the last canned bar. The first pacing_errors
+    requests are rejected with a pacing violation. Every request is recorded in
+    self.requests as (symbol, endDateTime, durationStr).
+
+    with FakeTWS(bars) as tws:
+        app.connect("127.0.0.1", tws.port, clientId=0)
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, bars, pacing_errors=0, delay=0.0, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.bars = bars
+        self.pacing_errors = pacing_errors
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def reply(self, symbol, end, duration):
+        """The canned bars for one request, or an (errorCode, errorString) to send instead."""
+        with self.lock:
+            self.requests.append((symbol, end, duration))
+            if self.pacing_errors > 0:
+                self.pacing_errors -= 1
+                return PACING_VIOLATION
+        bars = self.bars.get(symbol, [])
+        end_dt = _parse_end(end)
+        if end_dt is None:
+            end_dt = bars[-1][0] + timedelta(seconds=1) if bars else datetime.now()
+        start_dt = end_dt - _parse_duration(duration)
+        selected = [bar for bar in bars if start_dt <= bar[0] < end_dt]
+        return selected if selected else NO_DATA
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        self.buffer = b""
+        if self._read_exact(4) != b"API\0":
+            return
+        self._read_message()  # "v100..176" version range, any is fine
+        self.request.sendall(_frame(SERVER_VERSION, datetime.now().strftime("%Y%m%d %H:%M:%S EST")))
+
+        while True:
+            fields = self._read_message()
+            if fields is None:
+                return
+            msg_id = int(fields[0])
+            if msg_id == START_API:
+                self.request.sendall(_frame(NEXT_VALID_ID, 1, 1) + _frame(MANAGED_ACCTS, 1, "DU000000"))
+            elif msg_id == REQ_HISTORICAL_DATA:
+                # at SERVER_VERSION: id, reqId, conId, symbol, ..., endDateTime (15), barSize, duration
+                req_id, symbol, end, duration = int(fields[1]), fields[3], fields[15], fields[17]
+                self._send_history(req_id, symbol, end, duration)
+
+    def _send_history(self, req_id, symbol, end, duration):
+        reply = self.server.reply(symbol, end, duration)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if isinstance(reply, tuple):
+            self.request.sendall(_frame(ERR_MSG, 2, req_id, *reply))
+            return
+        fields = [HISTORICAL_DATA, req_id,
+                  reply[0][0].strftime("%Y%m%d %H:%M:%S"), reply[-1][0].strftime("%Y%m%d %H:%M:%S"),
+                  len(reply)]
+        for dt, open_, high, low, close, volume in reply:
+            fields += [dt.strftime("%Y%m%d %H:%M:%S"), open_, high, low, close, int(volume), close, 1]
+        self.request.sendall(_frame(*fields))
+
+    def _read_exact(self, size):
+        while len(self.buffer) < size:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                return None
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _read_message(self):
+        header = self._read_exact(4)
+        if header is None:
+            return None
+        payload = self._read_exact(struct.unpack("!I", header)[0])
+        if payload is None:
+            return None
+        return payload.decode().split("\0")[:-1]
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import bar_cache
+import profiling
+from indicators import moving_averages
+
+CACHE_DIR = os.environ.get("INDICATOR_CACHE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), ".indicator_cache"))
+MEMORY_BYTES = 512 << 20
+DISK_BYTES = 4 << 30
+
+
+class IndicatorCache:
+    """SMA/WMA series of cached bars, kept in memory and on disk.
+
+    An entry is keyed by (symbol, source column, kind, period) and remembers
+    the bar_cache version it was computed from. When the bars get a new
+    version, the rows before its changed_from are kept and only the rest is
+    computed, so new bars extend a series instead of invalidating it.
+    Both levels evict the least recently used entries once they hold more
+    than memory_bytes / disk_bytes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES,
+                 bar_cache_dir=bar_cache.CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.bar_cache_dir = bar_cache_dir
+        self.memory = OrderedDict()  # key -> (values, meta)
+        self.memory_used = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.extended = 0
+        self.computed = 0
+
+    def moving_averages(self, symbol, sma_periods=(), wma_periods=(), column="close", times=None):
+        """Like indicators.moving_averages() on column of the cached bars of symbol.
+
+        The bars must be synced (bar_cache.sync) beforehand. With times (the
+        datetime column of a slice of those bars) the series are cut to the
+        slice, keeping the values warmed up on the bars before it.
+        """
+        bars, bar_meta = bar_cache.read_cache(symbol, self.bar_cache_dir)
+        if bars is None:
+            raise KeyError(f"no cached bars for {symbol}, run bar_cache.sync() first")
+        values = bars[column]
+        rows = len(values)
+
+        keys = [("SMA", int(p)) for p in sma_periods] + [("WMA", int(p)) for p in wma_periods]
+        result, todo = {}, {}
+        with self.lock:
+            for key in keys:
+                cached, meta = self._lookup((symbol, column) + key)
+                valid = self._valid_rows(meta, bar_meta, bars["datetime"]) if cached is not None else 0
+                if valid == rows:
+                    self.hits += 1
+                    result[key] = cached
+                else:
+                    todo.setdefault(valid, []).append((key, cached))
+
+        profiling.count("indicator_cache_hits", len(keys) - sum(len(entries) for entries in todo.values()))
+        # One pass over the changed tail for all series that are valid up to the same row
+        for valid, entries in todo.items():
+            periods = [period for (_, period), _ in entries]
+            lo = max(valid - max(periods) + 1, 0)
+            fresh = moving_averages(values[lo:],
+                                    sma_periods=[p for (kind, p), _ in entries if kind == "SMA"],
+                                    wma_periods=[p for (kind, p), _ in entries if kind == "WMA"])
+            for key, cached in entries:
+                series = np.empty(rows)
+                if valid:
+                    series[:valid] = cached[:valid]
+                series[valid:] = fresh[key][valid - lo:]
+                series.flags.writeable = False
+                with self.lock:
+                    if valid:
+                        self.extended += 1
+                    else:
+                        self.computed += 1
+                    self._store((symbol, column) + key, series, {
+                        "rows": rows,
+                        "bar_version": bar_meta["version"],
+                        "last_datetime": int(bars["datetime"][-1]) if rows else None,
+                    })
+                result[key] = series
+
+        if times is not None:
+            lo, hi = _slice_of(bars["datetime"], times)
+            result = {key: series[lo:hi] for key, series in result.items()}
+        return result
+
+    def get(self, symbol, kind, period, column="close", times=None):
+        """One indicator series, kind is "SMA" or "WMA"."""
+        periods = {"sma_periods": (), "wma_periods": ()}
+        periods[f"{kind.lower()}_periods"] = (period,)
+        return self.moving_averages(symbol, column=column, times=times, **periods)[(kind, int(period))]
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "extended": self.extended,
+            "computed": self.computed,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_used,
+        }
+
+    @staticmethod
+    def _valid_rows(meta, bar_meta, times):
+        """Number of leading rows of a cached series that are still right for the current bars."""
+        return bar_cache.unchanged_rows(bar_meta, times, meta["bar_version"], meta["rows"], meta["last_datetime"])
+
+    def _path(self, key):
+        symbol, column, kind, period = key
+        return os.path.join(self.cache_dir, symbol, f"{column}_{kind}_{period}")
+
+    def _lookup(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        path = self._path(key)
+        try:
+            with open(path + ".json") as f:
+                meta = json.load(f)
+            values = np.load(path + ".npy")
+        except (OSError, ValueError):
+            return None, None
+        if len(values) != meta["rows"]:
+            return None, None
+        os.utime(path + ".npy")  # the modification time orders the disk LRU
+        values.flags.writeable = False
+        self._remember(key, values, meta)
+        return values, meta
+
+    def _remember(self, key, values, meta):
+        if key in self.memory:
+            self.memory_used -= self.memory.pop(key)[0].nbytes
+        self.memory[key] = (values, meta)
+        self.memory_used += values.nbytes
+        while self.memory_used > self.memory_bytes and len(self.memory) > 1:
+            _, (evicted, _) = self.memory.popitem(last=False)
+            self.memory_used -= evicted.nbytes
+
+    def _store(self, key, values, meta):
+        self._remember(key, values, meta)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the series is replaced before its metadata, a crash in between leaves
+        # a length mismatch that _lookup treats as a miss
+        with open(path + ".tmp.npy", "wb") as f:
+            np.save(f, values)
+        os.replace(path + ".tmp.npy", path + ".npy")
+        with open(path + ".tmp.json", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp.json", path + ".json")
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".npy") and not name.endswith(".tmp.npy"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        used = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if used <= self.disk_bytes:
+                break
+            base = path[:-len(".npy")]
+            for suffix in (".npy", ".json"):
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
+            used -= size
+
+
+def _slice_of(cached_times, times):
+    """[lo, hi) of the cached bars whose datetimes are times (a contiguous run of them)."""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        times = times.astype("datetime64[s]").astype(np.int64)
+    if not len(times):
+        return 0, 0
+    lo = int(np.searchsorted(cached_times, times[0]))
+    hi = lo + len(times)
+    if hi > len(cached_times) or not np.array_equal(cached_times[lo:hi], times):
+        raise ValueError("times are not a contiguous run of the cached bars")
+    return lo, hi
+
+
+_default = None
+
+
+def default_cache():
+    """Process-wide IndicatorCache with the default directories."""
+    global _default
+    if _default is None:
+        _default = IndicatorCache()
+    return _default
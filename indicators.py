@@ -0,0 +1,217 @@
+import numpy as np
+
+import profiling
+
+# Window sums are taken from prefix sums, which lose precision as they grow.
+# The input is therefore processed in blocks: every block is centered on its
+# first value and gets its own prefix sums, so the accumulated magnitude is
+# bounded by BLOCK_SIZE bars no matter how long the series is.
+# With this block size SMA/WMA match the rolling().mean()/rolling().apply()
+# reference within TOLERANCE * max(|x|) (absolute).
+BLOCK_SIZE = 1 << 16
+TOLERANCE = 1e-9
+
+
+def _as_float64(values):
+    x = np.ascontiguousarray(values, dtype=np.float64)
+    if x.ndim != 1:
+        raise ValueError("expected a 1-D series")
+    if not np.isfinite(x).all():
+        raise ValueError("series contains NaN or inf values")
+    return x
+
+
+def _check_periods(periods):
+    periods = tuple(int(p) for p in periods)
+    if any(p < 1 for p in periods):
+        raise ValueError(f"periods must be positive, got {periods}")
+    return periods
+
+
+@profiling.profiled("indicators")
+def moving_averages(values, sma_periods=(), wma_periods=(), block_size=BLOCK_SIZE):
+    """Compute several SMAs and WMAs of one series in a single pass.
+
+    Returns a dict {("SMA", period): array, ("WMA", period): array}, each
+    array has the length of `values` with NaN for the first period - 1 bars,
+    the same as pandas rolling windows.
+    WMA weights are 1..period, the newest bar has the largest weight.
+    """
+    x = _as_float64(values)
+    sma_periods = _check_periods(sma_periods)
+    wma_periods = _check_periods(wma_periods)
+    n = len(x)
+
+    result = {}
+    for p in sma_periods:
+        result[("SMA", p)] = np.full(n, np.nan)
+    for p in wma_periods:
+        result[("WMA", p)] = np.full(n, np.nan)
+    if not result or n == 0:
+        return result
+
+    max_period = max(sma_periods + wma_periods)
+    block_size = max(int(block_size), max_period)
+
+    # Each block produces outputs [start, end) and reads max_period - 1 bars
+    # before start so every window inside the block is complete
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        lo = max(start - max_period + 1, 0)
+        d = x[lo:end] - x[lo]
+        prefix = np.empty(len(d) + 1)
+        prefix[0] = 0.0
+        np.cumsum(d, out=prefix[1:])
+
+        for p in sma_periods:
+            _block_sma(result[("SMA", p)], prefix, x[lo], p, lo, start, end)
+        for p in wma_periods:
+            _block_wma(result[("WMA", p)], d, prefix, x[lo], p, lo, start, end)
+
+    return result
+
+
+def _block_sma(out, prefix, center, p, lo, start, end):
+    first = max(start, lo + p - 1)
+    if first >= end:
+        return
+    # local index of the last bar of each window is i, the window is (i-p, i]
+    i = np.arange(first - lo, end - lo)
+    out[first:end] = (prefix[i + 1] - prefix[i + 1 - p]) / p + center
+
+
+def _block_wma(out, d, prefix, center, p, lo, start, end):
+    first = max(start, lo + p - 1)
+    if first >= end:
+        return
+    norm = p * (p + 1) / 2.0
+    f = first - lo
+
+    # Weighted sum of the first window directly, then the recurrence
+    #   N[t] = N[t-1] + p * x[t] - S[t-1]
+    # where S[t-1] is the plain window sum ending at t-1. Every increment is
+    # O(p * |x|), so the running sum stays small compared with using i * x.
+    num0 = np.dot(np.arange(1, p + 1, dtype=np.float64), d[f - p + 1:f + 1])
+    i = np.arange(f + 1, end - lo)
+    increments = p * d[i] - (prefix[i] - prefix[i - p])
+    num = np.empty(end - first)
+    num[0] = num0
+    np.cumsum(increments, out=num[1:])
+    num[1:] += num0
+    out[first:end] = num / norm + center
+
+
+def sma(values, period, block_size=BLOCK_SIZE):
+    """Simple moving average, equivalent to rolling(period).mean()."""
+    return moving_averages(values, sma_periods=(period,), block_size=block_size)[("SMA", period)]
+
+
+def wma(values, period, block_size=BLOCK_SIZE):
+    """Linearly weighted moving average with weights 1..period."""
+    return moving_averages(values, wma_periods=(period,), block_size=block_size)[("WMA", period)]
+
+
+# Streaming indicators recompute their sums from the window every
+# RESYNC_UPDATES updates, so rounding errors of the running sums can't
+# accumulate over a long live session; the cost per bar stays O(1) amortized.
+RESYNC_UPDATES = 100_000
+
+
+class StreamingSMA:
+    """Simple moving average updated one bar at a time.
+
+    update(x) adds a new bar, revise(x) replaces the value of the last bar
+    (IB sends the forming bar again and again). value is NaN until period
+    bars were added.
+    """
+
+    def __init__(self, period):
+        self.period = _check_periods((period,))[0]
+        self.window = np.zeros(self.period)
+        self.count = 0
+        self.total = 0.0
+        self.updates = 0
+
+    def _last_slot(self):
+        return (self.count - 1) % self.period
+
+    def update(self, x):
+        x = float(x)
+        slot = self.count % self.period
+        if self.count >= self.period:
+            self.total -= self.window[slot]
+        self.window[slot] = x
+        self.total += x
+        self.count += 1
+        self._tick()
+
+    def revise(self, x):
+        if self.count == 0:
+            self.update(x)
+            return
+        x = float(x)
+        slot = self._last_slot()
+        self.total += x - self.window[slot]
+        self.window[slot] = x
+        self._tick()
+
+    def _tick(self):
+        self.updates += 1
+        if self.updates % RESYNC_UPDATES == 0:
+            self._resync()
+
+    def _resync(self):
+        self.total = float(self.window[:min(self.count, self.period)].sum())
+
+    def _ordered(self):
+        """Window values from the oldest to the newest."""
+        n = min(self.count, self.period)
+        start = (self.count - n) % self.period
+        return np.roll(self.window, -start)[:n]
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    @property
+    def value(self):
+        return self.total / self.period if self.ready else float("nan")
+
+
+class StreamingWMA(StreamingSMA):
+    """Weighted moving average (weights 1..period, newest largest) updated one bar at a time.
+
+    Keeps the plain window sum S and the weighted sum N; a new bar x does
+        N = N + period * x - S,  S = S + x - x_oldest
+    and a revision of the last bar by d adds d to S and period * d to N.
+    """
+
+    def __init__(self, period):
+        super().__init__(period)
+        self.weighted = 0.0
+        self.norm = self.period * (self.period + 1) / 2.0
+
+    def update(self, x):
+        x = float(x)
+        if self.count >= self.period:
+            self.weighted += self.period * x - self.total
+        else:
+            self.weighted += (self.count + 1) * x
+        super().update(x)
+
+    def revise(self, x):
+        if self.count == 0:
+            self.update(x)
+            return
+        delta = float(x) - self.window[self._last_slot()]
+        self.weighted += min(self.count, self.period) * delta
+        super().revise(x)
+
+    def _resync(self):
+        super()._resync()
+        values = self._ordered()
+        self.weighted = float(np.dot(np.arange(1, len(values) + 1), values))
+
+    @property
+    def value(self):
+        return self.weighted / self.norm if self.ready else float("nan")
@@ -0,0 +1,232 @@
+import csv
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import db
+import profiling
+
+INSERT_QUERY = """
+INSERT INTO historical_data (symbol, datetime, open, high, low, close, volume)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    open=VALUES(open), high=VALUES(high),
+    low=VALUES(low), close=VALUES(close), volume=VALUES(volume)
+"""
+
+COLUMNS = "symbol, datetime, open, high, low, close, volume"
+STAGING_TABLE = "historical_data_staging"
+
+# Set-based upsert of everything staged, then the staging table is emptied
+UPSERT_FROM_STAGING = f"""
+INSERT INTO historical_data ({COLUMNS})
+SELECT {COLUMNS} FROM {STAGING_TABLE}
+ON DUPLICATE KEY UPDATE
+    open=VALUES(open), high=VALUES(high),
+    low=VALUES(low), close=VALUES(close), volume=VALUES(volume)
+"""
+
+# Ways to write rows:
+#   executemany - one INSERT ... ON DUPLICATE KEY UPDATE per row
+#   multirow    - multi-row INSERTs into a temporary staging table, then one set-based upsert
+#   load_data   - LOAD DATA LOCAL INFILE into the staging table, then one set-based upsert
+MODES = ("executemany", "multirow", "load_data")
+MODE = "executemany"
+
+BATCH_SIZE = 5000
+QUEUE_BATCHES = 8
+RETRIES = 3
+COMMIT_ROWS = 50_000
+STATEMENT_ROWS = 1000
+
+_STOP = object()
+
+
+def connect(mode=MODE):
+    """Connection suitable for mode, LOAD DATA LOCAL needs local_infile enabled."""
+    if mode == "load_data":
+        return db.connect(local_infile=True)
+    return db.connect()
+
+
+def _ensure_staging(cursor):
+    cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} LIKE historical_data")
+
+
+def _stage_multirow(cursor, rows, statement_rows):
+    for start in range(0, len(rows), statement_rows):
+        chunk = rows[start:start + statement_rows]
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(chunk))
+        cursor.execute(f"REPLACE INTO {STAGING_TABLE} ({COLUMNS}) VALUES {placeholders}",
+                       [value for row in chunk for value in row])
+
+
+def _stage_load_data(cursor, rows):
+    with tempfile.NamedTemporaryFile("w", newline="", suffix=".csv", delete=False) as f:
+        writer = csv.writer(f)
+        for symbol, dt, open_, high, low, close, volume in rows:
+            writer.writerow((symbol, f"{dt:%Y-%m-%d %H:%M:%S}", open_, high, low, close, volume))
+        path = f.name
+    try:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE '{path}' REPLACE INTO TABLE {STAGING_TABLE}
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' LINES TERMINATED BY '\\r\\n'
+            ({COLUMNS})
+        """)
+    finally:
+        os.remove(path)
+
+
+@profiling.profiled("db_write")
+def upsert_rows(conn, rows, mode=MODE, commit_rows=COMMIT_ROWS, statement_rows=STATEMENT_ROWS):
+    """Upsert (symbol, datetime, open, high, low, close, volume) rows into historical_data.
+
+    Commits after every commit_rows rows, so a large load never holds one huge
+    transaction. Returns the number of rows written.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}, expected one of {MODES}")
+    if mode == "executemany":
+        # a pooled connection keeps the prepared INSERT from one batch to the next
+        cursor = db.prepared(conn, INSERT_QUERY)
+    else:
+        cursor = conn.cursor()
+        _ensure_staging(cursor)
+
+    for start in range(0, len(rows), commit_rows):
+        chunk = rows[start:start + commit_rows]
+        if mode == "executemany":
+            cursor.executemany(INSERT_QUERY, chunk)
+        else:
+            if mode == "multirow":
+                _stage_multirow(cursor, chunk, statement_rows)
+            else:
+                _stage_load_data(cursor, chunk)
+            cursor.execute(UPSERT_FROM_STAGING)
+            cursor.execute(f"DELETE FROM {STAGING_TABLE}")
+        conn.commit()
+
+    if mode != "executemany":
+        cursor.close()
+    profiling.count("rows_written", len(rows))
+    return len(rows)
+
+
+class BarWriter:
+    """Writes bars to historical_data from a background thread.
+
+    add() collects (symbol, datetime, open, high, low, close, volume) tuples
+    into batches of batch_size. Full batches go to a bounded queue, and the
+    writer thread upserts and commits each one while the caller keeps
+    receiving. At most queue_batches + 1 batches are in memory; when the
+    database falls behind, add() blocks until a batch is written.
+    mode selects how rows are written, see MODES. connect() opens the
+    writer's connection, ingest.connect(mode) by default: the writer thread
+    borrows one connection of the process pool (db.pool) and keeps it.
+    A batch that cannot be written is counted in rows_failed (error holds
+    the last exception) and the thread goes on with the next one.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, queue_batches=QUEUE_BATCHES, mode=MODE, connect=None):
+        self.batch_size = batch_size
+        self.mode = mode
+        self.open_connection = connect
+        self.queue = queue.Queue(maxsize=queue_batches)
+        self.batch = []
+        self.lock = threading.Lock()
+
+        self.bars_received = 0
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_failed = 0
+        self.error = None
+        self.started = time.monotonic()
+
+        self.thread = threading.Thread(target=self._run, name="bar-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, row):
+        with self.lock:
+            self.batch.append(row)
+            self.bars_received += 1
+            if len(self.batch) < self.batch_size:
+                return
+            batch, self.batch = self.batch, []
+        # time blocked here means the database is slower than the bars arrive
+        with profiling.stage("writer_backpressure"):
+            self.queue.put(batch)
+
+    def flush(self):
+        """Queue the current partial batch and wait until everything queued is written."""
+        with self.lock:
+            batch, self.batch = self.batch, []
+        if batch:
+            self.queue.put(batch)
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "bars_received": self.bars_received,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "batches_written": self.batches_written,
+            "queue_depth": self.queue.qsize(),
+            "bars_per_second": self.rows_written / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is _STOP:
+                    break
+                try:
+                    conn = self._write(conn, batch)
+                except Exception as err:
+                    # e.g. a malformed row or a failing connect(): the batch is lost,
+                    # but the thread keeps draining the queue, or add() and flush()
+                    # would block the caller forever
+                    print(f"Writer error, {len(batch)} rows dropped: {err!r}")
+                    self.rows_failed += len(batch)
+                    self.error = err
+                    conn = _discard(conn)
+            finally:
+                self.queue.task_done()
+        if conn is not None:
+            conn.close()
+
+    def _write(self, conn, batch):
+        for attempt in range(1, RETRIES + 1):
+            try:
+                if conn is None:
+                    conn = self.open_connection() if self.open_connection else connect(self.mode)
+                upsert_rows(conn, batch, self.mode)
+                self.rows_written += len(batch)
+                self.batches_written += 1
+                return conn
+            except db.Error as err:
+                print(f"DB error (attempt {attempt}/{RETRIES}): {err}")
+                self.error = err
+                conn = _discard(conn)
+                time.sleep(attempt)
+        self.rows_failed += len(batch)
+        return conn
+
+
+def _discard(conn):
+    # closing a connection in an unknown state may fail as well
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    return None
@@ -0,0 +1,125 @@
+import argparse
+import time
+from datetime import time as dtime
+from threading import Thread
+
+import numpy as np
+
+from indicators import StreamingSMA, StreamingWMA
+from test_connection import HistoricalDataApp, make_contract, run_loop
+
+MARKET_OPEN = dtime(9, 30)
+MARKET_CLOSE = dtime(16, 0)
+
+
+class CrossoverMonitor:
+    """SMA/WMA crossover signals on a stream of bars, the rules of MyStrategy.
+
+    on_bar() takes every bar record as it arrives. A record with the same time
+    as the previous one revises the forming bar; a new time means the previous
+    bar is complete, its signal is evaluated and the new bar is started.
+    Signals are passed to on_signal(kind, bar_time, close) with kind "entry",
+    "exit" or "stop"; before live is set (while the history is replayed) the
+    position is tracked but nothing is emitted.
+    """
+
+    def __init__(self, sma_period=10, wma_period=110, stop_loss=0.99, on_signal=None):
+        self.sma = StreamingSMA(sma_period)
+        self.wma = StreamingWMA(wma_period)
+        self.stop_loss = stop_loss
+        self.on_signal = on_signal or (lambda kind, bar_time, close: print(f"{kind}: {bar_time} close {close}"))
+        self.live = False
+
+        self.bar_time = None
+        self.bar_open = None
+        self.bar_close = None
+        self.sma_prev = float("nan")
+        self.wma_prev = float("nan")
+        self.entry_price = None
+        self.latencies = []  # seconds from receiving the completing record to the signal
+
+    def on_bar(self, bar_time, open_, close, received=None):
+        received = received if received is not None else time.perf_counter()
+        if bar_time == self.bar_time:
+            self.sma.revise(close)
+            self.wma.revise(close)
+            self.bar_close = close
+            return
+        if self.bar_time is not None:
+            self._evaluate(received)
+        self.sma_prev, self.wma_prev = self.sma.value, self.wma.value
+        self.sma.update(close)
+        self.wma.update(close)
+        self.bar_time, self.bar_open, self.bar_close = bar_time, open_, close
+
+    def _evaluate(self, received):
+        if not (self.sma.ready and self.wma.ready) or np.isnan(self.wma_prev):
+            return
+        if round(self.bar_close, 2) == round(self.bar_open, 2):
+            return
+
+        sma, sma_prev = round(self.sma.value, 3), round(self.sma_prev, 3)
+        wma, wma_prev = round(self.wma.value, 3), round(self.wma_prev, 3)
+
+        if self.entry_price is None:
+            if not (MARKET_OPEN <= self.bar_time.time() <= MARKET_CLOSE):
+                return
+            if sma_prev < wma_prev and sma - wma > 0.0:
+                self.entry_price = self.bar_close
+                self._emit("entry", received)
+        else:
+            cross_down = sma_prev >= wma_prev and sma < wma
+            stop = self.bar_close < self.entry_price * self.stop_loss
+            if cross_down and not stop:
+                self.entry_price = None
+                self._emit("exit", received)
+            elif stop and not cross_down:
+                self.entry_price = None
+                self._emit("stop", received)
+
+    def _emit(self, kind, received):
+        if not self.live:
+            return
+        self.on_signal(kind, self.bar_time, self.bar_close)
+        self.latencies.append(time.perf_counter() - received)
+
+    def latency_report(self):
+        """Bar-to-signal latency percentiles in microseconds."""
+        if not self.latencies:
+            return "no signals yet"
+        values = np.array(self.latencies) * 1e6
+        p50, p99 = np.percentile(values, [50, 99])
+        return f"signals: {len(values)}, latency p50 {p50:.0f} us, p99 {p99:.0f} us, max {values.max():.0f} us"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live SMA/WMA crossover signals from TWS keepUpToDate bars")
+    parser.add_argument("symbol")
+    parser.add_argument("--port", type=int, default=7497)
+    parser.add_argument("--sma", type=int, default=10)
+    parser.add_argument("--wma", type=int, default=110)
+    parser.add_argument("--stop-loss", type=float, default=0.99)
+    args = parser.parse_args()
+
+    monitor = CrossoverMonitor(args.sma, args.wma, args.stop_loss)
+    app = HistoricalDataApp(args.symbol, monitor=monitor)
+    app.connect("127.0.0.1", args.port, clientId=1)
+    Thread(target=run_loop, args=(app,), daemon=True).start()
+    app.connected.wait()
+
+    app.requests[1] = args.symbol
+    # keepUpToDate needs an empty endDateTime; two days are enough to warm up the WMA
+    app.reqHistoricalData(reqId=1, contract=make_contract(args.symbol), endDateTime="", durationStr="2 D",
+                          barSizeSetting="1 min", whatToShow="TRADES", useRTH=0, formatDate=1,
+                          keepUpToDate=True, chartOptions=[])
+    try:
+        while True:
+            time.sleep(60)
+            print(monitor.latency_report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.cancelHistoricalData(1)
+        app.writer.close()
+        app.disconnect()
+        print(monitor.latency_report())
@@ -0,0 +1,94 @@
+import argparse
+import glob
+import os
+from datetime import date
+
+import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def _statements(path):
+    with open(path) as f:
+        lines = [line for line in f if not line.lstrip().startswith("--")]
+    return [statement.strip() for statement in "".join(lines).split(";") if statement.strip()]
+
+
+def applied(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(255) PRIMARY KEY,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT name FROM schema_migrations")
+    return {name for (name,) in cursor.fetchall()}
+
+
+def migrate():
+    """Apply migrations/*.sql that are not recorded in schema_migrations, in name order."""
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        done = applied(cursor)
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+            name = os.path.basename(path)
+            if name in done:
+                continue
+            print(f"Applying {name}")
+            for statement in _statements(path):
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (name) VALUES (?)", (name,))
+            conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def _month_start(day, months=0):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_by_month(months_ahead=3):
+    """Range-partition historical_data by month of datetime.
+
+    One partition per month from the first stored bar to months_ahead months
+    from now, plus a catch-all; a range query then only opens the months it
+    covers. Run it again later to add partitions for new months.
+    """
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(datetime) FROM historical_data")
+        first = cursor.fetchone()[0]
+        first = first.date() if first else date.today()
+        month, last = _month_start(first), _month_start(date.today(), months_ahead)
+
+        partitions = []
+        while month <= last:
+            upper = _month_start(month, 1)
+            partitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{upper:%Y-%m-%d}')")
+            month = upper
+        partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+
+        # Repartitioning rewrites the table, the primary key includes datetime as required
+        cursor.execute("ALTER TABLE historical_data PARTITION BY RANGE COLUMNS(datetime) (\n    "
+                       + ",\n    ".join(partitions) + "\n)")
+        conn.commit()
+        cursor.close()
+        print(f"historical_data: {len(partitions)} partitions")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schema migrations for the analysis database")
+    parser.add_argument("--partition", action="store_true",
+                        help="also (re)partition historical_data by month")
+    parser.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    migrate()
+    if args.partition:
+        partition_by_month(args.months_ahead)
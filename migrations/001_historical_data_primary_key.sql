@@ -0,0 +1,23 @@
+-- Rebuild historical_data with a clustered (symbol, datetime) primary key.
+-- InnoDB stores rows in primary key order, so all bars of a symbol in a time
+-- range are one contiguous range scan, whatever else the table holds.
+-- The old table is kept as historical_data_old until checked and dropped by hand.
+
+CREATE TABLE historical_data_new (
+    symbol   VARCHAR(16) NOT NULL,
+    datetime DATETIME    NOT NULL,
+    open     DOUBLE      NOT NULL,
+    high     DOUBLE      NOT NULL,
+    low      DOUBLE      NOT NULL,
+    close    DOUBLE      NOT NULL,
+    volume   BIGINT      NOT NULL,
+    PRIMARY KEY (symbol, datetime)
+) ENGINE = InnoDB;
+
+INSERT INTO historical_data_new (symbol, datetime, open, high, low, close, volume)
+SELECT symbol, datetime, open, high, low, close, volume FROM historical_data
+ON DUPLICATE KEY UPDATE
+    open=VALUES(open), high=VALUES(high),
+    low=VALUES(low), close=VALUES(close), volume=VALUES(volume);
+
+RENAME TABLE historical_data TO historical_data_old, historical_data_new TO historical_data;
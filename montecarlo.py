@@ -0,0 +1,155 @@
+import argparse
+import time
+
+import numpy as np
+
+import profiling
+from stats import max_drawdown
+
+METHODS = ("bootstrap", "permutation")
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+# Paths simulated at once: a chunk takes about 40 bytes * CHUNK_PATHS * trades
+CHUNK_PATHS = 10_000
+
+
+def trade_returns(trades):
+    """Returns of the closed trades of a trades list (entry_price/exit_price dicts), open ones are skipped."""
+    closed = [trade for trade in trades if trade.get("exit_price") is not None]
+    entry = np.array([trade["entry_price"] for trade in closed], dtype=np.float64)
+    exit_ = np.array([trade["exit_price"] for trade in closed], dtype=np.float64)
+    return (exit_ - entry) / entry
+
+
+def _longest_runs(flags):
+    """Longest run of True in every row of a 2-D boolean array."""
+    counts = np.cumsum(flags, axis=1, dtype=np.int32)
+    # the count reached at the last False before each position, subtracted to restart the run there
+    resets = np.where(flags, 0, counts)
+    np.maximum.accumulate(resets, axis=1, out=resets)
+    counts -= resets
+    return counts.max(axis=1)
+
+
+def _paths(returns, equity, initial_deposit):
+    """final deposit, max drawdown and longest loss streak of every row of a returns matrix.
+
+    equity is scratch space of the same shape.
+    """
+    np.add(returns, 1.0, out=equity)
+    np.cumprod(equity, axis=1, out=equity)
+    equity *= initial_deposit
+    final = equity[:, -1].copy()
+    # peaks include the initial deposit, like the equity curve of stats.trade_stats
+    peaks = np.maximum.accumulate(equity, axis=1)
+    np.maximum(peaks, initial_deposit, out=peaks)
+    np.subtract(peaks, equity, out=equity)
+    equity /= peaks
+    drawdown = equity.max(axis=1)
+    return final, drawdown, _longest_runs(returns < 0.0)
+
+
+@profiling.profiled("montecarlo")
+def simulate(returns, paths=10_000, method="bootstrap", initial_deposit=7000, seed=None, chunk_paths=CHUNK_PATHS):
+    """Resampled equity paths of a sequence of trade returns.
+
+    method="bootstrap" draws every path's trades with replacement,
+    "permutation" shuffles the actual trades, so only their order changes.
+    The whole deposit goes into each trade (like stats.compound). Paths are
+    computed chunk_paths at a time as one (chunk_paths, trades) matrix, which
+    bounds the memory. Returns arrays of paths values: final_deposit,
+    max_drawdown and longest_loss_streak (a trade with return < 0 is lost).
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown method {method!r}, expected one of {METHODS}")
+    returns = np.asarray(returns, dtype=np.float64)
+    n = len(returns)
+    result = {
+        "final_deposit": np.full(paths, float(initial_deposit)),
+        "max_drawdown": np.zeros(paths),
+        "longest_loss_streak": np.zeros(paths, dtype=np.int64),
+    }
+    if n == 0 or paths == 0:
+        return result
+
+    rng = np.random.default_rng(seed)
+    chunk_paths = max(1, min(chunk_paths, paths))
+    equity = np.empty((chunk_paths, n))
+    for lo in range(0, paths, chunk_paths):
+        rows = min(chunk_paths, paths - lo)
+        if method == "bootstrap":
+            sample = returns[rng.integers(0, n, size=(rows, n))]
+        else:
+            sample = rng.permuted(np.broadcast_to(returns, (rows, n)), axis=1)
+        final, drawdown, streak = _paths(sample, equity[:rows], initial_deposit)
+        result["final_deposit"][lo:lo + rows] = final
+        result["max_drawdown"][lo:lo + rows] = drawdown
+        result["longest_loss_streak"][lo:lo + rows] = streak
+    return result
+
+
+def distribution(values, percentiles=PERCENTILES):
+    """Mean and percentiles of simulated values."""
+    values = np.asarray(values)
+    return {"mean": float(values.mean()), **{f"p{p}": float(v) for p, v in
+                                             zip(percentiles, np.percentile(values, percentiles))}}
+
+
+def robustness(returns, paths=10_000, method="bootstrap", initial_deposit=7000, seed=None,
+               chunk_paths=CHUNK_PATHS, percentiles=PERCENTILES):
+    """simulate() summarized: the distribution of every metric next to its value on the actual sequence.
+
+    probability_of_loss is the share of paths that end below the initial deposit.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    samples = simulate(returns, paths, method, initial_deposit, seed, chunk_paths)
+    equity = initial_deposit * np.cumprod(np.concatenate(([1.0], 1.0 + returns)))
+    actual = {
+        "final_deposit": float(equity[-1]),
+        "max_drawdown": max_drawdown(equity),
+        "longest_loss_streak": int(_longest_runs((returns < 0.0)[np.newaxis])[0]) if len(returns) else 0,
+    }
+    return {
+        "method": method,
+        "paths": paths,
+        "trades": len(returns),
+        "probability_of_loss": float((samples["final_deposit"] < initial_deposit).mean()),
+        **{name: {"actual": actual[name], **distribution(values, percentiles)} for name, values in samples.items()},
+    }
+
+
+def format_report(report):
+    """Text table of a robustness() report."""
+    names = [key for key in report if isinstance(report[key], dict)]
+    columns = list(report[names[0]])
+    lines = [f"{report['method']}: {report['paths']} paths of {report['trades']} trades, "
+             f"probability of loss {report['probability_of_loss']:.2%}",
+             f"{'':<20}" + "".join(f"{column:>12}" for column in columns)]
+    for name in names:
+        lines.append(f"{name:<20}" + "".join(f"{report[name][column]:>12.4g}" for column in columns))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap / permutation robustness of the crossover trades")
+    parser.add_argument("--symbol", default="RGTI")
+    parser.add_argument("--synthetic", type=int, default=None, metavar="TRADES",
+                        help="random trade returns instead of the symbol's backtest")
+    parser.add_argument("--paths", type=int, default=100_000)
+    parser.add_argument("--method", choices=METHODS, default="bootstrap")
+    parser.add_argument("--chunk-paths", type=int, default=CHUNK_PATHS)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trade_list_returns = np.random.default_rng(0).normal(0.0005, 0.01, args.synthetic)
+    else:
+        from test_strategy import calculate_moving_averages, fetch_historical_data, iterative_backtest
+        bars = calculate_moving_averages(fetch_historical_data(args.symbol), args.symbol)
+        trade_list = []
+        iterative_backtest(bars.dropna().reset_index(drop=True), trade_list)
+        trade_list_returns = trade_returns(trade_list)
+
+    started = time.perf_counter()
+    result = robustness(trade_list_returns, args.paths, args.method, seed=args.seed, chunk_paths=args.chunk_paths)
+    print(format_report(result))
+    print(f"{time.perf_counter() - started:.2f}s")
@@ -0,0 +1,207 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# Profiling of a script run is switched on from the environment:
+#   PIPELINE_PROFILE=profile.json           stage timers and counters
+#   PIPELINE_PROFILE_CAPTURE=cprofile       plus the top functions by cumulative time
+#   PIPELINE_PROFILE_CAPTURE=tracemalloc    plus the peak and the top allocation sites
+PROFILE_ENV = "PIPELINE_PROFILE"
+CAPTURE_ENV = "PIPELINE_PROFILE_CAPTURE"
+CAPTURES = ("cprofile", "tracemalloc")
+TOP = 30
+
+# The active Profile, None when profiling is off: every hook checks this first
+_active = None
+
+
+class Profile:
+    """Stage timings and counters of one run.
+
+    Stages nest: a stage entered inside another one is recorded as
+    "outer/inner". Stages may be entered from several threads.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _path(self, name):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return "/".join(stack + [name]), stack
+
+    def add_time(self, path, seconds):
+        with self.lock:
+            stage = self.stages.get(path)
+            if stage is None:
+                stage = self.stages[path] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+            stage["max_seconds"] = max(stage["max_seconds"], seconds)
+
+    def add_count(self, name, n):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        wall = time.perf_counter() - self.start
+        return {
+            "name": self.name,
+            "started": self.started,
+            "wall_seconds": wall,
+            "stages": dict(sorted(self.stages.items())),
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+class _Stage:
+    __slots__ = ("profile", "name", "path", "stack", "start")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.path, self.stack = self.profile._path(self.name)
+        self.stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add_time(self.path, time.perf_counter() - self.start)
+        self.stack.pop()
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Context manager timing a stage of the active profile, a shared no-op when profiling is off."""
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name)
+
+
+def profiled(name):
+    """Decorator form of stage()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _Stage(_active, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    """Add n to a counter of the active profile (bars received, rows written...)."""
+    if _active is not None:
+        _active.add_count(name, n)
+
+
+def enabled():
+    return _active is not None
+
+
+class run:
+    """Profile everything inside the with block and write the report as JSON to output.
+
+    capture adds "cprofile" (top functions by cumulative time) or
+    "tracemalloc" (peak traced memory and top allocation sites) to the report.
+    After the block the report is also available as .report.
+    """
+
+    def __init__(self, name, output=None, capture=None):
+        if capture not in (None,) + CAPTURES:
+            raise ValueError(f"unknown capture {capture!r}, expected one of {CAPTURES}")
+        self.name = name
+        self.output = output
+        self.capture = capture
+        self.report = None
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError(f"profile {_active.name!r} is already running")
+        self.profile = _active = Profile(self.name)
+        if self.capture == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.capture == "tracemalloc":
+            tracemalloc.start()
+        return self.profile
+
+    def __exit__(self, *exc):
+        global _active
+        report = self.profile.report()
+        if self.capture == "cprofile":
+            self.profiler.disable()
+            report["cprofile"] = _top_functions(self.profiler)
+        elif self.capture == "tracemalloc":
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report["tracemalloc"] = {
+                "peak_mb": peak / 2 ** 20,
+                "top": [{"site": str(stat.traceback), "mb": stat.size / 2 ** 20, "blocks": stat.count}
+                        for stat in snapshot.statistics("lineno")[:TOP]],
+            }
+        _active = None
+        self.report = report
+        if self.output:
+            with open(self.output, "w") as f:
+                json.dump(report, f, indent=2)
+        return False
+
+
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (file, line, func), (calls, _, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(file)}:{line}({func})", "calls": calls,
+                     "own_seconds": own, "cumulative_seconds": cumulative})
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:TOP]
+
+
+class _NullRun:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+def run_from_env(name):
+    """run() configured by PIPELINE_PROFILE / PIPELINE_PROFILE_CAPTURE, a no-op when they are unset."""
+    output = os.environ.get(PROFILE_ENV)
+    if not output:
+        return _NullRun()
+    return run(name, output, os.environ.get(CAPTURE_ENV) or None)
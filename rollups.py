@@ -0,0 +1,152 @@
+import argparse
+
+import numpy as np
+
+import bar_cache
+import profiling
+from bars import COLUMNS, empty_columns
+
+# Bucket size of every timeframe in seconds. Intraday buckets are aligned to
+# the 9:30 session open (9:30-10:30, 10:30-11:30, ... and 8:30-9:30 before
+# it), a daily bucket is a calendar day. Bars are labeled with their start,
+# like the minute bars from TWS, except daily bars: they are labeled with the
+# 9:30 open of their day, so RTH filters (sessions.in_rth) keep them.
+TIMEFRAMES = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "15m": 15 * 60,
+    "1h": 60 * 60,
+    "1d": 24 * 60 * 60,
+}
+ROLLUPS = ("5m", "15m", "1h", "1d")
+SESSION_OPEN = 9 * 3600 + 30 * 60
+# Stored in the rollup metadata, rollups of another format are rebuilt
+# (1: daily bars labeled 00:00)
+FORMAT = 2
+
+
+def _check_timeframe(timeframe):
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"unknown timeframe {timeframe!r}, expected one of {tuple(TIMEFRAMES)}")
+
+
+def bucket_starts(times, timeframe):
+    """Start (epoch seconds) of the timeframe bucket of every minute in times."""
+    _check_timeframe(timeframe)
+    times = np.asarray(times, dtype=np.int64)
+    seconds = TIMEFRAMES[timeframe]
+    days = times - times % 86400
+    if seconds == 86400:
+        return days
+    # floor division also aligns the pre-market buckets to the 9:30 grid
+    open_ = days + SESSION_OPEN
+    return open_ + (times - open_) // seconds * seconds
+
+
+def bucket_labels(starts, timeframe):
+    """Datetime of the bars of the buckets starting at starts."""
+    return starts + SESSION_OPEN if TIMEFRAMES[timeframe] == 86400 else starts
+
+
+def rollup(bars, timeframe):
+    """OHLCV bars of timeframe from minute bars (column arrays in time order).
+
+    open/close are those of the first/last minute of a bucket, high/low the
+    extremes and volume the sum. Buckets without minutes are not emitted,
+    the last bucket may be incomplete.
+    """
+    times = np.asarray(bars["datetime"], dtype=np.int64)
+    if not len(times):
+        return empty_columns()
+    keys = bucket_starts(times, timeframe)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys)) - 1
+    return {
+        "datetime": bucket_labels(keys[starts], timeframe),
+        "open": np.asarray(bars["open"])[starts],
+        "high": np.maximum.reduceat(np.asarray(bars["high"]), starts),
+        "low": np.minimum.reduceat(np.asarray(bars["low"]), starts),
+        "close": np.asarray(bars["close"])[ends],
+        "volume": np.add.reduceat(np.asarray(bars["volume"]), starts),
+    }
+
+
+def cache_name(symbol, timeframe):
+    """Name of the rollup of symbol in the bar cache directory, next to its minute bars."""
+    return f"{symbol}@{timeframe}"
+
+
+@profiling.profiled("rollups")
+def sync_rollups(symbol, timeframes=ROLLUPS, cache_dir=bar_cache.CACHE_DIR):
+    """Bring the rollups of symbol up to date with its cached minute bars.
+
+    The minute bars must be synced (bar_cache.sync) beforehand. A rollup
+    remembers the bar cache version it was built from; when the bars have
+    changed since, the buckets before the first changed minute are kept and
+    only the rest is aggregated again, so appended minutes cost as much as
+    their own buckets. Returns {timeframe: buckets aggregated}.
+    """
+    bars, bar_meta = bar_cache.read_cache(symbol, cache_dir)
+    if bars is None:
+        raise KeyError(f"no cached bars for {symbol}, run bar_cache.sync() first")
+    times = bars["datetime"]
+    rows = len(times)
+
+    aggregated = {}
+    for timeframe in timeframes:
+        _check_timeframe(timeframe)
+        if timeframe == "1m":
+            continue
+        name = cache_name(symbol, timeframe)
+        cached, meta = bar_cache.read_cache(name, cache_dir)
+        valid = 0
+        if cached is not None and meta.get("format") == FORMAT:
+            valid = bar_cache.unchanged_rows(bar_meta, times, meta["bar_version"], meta["bar_rows"],
+                                             meta["last_datetime"])
+            if valid == rows and meta["bar_rows"] == rows:
+                aggregated[timeframe] = 0
+                continue
+
+        if valid:
+            # the bucket of the last unchanged minute may have lost or gained
+            # minutes after it, everything before that bucket is final
+            first = int(bucket_starts(times[valid - 1:valid], timeframe)[0])
+            keep = int(np.searchsorted(cached["datetime"], bucket_labels(first, timeframe)))
+            lo = int(np.searchsorted(times, first))
+            fresh = rollup({column: bars[column][lo:] for column in COLUMNS}, timeframe)
+            result = {column: np.concatenate([cached[column][:keep], fresh[column]]) for column in COLUMNS}
+        else:
+            fresh = result = rollup(bars, timeframe)
+
+        bar_cache.write_cache(name, result, {
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "format": FORMAT,
+            "rows": len(result["datetime"]),
+            "bar_version": bar_meta["version"],
+            "bar_rows": rows,
+            "last_datetime": int(times[-1]) if rows else None,
+        }, cache_dir)
+        aggregated[timeframe] = len(fresh["datetime"])
+    return aggregated
+
+
+def read_rollup(symbol, timeframe, cache_dir=bar_cache.CACHE_DIR):
+    """Rollup of symbol as memory-mapped column arrays, as last written by sync_rollups()."""
+    _check_timeframe(timeframe)
+    name = symbol if timeframe == "1m" else cache_name(symbol, timeframe)
+    bars, _ = bar_cache.read_cache(name, cache_dir)
+    if bars is None:
+        raise KeyError(f"no cached {timeframe} bars for {symbol}")
+    return bars
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the bar cache and the rollups of symbols")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--timeframes", nargs="+", choices=ROLLUPS, default=list(ROLLUPS))
+    args = parser.parse_args()
+
+    for sym in args.symbols:
+        fetched = bar_cache.sync(sym)
+        print(f"{sym}: {fetched} minute bars fetched, buckets aggregated: {sync_rollups(sym, args.timeframes)}")
@@ -0,0 +1,139 @@
+import functools
+import math
+import os
+
+import numpy as np
+
+import bar_cache
+
+# Parts of a trading day of the naive exchange-local bar times (useRTH=0
+# brings all of them). RTH is 9:30:00-16:00:00 with both ends included, the
+# same check as MyStrategy, so the 16:00 bar belongs to it; bars before 9:30
+# are pre-market and bars after 16:00 post-market.
+PRE, RTH, POST = 0, 1, 2
+SESSIONS = {"pre": PRE, "rth": RTH, "post": POST}
+RTH_OPEN = 9 * 3600 + 30 * 60
+RTH_CLOSE = 16 * 3600
+
+SESSION_FILE = "sessions.npz"
+
+
+def segments(times):
+    """PRE/RTH/POST code (int8) of every bar time (epoch seconds or datetime64)."""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        times = times.astype("datetime64[s]").astype(np.int64)
+    seconds = times % 86400
+    return (seconds >= RTH_OPEN).view(np.int8) + (seconds > RTH_CLOSE).view(np.int8)
+
+
+def seconds_of_day(num):
+    """Seconds since midnight of a backtrader date number, whole seconds like the bar times."""
+    return round((num - math.floor(num)) * 86400.0)
+
+
+def in_rth(num):
+    """Whether a backtrader date number is inside RTH, without building a datetime."""
+    return RTH_OPEN <= seconds_of_day(num) <= RTH_CLOSE
+
+
+class SessionIndex:
+    """Days and sessions of a sorted series of bar times, as row offsets.
+
+    days           - epoch seconds of every calendar day with bars
+    offsets        - row where every (day, session) starts: day d's session
+                     s is rows offsets[3 * d + s]:offsets[3 * d + s + 1] and
+                     the whole day offsets[3 * d]:offsets[3 * d + 3]
+    segment        - PRE/RTH/POST code of every bar
+    bar_of_session - position of every bar within its day's session
+    Slicing a day or a session is two lookups, whatever the history length.
+    """
+
+    def __init__(self, days, offsets, segment, bar_of_session):
+        self.days = days
+        self.offsets = offsets
+        self.segment = segment
+        self.bar_of_session = bar_of_session
+
+    @classmethod
+    def from_times(cls, times):
+        times = np.asarray(times)
+        if np.issubdtype(times.dtype, np.datetime64):
+            times = times.astype("datetime64[s]").astype(np.int64)
+        times = times.astype(np.int64, copy=False)
+        n = len(times)
+        segment = segments(times)
+        day = times - times % 86400
+        new_day = np.ones(n, dtype=bool)
+        new_day[1:] = day[1:] != day[:-1]
+        day_rows = np.flatnonzero(new_day)
+        # (day number, session) increases along the rows, so the start of
+        # every pair is a binary search
+        key = (np.cumsum(new_day) - 1) * 3 + segment
+        offsets = np.searchsorted(key, np.arange(len(day_rows) * 3 + 1))
+        bar_of_session = (np.arange(n) - offsets[key]).astype(np.int32)
+        return cls(day[day_rows], offsets, segment, bar_of_session)
+
+    def __len__(self):
+        return len(self.days)
+
+    def day(self, d):
+        """Rows of day number d (negative counts from the end)."""
+        d = range(len(self.days))[d]
+        return slice(int(self.offsets[3 * d]), int(self.offsets[3 * d + 3]))
+
+    def session(self, d, session="rth"):
+        """Rows of one session ("pre", "rth", "post") of day number d."""
+        d = range(len(self.days))[d]
+        s = 3 * d + SESSIONS[session]
+        return slice(int(self.offsets[s]), int(self.offsets[s + 1]))
+
+    def day_of(self, time):
+        """Day number of a datetime-like, or -1 without bars that day."""
+        seconds = int(np.datetime64(time, "s").astype(np.int64))
+        d = int(np.searchsorted(self.days, seconds - seconds % 86400))
+        return d if d < len(self.days) and self.days[d] == seconds - seconds % 86400 else -1
+
+    def mask(self, session):
+        """Boolean mask of the bars of a session, "pre", "rth" or "post"."""
+        return getattr(self, session)
+
+    @functools.cached_property
+    def pre(self):
+        return self.segment == PRE
+
+    @functools.cached_property
+    def rth(self):
+        return self.segment == RTH
+
+    @functools.cached_property
+    def post(self):
+        return self.segment == POST
+
+    def save(self, path, version=None):
+        # written next to the target and renamed, readers never see half a file
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, days=self.days, offsets=self.offsets, segment=self.segment,
+                     bar_of_session=self.bar_of_session, version=-1 if version is None else version)
+        os.replace(path + ".tmp", path)
+
+
+def load_sessions(symbol, cache_dir=bar_cache.CACHE_DIR):
+    """SessionIndex of the cached bars of symbol, computed once per cache version.
+
+    It is stored in the symbol's bar cache directory, which a sync replaces,
+    so it never outlives the bars it describes.
+    """
+    bars, meta = bar_cache.read_cache(symbol, cache_dir)
+    if bars is None:
+        raise KeyError(f"no cached bars for {symbol}, run bar_cache.sync() first")
+    path = os.path.join(cache_dir, symbol, SESSION_FILE)
+    try:
+        with np.load(path) as stored:
+            if int(stored["version"]) == meta["version"] and len(stored["segment"]) == len(bars["datetime"]):
+                return SessionIndex(stored["days"], stored["offsets"], stored["segment"], stored["bar_of_session"])
+    except (OSError, KeyError, ValueError):
+        pass
+    index = SessionIndex.from_times(bars["datetime"])
+    index.save(path, meta["version"])
+    return index
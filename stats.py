@@ -0,0 +1,111 @@
+import numpy as np
+
+import profiling
+
+SECONDS_PER_YEAR = 365.25 * 86400
+
+
+def compound(entry_price, exit_price, initial_deposit=7000):
+    """Deposit after every trade when the whole deposit goes into each one.
+
+    Returns the per-trade returns and the equity curve; equity[0] is the
+    initial deposit and equity[i] the deposit after trade i - 1, multiplied
+    in the same order as the deposit *= (1 + trade_return) loop.
+    """
+    entry_price = np.asarray(entry_price, dtype=np.float64)
+    exit_price = np.asarray(exit_price, dtype=np.float64)
+    returns = (exit_price - entry_price) / entry_price
+    factors = np.empty(len(returns) + 1)
+    factors[0] = initial_deposit
+    factors[1:] = 1 + returns
+    return returns, np.cumprod(factors)
+
+
+def _sequential_sum(values):
+    # the same order of additions as a += loop, so totals match TradeAnalyzer exactly
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+def longest_run(flags):
+    """Length of the longest run of True in a boolean array."""
+    flags = np.asarray(flags, dtype=bool)
+    if not flags.any():
+        return 0
+    # run boundaries: +1 where a run starts, -1 one past where it ends
+    edges = np.diff(np.concatenate(([0], flags.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return int((ends - starts).max())
+
+
+def max_drawdown(equity):
+    """Largest fall from a running peak of the equity curve, as a fraction of the peak."""
+    equity = np.asarray(equity, dtype=np.float64)
+    if not len(equity):
+        return 0.0
+    peaks = np.maximum.accumulate(equity)
+    return float(((peaks - equity) / peaks).max())
+
+
+@profiling.profiled("trade_stats")
+def trade_stats(pnl, initial_deposit=7000, entry_time=None, exit_time=None, start=None, end=None):
+    """Statistics of closed trades given their profit/loss in money.
+
+    The keys of test_backtrader.summarize() follow TradeAnalyzer's rules: a
+    trade with pnl >= 0 is won, longest_loss_streak is the longest run of
+    lost trades and risk_reward is the average won pnl over the average lost
+    one. On top of those:
+      max_drawdown - of the equity after each trade
+      sharpe       - mean / std of the per-trade returns, annualized by the
+                     number of trades per year when times are given
+      exposure     - share of [start, end] spent in a position
+    Times are datetime64 arrays (start/end default to the first entry and the
+    last exit).
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    n = len(pnl)
+    equity = np.empty(n + 1)
+    equity[0] = initial_deposit
+    np.cumsum(pnl, out=equity[1:])
+    equity[1:] += initial_deposit
+    final_deposit = float(equity[-1])
+
+    lost = pnl < 0.0
+    losses = int(np.count_nonzero(lost))
+    wins = n - losses
+    won_total = _sequential_sum(pnl[~lost])
+    lost_total = _sequential_sum(pnl[lost])
+    won_avg = won_total / wins if wins else 0.0
+    lost_avg = lost_total / losses if losses else 0.0
+
+    returns = pnl / equity[:-1]
+    std = returns.std(ddof=1) if n > 1 else 0.0
+    sharpe = float(returns.mean() / std) if std > 0 else 0.0
+
+    exposure = None
+    if entry_time is not None and exit_time is not None and n:
+        entry_time = np.asarray(entry_time, dtype="datetime64[s]").astype(np.int64)
+        exit_time = np.asarray(exit_time, dtype="datetime64[s]").astype(np.int64)
+        first = np.datetime64(start, "s").astype(np.int64) if start is not None else entry_time.min()
+        last = np.datetime64(end, "s").astype(np.int64) if end is not None else exit_time.max()
+        span = last - first
+        if span > 0:
+            exposure = float((exit_time - entry_time).sum() / span)
+            sharpe *= float(np.sqrt(n / (span / SECONDS_PER_YEAR)))
+
+    return {
+        "initial_deposit": initial_deposit,
+        "final_deposit": final_deposit,
+        "profitability": final_deposit / initial_deposit - 1,
+        "trades": n,
+        "longest_loss_streak": longest_run(lost),
+        "risk_reward": won_avg / (-1 * lost_avg) if lost_avg else 0.0,
+        "winrate": wins / n if n else 0.0,
+        "wins": wins,
+        "losses": losses,
+        "won_total": won_total,
+        "lost_total": lost_total,
+        "max_drawdown": max_drawdown(equity),
+        "sharpe": sharpe,
+        "exposure": exposure,
+    }
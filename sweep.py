@@ -0,0 +1,213 @@
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import indicator_cache
+from test_backtrader import AllInSizer, MyStrategy, build_cerebro, fetch_historical_data, strategy_signals, summarize
+
+COLUMNS = ("datetime", "open", "high", "low", "close", "volume")
+
+# Bars attached from shared memory, column arrays per worker process
+_worker_bars = None
+_worker_shm = None
+# Moving averages from the IndicatorCache of the parent, attached the same way (or None)
+_worker_ma = None
+_worker_ma_shm = None
+
+
+def param_grid(**values):
+    """All combinations of the given parameter lists as a list of dicts."""
+    keys = list(values)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(values[k] for k in keys))]
+
+
+def _run_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def share_bars(df):
+    """Copy the OHLCV columns of df into one shared memory block.
+
+    Returns (shm, spec): spec is what workers need to attach to it.
+    The caller owns shm and must close() and unlink() it.
+    """
+    n = len(df)
+    shm = shared_memory.SharedMemory(create=True, size=max(len(COLUMNS) * n * 8, 1))
+    block = np.ndarray((len(COLUMNS), n), dtype=np.float64, buffer=shm.buf)
+    block.view(np.int64)[0] = df["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    for row, column in enumerate(COLUMNS[1:], start=1):
+        block[row] = df[column].to_numpy(dtype=np.float64)
+    return shm, {"name": shm.name, "bars": n}
+
+
+def attach_bars(spec):
+    """Attach to a block made by share_bars(), returns (shm, column arrays backed by it)."""
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    block = np.ndarray((len(COLUMNS), spec["bars"]), dtype=np.float64, buffer=shm.buf)
+    # ArrayData reads the shared block directly, nothing is copied per worker
+    columns = {"datetime": block.view(np.int64)[0].view("datetime64[ns]")}
+    for row, column in enumerate(COLUMNS[1:], start=1):
+        columns[column] = block[row]
+    return shm, columns
+
+
+def share_series(series):
+    """Copy a dict of equally long float64 series (e.g. moving averages) into one shared memory block.
+
+    Returns (shm, spec) like share_bars(), the caller owns shm.
+    """
+    keys = list(series)
+    n = len(series[keys[0]]) if keys else 0
+    shm = shared_memory.SharedMemory(create=True, size=max(len(keys) * n * 8, 1))
+    block = np.ndarray((len(keys), n), dtype=np.float64, buffer=shm.buf)
+    for row, key in enumerate(keys):
+        block[row] = series[key]
+    return shm, {"name": shm.name, "keys": keys, "rows": n}
+
+
+def attach_series(spec):
+    """Attach to a block made by share_series(), returns (shm, {key: array backed by it})."""
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    block = np.ndarray((len(spec["keys"]), spec["rows"]), dtype=np.float64, buffer=shm.buf)
+    return shm, {key: block[row] for row, key in enumerate(spec["keys"])}
+
+
+def cached_averages(symbol, df, grid):
+    """SMA/WMA series of every period of grid for the bars of df from the IndicatorCache of symbol.
+
+    df must be a slice of the cached bars of symbol (fetch_historical_data()),
+    the series keep the values warmed up on the bars before it.
+    """
+    return indicator_cache.default_cache().moving_averages(
+        symbol,
+        sma_periods=sorted({p.get("sma_period", MyStrategy.params.sma_period) for p in grid}),
+        wma_periods=sorted({p.get("wma_period", MyStrategy.params.wma_period) for p in grid}),
+        times=df["datetime"].to_numpy())
+
+
+def _attach(spec, ma_spec=None):
+    global _worker_bars, _worker_shm, _worker_ma, _worker_ma_shm
+    _worker_shm, _worker_bars = attach_bars(spec)
+    if ma_spec is not None:
+        _worker_ma_shm, _worker_ma = attach_series(ma_spec)
+
+
+def _split_params(params):
+    strategy_params, sizer_params, extra = {}, {}, {}
+    strategy_names = MyStrategy.params._getkeys()
+    sizer_names = AllInSizer.params._getkeys()
+    for key, value in params.items():
+        if key in strategy_names:
+            strategy_params[key] = value
+        elif key in sizer_names:
+            sizer_params[key] = value
+        elif key == "cash":
+            extra[key] = value
+        else:
+            raise ValueError(f"unknown sweep parameter: {key}")
+    return strategy_params, sizer_params, extra
+
+
+def run_one(params, fast=False):
+    """Run one backtest on the worker's bars, return params + metrics."""
+    strategy_params, sizer_params, extra = _split_params(params)
+    signals = None
+    if fast and _worker_ma is not None:
+        signals = strategy_signals(_worker_bars,
+                                   strategy_params.get("sma_period", MyStrategy.params.sma_period),
+                                   strategy_params.get("wma_period", MyStrategy.params.wma_period), ma=_worker_ma)
+    cerebro = build_cerebro(_worker_bars, stdstats=False, sizer_params=sizer_params, fast=fast, signals=signals,
+                            **extra, **strategy_params)
+    results = cerebro.run(maxcpus=1)
+    return {**params, **summarize(cerebro, results)}
+
+
+def load_results(path):
+    """Completed runs from a results file.
+
+    A sweep killed mid-write leaves a truncated last line, it is dropped from
+    the file so new results are appended after the last complete one.
+    """
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path) as f:
+        lines = f.readlines()
+    for line in lines:
+        try:
+            rows.append(json.loads(line))
+        except json.JSONDecodeError:
+            break
+    if len(rows) != len(lines) or (lines and not lines[-1].endswith("\n")):
+        with open(path, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+    return rows
+
+
+def run_sweep(df, grid, results_path, processes=None, fast=False, symbol=None):
+    """Run MyStrategy for every parameter set of grid on a process pool.
+
+    Each finished run is appended to results_path (JSON lines) right away,
+    runs already in the file are skipped, so an interrupted sweep resumes
+    where it stopped. Returns all results as a DataFrame.
+    fast=True runs FastStrategy on precomputed signals, with the same results.
+    With symbol (df are its cached bars) the signals of fast=True are made
+    from the moving averages of the IndicatorCache, read once by this process
+    and shared with the workers like the bars.
+    """
+    done = load_results(results_path)
+    param_keys = set().union(*grid) if grid else set()
+    done_keys = {_run_key({k: row[k] for k in param_keys if k in row}) for row in done}
+    todo = [params for params in grid if _run_key(params) not in done_keys]
+    for params in todo:
+        _split_params(params)  # fail on a typo before starting the pool
+
+    if todo:
+        print(f"Sweep: {len(todo)} runs to do, {len(grid) - len(todo)} already done.")
+        shm, spec = share_bars(df)
+        ma_shm, ma_spec = share_series(cached_averages(symbol, df, todo)) if fast and symbol else (None, None)
+        try:
+            processes = min(processes or os.cpu_count(), len(todo))
+            with mp.Pool(processes, initializer=_attach, initargs=(spec, ma_spec)) as pool, \
+                    open(results_path, "a") as out:
+                for i, row in enumerate(pool.imap_unordered(partial(run_one, fast=fast), todo), start=1):
+                    out.write(json.dumps(row) + "\n")
+                    out.flush()
+                    if i % 10 == 0 or i == len(todo):
+                        print(f"Sweep: {i}/{len(todo)} runs done.")
+        finally:
+            shm.close()
+            shm.unlink()
+            if ma_shm is not None:
+                ma_shm.close()
+                ma_shm.unlink()
+
+    return pd.DataFrame(load_results(results_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parameter sweep for MyStrategy")
+    parser.add_argument("--symbol", default="RGTI")
+    parser.add_argument("--sma", type=int, nargs="+", default=[10])
+    parser.add_argument("--wma", type=int, nargs="+", default=[110])
+    parser.add_argument("--stop-loss", type=float, nargs="+", default=[0.99])
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--out", default=None, help="results file, default sweep_<symbol>.jsonl")
+    parser.add_argument("--fast", action="store_true", help="run FastStrategy on precomputed signals")
+    args = parser.parse_args()
+
+    bars = fetch_historical_data(args.symbol)
+    sweep_grid = param_grid(sma_period=args.sma, wma_period=args.wma, stop_loss=args.stop_loss)
+    table = run_sweep(bars, sweep_grid, args.out or f"sweep_{args.symbol}.jsonl", args.processes,
+                      args.fast, args.symbol)
+
+    pd.set_option("display.max_columns", None)
+    pd.set_option("display.width", 1200)
+    print(table.sort_values("final_deposit", ascending=False).to_string(index=False))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+# Extended session as requested from TWS with useRTH=0: 4:00 - 20:00
+SESSION_START_MINUTE = 4 * 60
+BARS_PER_DAY = 16 * 60
+
+
+def minute_bars(n, seed=0, start="2024-01-02", price=20.0, volatility=0.001):
+    """Deterministic random-walk minute bars shaped like historical_data.
+
+    Returns a DataFrame with datetime, open, high, low, close, volume:
+    BARS_PER_DAY bars per business day from 4:00, the same seed and n always
+    give the same frame.
+    """
+    rng = np.random.default_rng(seed)
+
+    days = pd.bdate_range(start=start, periods=-(-n // BARS_PER_DAY))
+    day_ns = days.values.astype("datetime64[ns]").astype(np.int64)
+    minute = np.arange(n) % BARS_PER_DAY
+    day = np.arange(n) // BARS_PER_DAY
+    ts = day_ns[day] + (SESSION_START_MINUTE + minute) * 60_000_000_000
+
+    log_ret = rng.normal(0.0, volatility, n)
+    close = price * np.exp(np.cumsum(log_ret))
+    open_ = np.empty(n)
+    open_[0] = price
+    open_[1:] = close[:-1]
+    spread = np.abs(rng.normal(0.0, volatility, (2, n))) * close
+    high = np.maximum(open_, close) + spread[0]
+    low = np.minimum(open_, close) - spread[1]
+    volume = rng.integers(100, 10_000, n)
+
+    return pd.DataFrame({
+        "datetime": pd.to_datetime(ts),
+        "open": open_.round(4),
+        "high": high.round(4),
+        "low": low.round(4),
+        "close": close.round(4),
+        "volume": volume,
+    })
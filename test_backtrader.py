@@ -1,9 +1,17 @@
-from datetime import time
+import math
+import operator
 
 import backtrader as bt
 import backtrader.indicators as btind
-import mariadb
-import pandas as pd
+import numpy as np
+
+import bar_cache
+import db
+import profiling
+from array_feed import TIMEFRAMES, ArrayData, frame_columns
+from indicators import TOLERANCE, moving_averages
+from sessions import RTH, in_rth, segments
+from stats import trade_stats
 
 
 # A rule to open a position early in the day if MA crossed premarket
@@ -31,6 +39,7 @@ class CustomWMA(bt.Indicator):
         self.lines.wma[0] = weighted_sum / total_weight
 """
 
+
 def debug(msg, enabled=True):
     if enabled:
         print(msg)
@@ -58,12 +67,6 @@ class MyStrategy(bt.Strategy):
         self.order_submit_bar = None  # bar index when the order was placed
 
     def next(self):
-        # Get current time
-        current_time = self.data.datetime.time()
-
-        market_open = time(hour = 9, minute = 30, second = 0)
-        market_close = time(hour = 16, minute = 00, second = 0)
-
         if self.order:
             # If the order is still active and hasn't filled yet,
             # check how many bars have passed since submission
@@ -71,8 +74,8 @@ class MyStrategy(bt.Strategy):
             if bars_alive > self.p.limit_valid_bars:
                 # Cancel the limit order if it hasn't been filled after N bars
                 self.cancel(self.order)
-                if self.p.show_signals:
-                    debug(f"Canceling limit order at {self.datetime.datetime(0)} after {bars_alive} bars.", self.p.debug)
+                if self.p.show_signals and self.p.debug:
+                    debug(f"Canceling limit order at {self.datetime.datetime(0)} after {bars_alive} bars.")
                 self.order = None
                 return  # Don't place new orders in the same bar
 
@@ -94,16 +97,17 @@ class MyStrategy(bt.Strategy):
 
         # Entry logic
         if not in_position:
-            if not (market_open <= current_time <= market_close):
+            # 9:30 <= time <= 16:00 (sessions.RTH_OPEN/RTH_CLOSE) on the date number, no datetime per bar
+            if not in_rth(self.data.datetime[0]):
                 return  # Skip if not in the main trading session
             #print(f"Check not in position, date: {self.datetime.datetime(0)}  sma: {sma}, wma: {wma}, open: {self.data.open[0]}, close: {self.data.close[0]}, high: {self.data.high[0]}, low: {self.data.low[0]}")
             cond_cross_up = (sma_prev < wma_prev) and (sma - wma > 0.0)
 
             if cond_cross_up:
-                debug(f"Entry: {self.datetime.datetime(0)}", self.p.show_signals)
-                debug(
-                    f"Entry params: sma: {sma}, wma: {wma}, sma_prev: {sma_prev}, wma_prev: {wma_prev}, open: {self.data.open[0]}, close: {self.data.close[0]}, high: {self.data.high[0]}, low: {self.data.low[0]}",
-                    self.p.debug)
+                if self.p.show_signals:
+                    debug(f"Entry: {self.datetime.datetime(0)}")
+                if self.p.debug:
+                    debug(f"Entry params: sma: {sma}, wma: {wma}, sma_prev: {sma_prev}, wma_prev: {wma_prev}, open: {self.data.open[0]}, close: {self.data.close[0]}, high: {self.data.high[0]}, low: {self.data.low[0]}")
                 limit_price = self.data.close[0]
 
                 # Submit a limit BUY order
@@ -121,33 +125,41 @@ class MyStrategy(bt.Strategy):
             cond_stop = (self.data.close[0] < self.entry_price * self.p.stop_loss)
 
             if cond_cross_down and not cond_stop:
-                debug(f"Exit: {self.datetime.datetime(0)}", self.p.show_signals)
+                if self.p.show_signals:
+                    debug(f"Exit: {self.datetime.datetime(0)}")
                 self.order = self.close()  # Закрываем позицию
                 self.entry_price = None
 
             if cond_stop and not cond_cross_down:
-                debug(f"Stop loss: {self.datetime.datetime(0)}",self.p.show_signals)
+                if self.p.show_signals:
+                    debug(f"Stop loss: {self.datetime.datetime(0)}")
                 self.order = self.close()  # Закрываем позицию
                 self.entry_price = None
 
     def notify_order(self, order):
         """Called when the order changes status."""
-        debug("=== Execution Debug ===", self.p.debug)
-        debug(f"Bar datetime: {self.data.datetime.datetime(0)}", self.p.debug)
-        debug(f"Bar open: {self.data.open[0]}, Bar high: {self.data.high[0]}, Bar low: {self.data.low[0]}, Bar close: {self.data.close[0]}", self.p.debug)
+        # The messages are only formatted when debug is on
+        if self.p.debug:
+            self.debug_order(order)
+        if order.status in [order.Completed]:
+            self.order = None  # Reset the order  reference
+        if order.status == order.Margin:
+            if self.p.debug:
+                debug(f"Margin Error: Entry price={self.entry_price}, Current price={self.data.close[0]}, Cash={self.broker.get_cash()}")
+            self.order = None
+
+    def debug_order(self, order):
+        debug("=== Execution Debug ===")
+        debug(f"Bar datetime: {self.data.datetime.datetime(0)}")
+        debug(f"Bar open: {self.data.open[0]}, Bar high: {self.data.high[0]}, Bar low: {self.data.low[0]}, Bar close: {self.data.close[0]}")
         debug(f"""
               Order size: {order.created.size}, 
               Order price: {order.created.price}, 
               Order status: {order.getstatusname()}, 
               Order type: {order.getordername()}, 
               Execution type: {order.exectype},
-              Cash available: {self.broker.get_cash()}""", self.p.debug)
-        debug("=======================", self.p.debug)
-        if order.status in [order.Completed]:
-            self.order = None  # Reset the order  reference
-        if order.status == order.Margin:
-            debug(f"Margin Error: Entry price={self.entry_price}, Current price={self.data.close[0]}, Cash={self.broker.get_cash()}", self.p.debug)
-            self.order = None
+              Cash available: {self.broker.get_cash()}""")
+        debug("=======================")
 
 
     #def notify_trade(self, trade):
@@ -156,95 +168,298 @@ class MyStrategy(bt.Strategy):
     #   if trade.isclosed:
     #      print(f"entry: {trade.open_datetime()}, exit: {trade.close_datetime()} trade return: {trade.pnl}")
 
-class AllInSizer(bt.Sizer):
-    def _getsizing(self, comminfo, cash, data, isbuy):
-        size = int(cash / data.close[0])
-        #current_dt = data.datetime.datetime(0)
-        #print(f"sizer cash: {cash}, date: {current_dt}  close: {data.close[0]}, isbuy: {isbuy}, size: {size}")
-        return size if size > 0 else 0
+# Fraction distance from .5 within which a vectorized rounding is redone with
+# round() on the exact value; wider than the error of indicators.moving_averages
+ROUND_BAND = 1e-6
 
-def fetch_historical_data():
-    try:
-        conn = mariadb.connect(
-            user="root",
-            password="password",
-            host="127.0.0.1",
-            port=3306,
-            database="analysis"
-        )
-        cursor = conn.cursor()
 
-        # SQL-запрос
-        query = """
-        SELECT datetime, open, high, low, close, volume
-        FROM historical_data WHERE symbol = ?
-        ORDER BY datetime
-        """
+def _round_like_python(values, decimals, exact, scale=1.0):
+    """round(x, decimals) for every x of values, as MyStrategy does.
 
-        query = query.replace("?", f"'{symbol}'")
+    np.round() agrees with round() unless x * 10**decimals is close to a half,
+    those few values are rounded again with round(exact(i), decimals).
+    """
+    scaled = values * 10.0 ** decimals
+    band = max(ROUND_BAND, TOLERANCE * scale * 10.0 ** decimals)
+    rounded = np.round(values, decimals)
+    with np.errstate(invalid="ignore"):
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < band
+    for i in np.flatnonzero(near_half):
+        rounded[i] = round(float(exact(i)), decimals)  # np.float64 would round like np.round()
+    return rounded
 
-        # load data into DataFrame
-        # noinspection PyShadowingNames
-        df = pd.read_sql(query, conn)
 
-        # close connection
-        cursor.close()
-        conn.close()
+def strategy_signals(bars, sma_period=10, wma_period=110, ma=None):
+    """MyStrategy's entry/exit conditions for every bar, computed up front.
 
-        # Convert datetime column to datetime format
-        df["datetime"] = pd.to_datetime(df["datetime"], format="%Y%m%d %H:%M:%S")
+    bars are column arrays (datetime, open, close, ...). Returns the columns
+    "entry" (cross up inside 9:30-16:00), "exit" (cross down) and "flat"
+    (close == open to the cent, no signal on that bar). The values match
+    the btind SMA/WMA rounded to 3 decimals exactly: bars where the fast
+    moving averages are too close to a rounding boundary are recomputed with
+    backtrader's own formulas. ma may hold the moving averages already
+    computed by indicators.moving_averages() on bars["close"].
+    """
+    close = np.asarray(bars["close"], dtype=np.float64)
+    open_ = np.asarray(bars["open"], dtype=np.float64)
+    if ma is None:
+        ma = moving_averages(close, sma_periods=(sma_period,), wma_periods=(wma_period,))
+    scale = float(np.abs(close).max()) if len(close) else 0.0
 
-        return df
+    weights = tuple(float(x) for x in range(1, wma_period + 1))
+    coef = 2.0 / (wma_period * (wma_period + 1.0))
+
+    def exact_sma(i):
+        return math.fsum(close[i - sma_period + 1:i + 1].tolist()) / sma_period
+
+    def exact_wma(i):
+        return coef * math.fsum(map(operator.mul, close[i - wma_period + 1:i + 1].tolist(), weights))
+
+    sma = _round_like_python(ma[("SMA", sma_period)], 3, exact_sma, scale)
+    wma = _round_like_python(ma[("WMA", wma_period)], 3, exact_wma, scale)
+    flat = (_round_like_python(close, 2, lambda i: close[i])
+            == _round_like_python(open_, 2, lambda i: open_[i]))
+
+    session = segments(bars["datetime"]) == RTH
+
+    cross_up = np.zeros(len(close), dtype=bool)
+    cross_down = np.zeros(len(close), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        cross_up[1:] = (sma[:-1] < wma[:-1]) & (sma[1:] - wma[1:] > 0.0)
+        cross_down[1:] = (sma[:-1] >= wma[:-1]) & (sma[1:] < wma[1:])
+
+    return {
+        "entry": cross_up & session & ~flat,
+        "exit": cross_down & ~flat,
+        "flat": flat,
+    }
+
+
+class SignalData(ArrayData):
+    """ArrayData with the precomputed lines of strategy_signals()."""
+    lines = ("entry", "exit", "flat")
 
-    except mariadb.Error as e:
-        print(f"DB error: {e}")
-        return None
 
-symbol = "RGTI"
+class FastStrategy(MyStrategy):
+    """MyStrategy on precomputed signals (SignalData), same trades.
 
-# 1. Create a cerebro engine
-cerebro = bt.Cerebro()
+    No indicators are built and next() only handles the pending order, its
+    expiry after limit_valid_bars, the entry/exit signals and the stop.
+    """
 
-# 2. Set the cash deposit
-cerebro.broker.set_cash(7000)
+    def __init__(self):
+        # next() starts on the same bar as with the indicators of MyStrategy
+        self.addminperiod(max(self.p.sma_period, self.p.wma_period))
+        self.order = None
+        self.entry_price = None
+        self.order_submit_bar = None
+
+    def next(self):
+        if self.order:
+            bars_alive = len(self) - self.order_submit_bar
+            if bars_alive > self.p.limit_valid_bars:
+                self.cancel(self.order)
+                if self.p.show_signals and self.p.debug:
+                    debug(f"Canceling limit order at {self.datetime.datetime(0)} after {bars_alive} bars.")
+                self.order = None
+            return
+
+        data = self.data
+        if data.flat[0]:
+            return
+
+        if self.position.size == 0:
+            if data.entry[0]:
+                if self.p.show_signals:
+                    debug(f"Entry: {self.datetime.datetime(0)}")
+                self.entry_price = data.close[0]
+                self.order = self.buy(exectype=bt.Order.Limit, price=self.entry_price)
+                self.order_submit_bar = len(self)
+        else:
+            cross_down = data.exit[0]
+            stop = data.close[0] < self.entry_price * self.p.stop_loss
+            if cross_down != stop:
+                if self.p.show_signals:
+                    debug(f"{'Exit' if cross_down else 'Stop loss'}: {self.datetime.datetime(0)}")
+                self.order = self.close()
+                self.entry_price = None
 
-# 3. Loading the DataFrame
-df = fetch_historical_data()
 
-# Creating the data feed
-# noinspection PyArgumentList
-datafeed = bt.feeds.PandasData(dataname=df,
-                               timeframe=bt.TimeFrame.Minutes,
-                               datetime=0, open=1, high=2, low=3, close=4, volume=5, openinterest=-1)
+class TradeList(bt.Analyzer):
+    """Closed trades as arrays for stats.trade_stats(): pnl (after commission), entry/exit times."""
 
-# 4. Add the data feed to cerebro
-cerebro.adddata(datafeed)
+    def start(self):
+        self.pnl = []
+        self.entry_time = []
+        self.exit_time = []
+        self.first = None
+        self.last = None
 
-# 5.Add the strategy to cerebro
-cerebro.addstrategy(MyStrategy,
-                    debug=False,
-                    show_signals=False,
-                    sma_period=10,
-                    wma_period=110,
-                    stop_loss=0.99  # stop-loss 1%
-)
+    def prenext(self):
+        # kept as it goes: with exactbars the buffers are gone after the run
+        self.last = self.data.datetime[0]
+        if self.first is None:
+            self.first = self.data.datetime.datetime(0)
 
-# 6. Run the backtest
-cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="ta")
-cerebro.addsizer(AllInSizer)
+    def next(self):
+        self.prenext()
+
+    def notify_trade(self, trade):
+        if trade.status == trade.Closed:
+            self.pnl.append(trade.pnlcomm)
+            self.entry_time.append(bt.num2date(trade.dtopen))
+            self.exit_time.append(bt.num2date(trade.dtclose))
+
+    def get_analysis(self):
+        return {
+            "pnl": np.array(self.pnl, dtype=np.float64),
+            "entry_time": np.array(self.entry_time, dtype="datetime64[s]"),
+            "exit_time": np.array(self.exit_time, dtype="datetime64[s]"),
+            "start": self.first,
+            "end": bt.num2date(self.last) if self.last is not None else None,
+        }
+
+
+class AllInSizer(bt.Sizer):
+    def _getsizing(self, comminfo, cash, data, isbuy):
+        size = int(cash / data.close[0])
+        #current_dt = data.datetime.datetime(0)
+        #print(f"sizer cash: {cash}, date: {current_dt}  close: {data.close[0]}, isbuy: {isbuy}, size: {size}")
+        return size if size > 0 else 0
 
-results = cerebro.run()
+def fetch_historical_data(symbol, start=None, end=None, timeframe="1m"):
+    try:
+        # Bars come from the local column cache, only rows newer than
+        # the cached ones are fetched from historical_data
+        df = bar_cache.load_frame(symbol, start=start, end=end, timeframe=timeframe)
 
-ta = results[0].analyzers.ta.get_analysis()
+        return df
 
-wins = ta.won.total
-losses = ta.lost.total
+    except db.Error as e:
+        print(f"DB error: {e}")
+        return None
+
+
+def make_feed(bars, feed="array", timeframe="1m"):
+    """Data feed for bars: a DataFrame, a dict of column arrays or a bar_cache directory.
+
+    feed="pandas" is the original PandasData feed, it needs a DataFrame.
+    timeframe (see rollups.TIMEFRAMES) tells backtrader the bar size, e.g.
+    "5m" for fetch_historical_data(symbol, timeframe="5m").
+    """
+    bt_timeframe, compression = TIMEFRAMES[timeframe]
+    if feed == "pandas":
+        # noinspection PyArgumentList
+        return bt.feeds.PandasData(dataname=bars,
+                                   timeframe=bt_timeframe, compression=compression,
+                                   datetime=0, open=1, high=2, low=3, close=4, volume=5, openinterest=-1)
+    if hasattr(bars, "columns"):
+        bars = frame_columns(bars)
+    return ArrayData(dataname=bars, timeframe=bt_timeframe, compression=compression)
+
+
+def build_cerebro(df, cash=7000, stdstats=True, sizer_params=None, feed="array", fast=False, signals=None,
+                  timeframe="1m", **strategy_params):
+    """Cerebro with the bars of df, MyStrategy, AllInSizer and the TradeAnalyzer.
+
+    df is anything make_feed() accepts. fast=True runs FastStrategy on
+    precomputed signals instead, it needs a DataFrame or column arrays;
+    signals are the strategy_signals() of df when the caller has them already.
+    timeframe is the bar size of df, as for make_feed().
+    """
+    # 1. Create a cerebro engine
+    cerebro = bt.Cerebro(stdstats=stdstats)
+
+    # 2. Set the cash deposit
+    cerebro.broker.set_cash(cash)
+
+    # 3. Add the data feed and the strategy to cerebro
+    if fast:
+        columns = frame_columns(df) if hasattr(df, "columns") else dict(df)
+        if signals is None:
+            with profiling.stage("signals"):
+                signals = strategy_signals(columns,
+                                           strategy_params.get("sma_period", MyStrategy.params.sma_period),
+                                           strategy_params.get("wma_period", MyStrategy.params.wma_period))
+        columns.update(signals)
+        bt_timeframe, compression = TIMEFRAMES[timeframe]
+        cerebro.adddata(SignalData(dataname=columns, timeframe=bt_timeframe, compression=compression))
+        cerebro.addstrategy(FastStrategy, **strategy_params)
+    else:
+        cerebro.adddata(make_feed(df, feed, timeframe))
+        cerebro.addstrategy(MyStrategy, **strategy_params)
+
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="ta")
+    cerebro.addanalyzer(TradeList, _name="trades")
+    cerebro.addsizer(AllInSizer, **(sizer_params or {}))
+
+    return cerebro
+
+
+def summarize(cerebro, results):
+    """The TradeAnalyzer metrics printed by this script as a dict, plus max_drawdown, sharpe and exposure."""
+    ta = results[0].analyzers.ta.get_analysis()
+    extra = closed_trade_stats(cerebro, results)
+
+    closed = ta.get("total", {}).get("closed", 0)
+    wins = ta.won.total if closed else 0
+    losses = ta.lost.total if closed else 0
+    won_avg = ta.won.pnl.average if wins else 0.0
+    lost_avg = ta.lost.pnl.average if losses else 0.0
+
+    return {
+        "initial_deposit": cerebro.broker.startingcash,
+        "final_deposit": cerebro.broker.getvalue(),
+        "profitability": (cerebro.broker.getvalue() / cerebro.broker.startingcash) - 1,
+        "trades": closed,
+        "longest_loss_streak": ta.streak.lost.longest if closed else 0,
+        "risk_reward": won_avg / (-1 * lost_avg) if lost_avg else 0.0,
+        "winrate": wins / (wins + losses) if closed else 0.0,
+        "max_drawdown": extra["max_drawdown"],
+        "sharpe": extra["sharpe"],
+        "exposure": extra["exposure"],
+    }
+
+
+def closed_trade_stats(cerebro, results):
+    """stats.trade_stats() of the closed trades of a run (see TradeList)."""
+    trades = results[0].analyzers.trades.get_analysis()
+    return trade_stats(trades["pnl"], cerebro.broker.startingcash, trades["entry_time"], trades["exit_time"],
+                       trades["start"], trades["end"])
+
+
+if __name__ == "__main__":
+    with profiling.run_from_env("test_backtrader"):
+        symbol = "RGTI"
+
+        with profiling.stage("fetch"):
+            df = fetch_historical_data(symbol)
+
+        cerebro = build_cerebro(df,
+                                cash=7000,
+                                debug=False,
+                                show_signals=False,
+                                sma_period=10,
+                                wma_period=110,
+                                stop_loss=0.99  # stop-loss 1%
+        )
 
-print(f"Asset: {symbol}")
-print(f"Initial deposit: {cerebro.broker.startingcash}")
-print(f"Final deposit: {cerebro.broker.getvalue():.2f}")
-print(f"Profitability: {((cerebro.broker.getvalue() / cerebro.broker.startingcash) - 1):.2%}")
-print(f"Overall trades: {ta.total.closed}")
-print(f"Longest losses streak: {ta.streak.lost.longest}")
-print(f"Risk/reward: {ta.won.pnl.average/(-1 * ta.lost.pnl.average):.2}")
-print(f"Winrate: {wins/(wins+losses):.2%}")
\ No newline at end of file
+        # 5. Run the backtest
+        with profiling.stage("cerebro.run"):
+            results = cerebro.run()
+        profiling.count("bars_processed", len(df))
+
+        with profiling.stage("analyzers"):
+            summary = summarize(cerebro, results)
+
+        print(f"Asset: {symbol}")
+        print(f"Initial deposit: {summary['initial_deposit']}")
+        print(f"Final deposit: {summary['final_deposit']:.2f}")
+        print(f"Profitability: {summary['profitability']:.2%}")
+        print(f"Overall trades: {summary['trades']}")
+        print(f"Longest losses streak: {summary['longest_loss_streak']}")
+        print(f"Risk/reward: {summary['risk_reward']:.2}")
+        print(f"Winrate: {summary['winrate']:.2%}")
+        print(f"Max drawdown: {summary['max_drawdown']:.2%}")
+        print(f"Sharpe: {summary['sharpe']:.2f}")
+        print(f"Exposure: {(summary['exposure'] or 0):.2%}")
@@ -3,91 +3,115 @@ from datetime import datetime
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
-import mariadb
 from ibapi.common import BarData
-from threading import Thread
+from threading import Event, Thread
 import time
 
+import coverage_index
+import profiling
+from ingest import BarWriter
+
 symbol = "GRAL"
 
-DB_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 3306,
-    "user": "root",
-    "password": "password",
-    "database": "analysis"
-}
+# Коды error(), которые завершают запрос исторических данных (162 - это и нарушение
+# темпа запросов, и "нет данных"). Остальные сообщения с тем же reqId (статус ферм
+# данных 2100-2199, 10167 отложенные данные и т.п.) - уведомления, свечи после них ещё идут
+PACING_CODES = {162, 322, 420}
+TERMINAL_CODES = PACING_CODES | {200, 320, 321, 354, 366, 504, 10090}
 
 ## SMA 10, WMA 120, WMA 400, SMA 4000
 
 class HistoricalDataApp(EWrapper, EClient):
 
-    def __init__(self):
+    def __init__(self, symbol=symbol, monitor=None):
         EClient.__init__(self, self)
-        self.data = [] # Список для хранения свечей
-        self.data_received = False  # Флаг для завершения работы
+        self.symbol = symbol
+        self.monitor = monitor  # CrossoverMonitor для живого режима (keepUpToDate=True)
+        self.forming = {}  # reqId -> последняя (ещё формирующаяся) свеча в живом режиме
+        self.writer = BarWriter()  # Пишет свечи в БД пачками в фоновом потоке
+        self.requests = {}  # reqId -> тикер запроса
+        self.connected = Event()  # Устанавливается, когда TWS прислал nextValidId
+        self.data_received = Event()  # Флаг для завершения работы
+        self.errors = {}  # reqId -> (errorCode, errorString), которым завершился запрос
         self.counter = 0
 
+    def nextValidId(self, orderId):
+        """TWS готов принимать запросы"""
+        self.connected.set()
+
     def historicalData(self, reqId, bar: BarData):
-        self.counter += 1
         """Получаем свечные данные"""
+        self.counter += 1
+        profiling.count("bars_received")
         if self.counter % 1000 == 0:
-            print(f"Получено {self.counter} свечей.")
+            stats = self.writer.stats()
+            print(f"Получено {self.counter} свечей, записано {stats['rows_written']} "
+                  f"({stats['bars_per_second']:.0f} свечей/с), в очереди {stats['queue_depth']} пачек.")
         ##print(f"Получены данные: {bar.date}, O:{bar.open}, H:{bar.high}, L:{bar.low}, C:{bar.close}, V:{bar.volume}")
-        date_str = bar.date
-        date_str_clean = " ".join(date_str.split()[:2])
-        self.data.append({
-            "datetime": datetime.strptime(date_str_clean, "%Y%m%d %H:%M:%S"),
-            "open": bar.open,
-            "high": bar.high,
-            "low": bar.low,
-            "close": bar.close,
-            "volume": bar.volume
-        })
+        bar_time = parse_bar_date(bar.date)
+        if self.monitor:
+            self.monitor.on_bar(bar_time, bar.open, bar.close)
+        self.store_bar(reqId, bar_time, bar)
+
+    def historicalDataUpdate(self, reqId, bar: BarData):
+        """Живой режим: TWS присылает формирующуюся свечу при каждом изменении"""
+        received = time.perf_counter()
+        bar_time = parse_bar_date(bar.date)
+        if self.monitor:
+            self.monitor.on_bar(bar_time, bar.open, bar.close, received)
+        # Свеча закрыта, когда пришла следующая: тогда и пишем её в БД
+        previous = self.forming.get(reqId)
+        if previous is not None and previous[0] != bar_time:
+            self.store_bar(reqId, *previous)
+        self.forming[reqId] = (bar_time, bar)
+
+    def store_bar(self, reqId, bar_time, bar):
+        self.writer.add((
+            self.requests.get(reqId, self.symbol),
+            bar_time,
+            bar.open,
+            bar.high,
+            bar.low,
+            bar.close,
+            bar.volume
+        ))
 
     def historicalDataEnd(self, reqId, start, end):
         """Когда TWS сообщает, что данные загружены"""
         print("✅ Данные загружены.")
-        self.store_data_in_db()  # Сохраняем данные в БД
-        self.data_received = True  # Завершаем программу
+        self.store_data_in_db()  # Дописываем остаток в БД
+        if self.monitor:
+            self.monitor.live = True  # Дальше идут живые обновления, сигналы включены
+        self.data_received.set()  # Завершаем программу
 
     def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=""):
         """Вывод ошибок и сообщений от TWS API"""
         print(f"Ошибка {errorCode}: {errorString}")
+        if reqId in self.requests and errorCode in TERMINAL_CODES:
+            self.errors[reqId] = (errorCode, errorString)
+            self.data_received.set()  # Запрос завершился ошибкой (например, нет данных), не ждём его
 
     def store_data_in_db(self):
-        """Записывает полученные данные в MariaDB."""
-        global cursor, conn
-        if not self.data:
-            print("Нет данных для сохранения.")
-            return
-
-        try:
-            conn = mariadb.connect(**DB_CONFIG)
-            cursor = conn.cursor()
+        """Дожидается записи в MariaDB всех полученных свечей."""
+        with profiling.stage("db_flush"):
+            self.writer.flush()
+        stats = self.writer.stats()
+        print(f"Сохранено {stats['rows_written']} строк в БД, с ошибками {stats['rows_failed']}.")
 
-            insert_query = """
-            INSERT INTO historical_data (symbol, datetime, open, high, low, close, volume)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-                open=VALUES(open), high=VALUES(high), 
-                low=VALUES(low), close=VALUES(close), volume=VALUES(volume)
-            """
 
-            data_to_insert = [(symbol, row["datetime"], row["open"], row["high"], row["low"], row["close"], row["volume"]) for row in self.data]
+def parse_bar_date(date_str):
+    """"20240102 09:30:00 US/Eastern" -> datetime без часового пояса"""
+    return datetime.strptime(" ".join(date_str.split()[:2]), "%Y%m%d %H:%M:%S")
 
-            cursor.executemany(insert_query, data_to_insert)
-            conn.commit()
-            print(f"Сохранено {len(self.data)} строк в БД.")
 
-        except mariadb.Error as err:
-            print(f"Ошибка БД: {err}")
-
-        finally:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
+def make_contract(symbol):
+    """Контракт акции на SMART в долларах"""
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = "STK"
+    contract.currency = "USD"
+    contract.exchange = "SMART"
+    return contract
 
 
 def run_loop(app):
@@ -96,40 +120,47 @@ def run_loop(app):
 
 
 if __name__ == "__main__":
-    app = HistoricalDataApp()
-    app.connect("127.0.0.1", 7497, clientId=0)  # Подключаемся к TWS
-
-    # Запуск фонового потока обработки сообщений
-    api_thread = Thread(target=run_loop, args=(app,), daemon=True)
-    api_thread.start()
-
-    # Ждём соединения
-    time.sleep(2)
-
-    # Создаём контракт для AAPL (или любой другой акции)
-    contract = Contract()
-    contract.symbol = symbol
-    contract.secType = "STK"
-    contract.currency = "USD"
-    contract.exchange = "SMART"
-
-    # Запрашиваем минутные свечи за 1 день
-    app.reqHistoricalData(
-        reqId=1,
-        contract=contract,
-        endDateTime="",
-        durationStr="20 W",
-        barSizeSetting="1 min",
-        whatToShow="TRADES",
-        useRTH=0,
-        formatDate=1,
-        keepUpToDate=False,
-        chartOptions=[]
-    )
-
-    # Ждём завершения загрузки данных
-    while not app.data_received:
-        time.sleep(1)
-
-    # Завершаем соединение
-    app.disconnect()
+    with profiling.run_from_env("test_connection"):
+        app = HistoricalDataApp()
+        app.connect("127.0.0.1", 7497, clientId=0)  # Подключаемся к TWS
+
+        # Запуск фонового потока обработки сообщений
+        api_thread = Thread(target=run_loop, args=(app,), daemon=True)
+        api_thread.start()
+
+        # Ждём соединения
+        app.connected.wait()
+
+        # Запрашиваем минутные свечи только за сессии, которых ещё нет в БД
+        today = datetime.now().date()
+        for req_id, (first, last) in enumerate(coverage_index.plan_windows(symbol, today), start=1):
+            end, duration = coverage_index.window_request(first, last, today)
+            print(f"Запрос {symbol}: до {end or 'сейчас'}, {duration}")
+            app.requests[req_id] = symbol
+            app.data_received.clear()
+            app.reqHistoricalData(
+                reqId=req_id,
+                contract=make_contract(symbol),
+                endDateTime=end,
+                durationStr=duration,
+                barSizeSetting="1 min",
+                whatToShow="TRADES",
+                useRTH=0,
+                formatDate=1,
+                keepUpToDate=False,
+                chartOptions=[]
+            )
+
+            # Ждём завершения загрузки данных
+            with profiling.stage("tws_request"):
+                app.data_received.wait()
+
+            # Сессии, на которые TWS ответил (свечами или "нет данных"), больше не запрашиваем
+            code, message = app.errors.get(req_id, (None, ""))
+            answered = code is None or code == 162 and "HMDS query returned no data" in message
+            if answered and app.writer.rows_failed == 0:
+                coverage_index.record_requested(symbol, first, last, today)
+
+        # Завершаем соединение
+        app.writer.close()
+        app.disconnect()
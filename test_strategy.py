@@ -1,60 +1,77 @@
+import numpy as np
 import pandas as pd
-import mariadb
+
+import bar_cache
+import db
+import indicator_cache
+import montecarlo
+import profiling
+import sessions
+from backtest import crossover_backtest
+from indicators import moving_averages
+from stats import compound, trade_stats
 
 trades = []
 
+# Какие бары оставлять в бэктесте: "rth" (9:30 - 16:00), "pre", "post" или None - все бары
+SESSION = None
+
 # Подключение к БД
-def fetch_historical_data():
+def fetch_historical_data(symbol="RGTI", start=None, end=None):
     try:
-        conn = mariadb.connect(
-            user="root",
-            password="password",
-            host="127.0.0.1",
-            port=3306,
-            database="analysis"
-        )
-        cursor = conn.cursor()
-
-        # SQL-запрос
-        query = """
-        SELECT datetime, open, high, low, close, volume
-        FROM historical_data WHERE symbol = 'RGTI'
-        ORDER BY datetime ASC
-        """
-
-        # Загружаем данные в DataFrame
-        df = pd.read_sql(query, conn)
-
-        # Закрываем соединение
-        cursor.close()
-        conn.close()
-
-        # Преобразуем колонку datetime в формат datetime
-        df["datetime"] = pd.to_datetime(df["datetime"], format="%Y%m%d %H:%M:%S")
+        # Бары читаются из локального кэша, из БД подгружаются только новые строки
+        df = bar_cache.load_frame(symbol, start=start, end=end)
 
         return df
 
-    except mariadb.Error as e:
+    except db.Error as e:
         print(f"Ошибка подключения к MariaDB: {e}")
         return None
 
-def calculate_moving_averages(df):
-    # Простая скользящая средняя (SMA)
-    df["SMA_10"] = df["close"].rolling(window=10).mean()
-    df["SMA_4000"] = df["close"].rolling(window=4000).mean()
+def calculate_moving_averages(df, symbol=None):
+    # Простые (SMA) и взвешенные (WMA) скользящие средние за один проход.
+    # С symbol берутся из кэша индикаторов (df должен быть куском кэша баров symbol)
+    if symbol is not None:
+        ma = indicator_cache.default_cache().moving_averages(
+            symbol, sma_periods=(10, 4000), wma_periods=(110, 400), times=df["datetime"].to_numpy())
+    else:
+        ma = moving_averages(df["close"].to_numpy(), sma_periods=(10, 4000), wma_periods=(110, 400))
 
-    # Взвешенная скользящая средняя (WMA)
-    def weighted_moving_average(series, period):
-        weights = range(1, period + 1)
-        return series.rolling(period).apply(lambda x: (x * weights).sum() / sum(weights), raw=True)
+    df["SMA_10"] = ma[("SMA", 10)]
+    df["SMA_4000"] = ma[("SMA", 4000)]
 
-    df["WMA_120"] = weighted_moving_average(df["close"], 110)
-    df["WMA_400"] = weighted_moving_average(df["close"], 400)
+    df["WMA_120"] = ma[("WMA", 110)]
+    df["WMA_400"] = ma[("WMA", 400)]
 
     return df
 
 
-def iterative_backtest(df):
+def iterative_backtest(df, trade_list=None):
+    """Бэктест на массивах NumPy (см. backtest.crossover_backtest)."""
+    if trade_list is None:
+        trade_list = trades
+
+    entry_signal, exit_signal, entry_price, new_trades = crossover_backtest(
+        df["close"].to_numpy(),
+        df["SMA_10"].to_numpy(),
+        df["WMA_120"].to_numpy(),
+        stop_loss=0.99,
+        times=df["datetime"].to_numpy(),
+    )
+    trade_list.extend(new_trades)
+
+    df["entry_signal_iter"] = entry_signal
+    df["exit_signal_iter"] = exit_signal
+    df["entry_price_iter"] = entry_price
+
+    return df
+
+
+def iterative_backtest_iloc(df, trade_list=None):
+    """Исходный построчный бэктест через df.iloc, оставлен для сверки с iterative_backtest."""
+    if trade_list is None:
+        trade_list = trades
+
     # Готовим списки для сигналов (по умолчанию False)
     entry_signal = [False] * len(df)
     exit_signal = [False] * len(df)
@@ -103,7 +120,7 @@ def iterative_backtest(df):
                     "entry_time": row["datetime"],
                     "entry_price":current_entry_price
                 }
-                trades.append(trade)
+                trade_list.append(trade)
 
         else:
             # ---- Логика выхода ----
@@ -120,7 +137,7 @@ def iterative_backtest(df):
                 # Можем сразу обнулить current_entry_price,
                 # если хотим защититься от повторных проверок:
                 current_entry_price = None
-                trade = trades[-1]  # последняя
+                trade = trade_list[-1]  # последняя
                 trade["exit_index"] = i
                 trade["exit_time"] = row["datetime"]
                 trade["exit_price"] = row["close"]
@@ -129,7 +146,7 @@ def iterative_backtest(df):
             if cond_stop_loss and not cond_cross:
                 in_position = False
                 exit_signal[i] = True
-                trade = trades[-1]  # последняя
+                trade = trade_list[-1]  # последняя
                 trade["exit_index"] = i
                 trade["exit_time"] = row["datetime"]
                 trade["exit_price"] = current_entry_price * 0.99
@@ -146,86 +163,70 @@ def iterative_backtest(df):
     return df
 
 
-# Тестируем загрузку данных
-df = fetch_historical_data()
-
-# Фильтруем данные, оставляя только основную торговую сессию (9:30 - 16:00)
-
-# Вычисляем MA и выводим первые строки
-df = calculate_moving_averages(df)
-##print(df[["datetime", "close", "SMA_10", "WMA_120", "WMA_400", "SMA_4000"]].head(4000))  # Проверяем 15 строк
-
-df = df.dropna().reset_index(drop=True)  # Удаляем строки с NaN и сбрасываем индексы
-
-df = iterative_backtest(df)
-
-# Посмотреть, где появились сигналы:
-df_signals = df[(df["entry_signal_iter"] | df["exit_signal_iter"])]
-
-#print(df_signals[["datetime", "close", "entry_signal_iter", "exit_signal_iter", "entry_price_iter"]])
-
-trades_df = pd.DataFrame(trades)
-pd.set_option("display.max_columns", None)
-pd.set_option("display.width", 1200)
-#print(trades_df[["entry_time", "entry_price", "exit_time", "exit_price"]])
-
-initial_deposit = 7000
-deposit = initial_deposit
-
-max_loss_streak = 0  # Максимальная серия убыточных сделок
-current_loss_streak = 0  # Текущая серия убыточных сделок
-good_trades = 0  # Количество удачных сделок
-overal_trades = 0
-wins = 0
-winSum = 0
-lossSum = 0
-
-# Проходим по всем трейдам и обновляем депозит
-for index, trade in trades_df.iterrows():
-    overal_trades += 1
-    entry_price = trade["entry_price"]
-    exit_price = trade["exit_price"]
-
-    # Доля изменения (прибыль или убыток)
-    trade_return = (exit_price - entry_price) / entry_price
-
-    prev_deposit = deposit
-
-    # Обновляем депозит
-    deposit *= (1 + trade_return)
-
-    result = deposit - prev_deposit
-
-    # Проверяем, была ли сделка убыточной
-    if trade_return < 0:
-        lossSum += abs(result)
-        current_loss_streak += 1  # Увеличиваем серию проигрышей
-        max_loss_streak = max(max_loss_streak, current_loss_streak)  # Обновляем максимум
-    else:
-        winSum += result  # Суммируем доходные сделки
-        wins += 1
-        current_loss_streak = 0  # Сброс серии убыточных сделок
-
-#    if trade_return > 0.03:
-#        good_trades += 1
-    print(f"entry {trade["entry_time"]}, exit {trade["exit_time"]} trade_return {trade_return:.2%}, deposit {deposit:.2f}")
-
-
-# Рассчитываем win/loss ratio с защитой от деления на 0
-winloss_ratio = ((winSum/wins)/(lossSum/(overal_trades-wins))) if lossSum > 0 else 0
-
-# Рассчитываем процент прибыльных сделок
-win_rate = (wins / overal_trades) if overal_trades > 0 else 0
-
-# Вывод результатов
-print(f"Начальный депозит: {initial_deposit}")
-print(f"Финальный депозит: {deposit:.2f}")
-print(f"Доходность: {((deposit / initial_deposit) - 1) * 100:.2f}%")
-print(f"Максимальная серия убыточных сделок: {max_loss_streak}")
-print(f"Winloss ratio: {winloss_ratio:.2}")
-
-print(f"Общее количество сделок: {overal_trades}")
-print(f"Количество хороших сделок: {good_trades}")
-print(f"Процент прибыльных сделок: {win_rate:.2%}")
-
-
+if __name__ == "__main__":
+    with profiling.run_from_env("test_strategy"):
+        # Тестируем загрузку данных
+        symbol = "RGTI"
+        with profiling.stage("fetch"):
+            df = fetch_historical_data(symbol)
+
+        # Фильтруем данные, оставляя только основную торговую сессию (9:30 - 16:00)
+        # Маски сессий считаются один раз на версию кэша баров и хранятся вместе с ним
+        if SESSION is not None:
+            df = df[sessions.load_sessions(symbol).mask(SESSION)].reset_index(drop=True)
+
+        # Вычисляем MA и выводим первые строки
+        # (после фильтра бары уже не идут подряд, кэш индикаторов к ним не подходит)
+        with profiling.stage("moving_averages"):
+            df = calculate_moving_averages(df, symbol if SESSION is None else None)
+        ##print(df[["datetime", "close", "SMA_10", "WMA_120", "WMA_400", "SMA_4000"]].head(4000))  # Проверяем 15 строк
+
+        df = df.dropna().reset_index(drop=True)  # Удаляем строки с NaN и сбрасываем индексы
+
+        with profiling.stage("iterative_backtest"):
+            df = iterative_backtest(df)
+
+        # Посмотреть, где появились сигналы:
+        df_signals = df[(df["entry_signal_iter"] | df["exit_signal_iter"])]
+
+        #print(df_signals[["datetime", "close", "entry_signal_iter", "exit_signal_iter", "entry_price_iter"]])
+
+        trades_df = pd.DataFrame(trades, columns=["entry_index", "entry_time", "entry_price",
+                                                  "exit_index", "exit_time", "exit_price"])
+        pd.set_option("display.max_columns", None)
+        pd.set_option("display.width", 1200)
+        #print(trades_df[["entry_time", "entry_price", "exit_time", "exit_price"]])
+
+        initial_deposit = 7000
+        good_trades = 0  # Количество удачных сделок
+
+        # Депозит после каждой сделки и статистика считаются на массивах (stats.py),
+        # по закрытым сделкам: у последней открытой нет цены выхода
+        closed = trades_df.dropna(subset=["exit_price"])
+        returns, equity = compound(closed["entry_price"], closed["exit_price"], initial_deposit)
+        summary = trade_stats(np.diff(equity), initial_deposit,
+                              closed["entry_time"], closed["exit_time"],
+                              start=df["datetime"].iloc[0], end=df["datetime"].iloc[-1])
+        deposit = equity[-1]
+
+        for entry_time, exit_time, trade_return, trade_deposit in zip(closed["entry_time"], closed["exit_time"],
+                                                                      returns, equity[1:]):
+            print(f"entry {entry_time}, exit {exit_time} trade_return {trade_return:.2%}, deposit {trade_deposit:.2f}")
+
+        # Вывод результатов
+        print(f"Начальный депозит: {initial_deposit}")
+        print(f"Финальный депозит: {deposit:.2f}")
+        print(f"Доходность: {((deposit / initial_deposit) - 1) * 100:.2f}%")
+        print(f"Максимальная серия убыточных сделок: {summary['longest_loss_streak']}")
+        print(f"Winloss ratio: {summary['risk_reward']:.2}")
+        print(f"Максимальная просадка: {summary['max_drawdown']:.2%}")
+        print(f"Sharpe: {summary['sharpe']:.2f}")
+        print(f"Время в позиции: {(summary['exposure'] or 0):.2%}")
+
+        print(f"Общее количество сделок: {summary['trades']}")
+        print(f"Количество хороших сделок: {good_trades}")
+        print(f"Процент прибыльных сделок: {summary['winrate']:.2%}")
+
+        # Устойчивость результата: распределения по бутстрепу сделок
+        print(montecarlo.format_report(montecarlo.robustness(returns, paths=10_000,
+                                                             initial_deposit=initial_deposit)))
@@ -0,0 +1,161 @@
+import threading
+from datetime import date, datetime, timedelta
+from functools import partial
+
+import pytest
+from ibapi.common import BarData
+
+import coverage_index
+import ingest
+import test_connection
+from backfill import BackfillRequest, BackfillScheduler, TokenBucket
+from fake_tws import FakeTWS
+
+
+class FakeConnection:
+    """Collects what the BarWriter upserts instead of sending it to MariaDB."""
+
+    def __init__(self, written):
+        self.written = written
+
+    def cursor(self, prepared=False):
+        return self
+
+    def executemany(self, sql, rows):
+        self.written.extend(rows)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def written(monkeypatch):
+    rows = []
+    monkeypatch.setattr(test_connection, "BarWriter",
+                        partial(ingest.BarWriter, connect=lambda: FakeConnection(rows)))
+    return rows
+
+
+def canned_bars(n, price=10.0):
+    start = datetime(2024, 1, 2, 9, 30)
+    return [(start + timedelta(minutes=i), price, price + 0.1, price - 0.1, price, 100) for i in range(n)]
+
+
+def scheduler(requests, port, **options):
+    options = {"bucket": TokenBucket(rate=1000.0, capacity=100), "retry_delay": 0.05, **options}
+    return BackfillScheduler(requests, port=port, **options)
+
+
+def run(backfill_scheduler, timeout=20):
+    thread = threading.Thread(target=backfill_scheduler.run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "run() did not return"
+
+
+def test_pacing_errors_are_retried_until_done(written):
+    bars = {"AAA": canned_bars(30), "BBB": canned_bars(20, price=20.0)}
+    requests = [BackfillRequest("AAA", duration="1 D"), BackfillRequest("BBB", duration="1 D")]
+    with FakeTWS(bars, pacing_errors=3) as tws:
+        run(scheduler(requests, tws.port, max_in_flight=2))
+
+    assert [request.status for request in requests] == ["done", "done"]
+    assert sum(request.attempts for request in requests) == 5
+    assert len(tws.requests) == 5
+    assert [request.bars for request in requests] == [30, 20]
+    assert sorted({row[0] for row in written}) == ["AAA", "BBB"]
+    assert len(written) == 50
+
+
+def test_retries_give_up(written):
+    requests = [BackfillRequest("AAA", duration="1 D")]
+    with FakeTWS({"AAA": canned_bars(5)}, pacing_errors=10) as tws:
+        run(scheduler(requests, tws.port, retries=2))
+    assert requests[0].status == "failed"
+    assert requests[0].attempts == 2
+    assert written == []
+
+
+def test_unanswered_request_times_out_with_every_slot_taken(written):
+    requests = [BackfillRequest("AAA", duration="1 D"), BackfillRequest("BBB", duration="1 D")]
+    with FakeTWS({"AAA": canned_bars(5), "BBB": canned_bars(5)}) as tws:
+        backfill_scheduler = scheduler(requests, tws.port, max_in_flight=1, request_timeout=0.5)
+        send = backfill_scheduler.app.reqHistoricalData
+        unanswered = []
+
+        def lose_first(reqId, **kwargs):
+            # TWS never answers the first request, it holds the only slot
+            if not unanswered:
+                unanswered.append(reqId)
+                return
+            send(reqId=reqId, **kwargs)
+
+        backfill_scheduler.app.reqHistoricalData = lose_first
+        run(backfill_scheduler)
+
+    assert [request.status for request in requests] == ["done", "done"]
+    assert [request.attempts for request in requests] == [2, 1]
+
+
+def test_notices_do_not_end_a_request(written):
+    backfill_scheduler = scheduler([BackfillRequest("AAA")], port=0)
+    request = backfill_scheduler.requests[0]
+    backfill_scheduler.active[7] = request
+    backfill_scheduler.app.requests[7] = "AAA"
+
+    assert not backfill_scheduler.failed(7, 2104, "Market data farm connection is OK:usfarm")
+    assert not backfill_scheduler.failed(7, 10167, "Displaying delayed market data")
+    assert backfill_scheduler.active[7] is request
+
+    assert backfill_scheduler.failed(7, 200, "No security definition has been found")
+    assert request.status == "failed"
+    assert 7 not in backfill_scheduler.active
+    backfill_scheduler.app.writer.close()
+
+
+def test_bars_of_unknown_requests_are_dropped(written):
+    backfill_scheduler = scheduler([BackfillRequest("AAA")], port=0)
+    app = backfill_scheduler.app
+    bar = BarData()
+    bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume = "20240102 09:30:00", 1, 1, 1, 1, 100
+    app.historicalData(3, bar)  # e.g. after a timeout cancelled reqId 3
+    app.requests[4] = "AAA"
+    app.historicalData(4, bar)
+    app.writer.close()
+    assert [row[0] for row in written] == ["AAA"]
+
+
+def test_single_request_app_waits_through_notices(written):
+    app = test_connection.HistoricalDataApp("AAA")
+    app.requests[1] = "AAA"
+    app.error(1, 2104, "Market data farm connection is OK:usfarm")
+    app.error(1, 10167, "Displaying delayed market data")
+    assert not app.data_received.is_set()
+    app.error(1, 162, "Historical Market Data Service error message:HMDS query returned no data")
+    assert app.data_received.is_set()
+    app.writer.close()
+
+
+def test_answered_windows_are_recorded(written, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(coverage_index, "record_requested",
+                        lambda symbol, first, last: recorded.append((symbol, first, last)))
+    window = (date(2024, 1, 2), date(2024, 1, 2))
+    requests = [BackfillRequest("AAA", duration="1 D", window=window),
+                BackfillRequest("BBB", duration="1 D", window=window),  # answered "no data"
+                BackfillRequest("CCC", duration="1 D")]  # --full, not planned
+    with FakeTWS({"AAA": canned_bars(5), "CCC": canned_bars(5)}) as tws:
+        backfill_scheduler = scheduler(requests, tws.port)
+        run(backfill_scheduler)
+    assert [request.status for request in requests] == ["done", "done", "done"]
+    assert backfill_scheduler.record_covered() == 2
+    assert recorded == [("AAA", *window), ("BBB", *window)]
+
+    # with bars lost on the way to MariaDB the windows are requested again
+    recorded.clear()
+    backfill_scheduler.app.writer.rows_failed = 5
+    assert backfill_scheduler.record_covered() == 0
+    assert recorded == []
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from synthetic import minute_bars
+from test_strategy import calculate_moving_averages, iterative_backtest, iterative_backtest_iloc
+
+
+def same_trades(left, right):
+    assert len(left) == len(right)
+    for a, b in zip(left, right):
+        assert a.keys() == b.keys()
+        for key in a:
+            if key.endswith("_time"):
+                assert np.datetime64(a[key]) == np.datetime64(b[key]), key
+            else:
+                assert a[key] == b[key], key
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_iterative_backtest_matches_iloc_loop(seed):
+    df = calculate_moving_averages(minute_bars(14_000, seed=seed)).dropna().reset_index(drop=True)
+
+    trades, reference_trades = [], []
+    result = iterative_backtest(df.copy(), trades)
+    reference = iterative_backtest_iloc(df.copy(), reference_trades)
+
+    assert trades
+    for column in ("entry_signal_iter", "exit_signal_iter"):
+        assert np.array_equal(result[column].to_numpy(), reference[column].to_numpy(dtype=bool)), column
+    assert np.array_equal(result["entry_price_iter"].to_numpy(),
+                          reference["entry_price_iter"].to_numpy(dtype=np.float64), equal_nan=True)
+    same_trades(trades, reference_trades)
+
+
+def test_open_last_trade_has_no_exit():
+    df = calculate_moving_averages(minute_bars(14_000, seed=0)).dropna().reset_index(drop=True)
+    trades = []
+    iterative_backtest(df, trades)
+    # cut right after the last entry: the same trade is open, the closed ones are unchanged
+    cut = trades[-1]["entry_index"] + 1
+    open_trades = []
+    iterative_backtest(df.iloc[:cut].reset_index(drop=True), open_trades)
+    assert "exit_index" not in open_trades[-1]
+    same_trades(open_trades[:-1], trades[:-1])
@@ -0,0 +1,140 @@
+import sqlite3
+import zlib
+from datetime import datetime, timedelta
+
+import pytest
+
+import bar_cache
+import db
+
+
+class BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        self.value ^= value
+
+    def finalize(self):
+        return self.value
+
+
+class Cursor:
+    """sqlite3 cursor that takes and returns datetimes the way mariadb does."""
+
+    def __init__(self, conn, queries):
+        self.cursor = conn.cursor()
+        self.queries = queries
+
+    def execute(self, sql, params=()):
+        self.queries.append(sql)
+        self.cursor.execute(sql, [f"{value:%Y-%m-%d %H:%M:%S}" if isinstance(value, datetime) else value
+                                  for value in params])
+
+    def _rows(self, rows):
+        if rows and len(rows[0]) == 6:  # SELECT of bars
+            return [(datetime.fromisoformat(row[0]),) + row[1:] for row in rows]
+        return rows
+
+    def fetchall(self):
+        return self._rows(self.cursor.fetchall())
+
+    def fetchmany(self, size):
+        return self._rows(self.cursor.fetchmany(size))
+
+    def close(self):
+        pass
+
+
+class Connection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, buffered=True):
+        return Cursor(self.database.conn, self.database.queries)
+
+    def close(self):
+        pass
+
+
+class Database:
+    """historical_data in sqlite, with the MariaDB functions the digests use."""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.create_function("CRC32", 1, lambda text: zlib.crc32(text.encode()))
+        self.conn.create_function("CONCAT_WS", -1, lambda sep, *values: sep.join(str(value) for value in values))
+        self.conn.create_aggregate("BIT_XOR", 1, BitXor)
+        self.conn.execute("CREATE TABLE historical_data (symbol TEXT, datetime TEXT, open REAL, high REAL, "
+                          "low REAL, close REAL, volume INTEGER, PRIMARY KEY (symbol, datetime))")
+        self.queries = []
+
+    def connect(self):
+        return Connection(self)
+
+    def insert(self, start, days, price=10.0, hours=(10, 11)):
+        """A bar at each of hours for days days from start, replacing existing ones."""
+        rows = [("AAA", f"{start + timedelta(days=day, hours=hour):%Y-%m-%d %H:%M:%S}", price, price, price, price, 100)
+                for day in range(days) for hour in hours]
+        self.conn.executemany("INSERT OR REPLACE INTO historical_data VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def digests(self):
+        return [sql for sql in self.queries if "BIT_XOR" in sql]
+
+
+@pytest.fixture
+def historical_data(monkeypatch):
+    database = Database()
+    monkeypatch.setattr(db, "connect", database.connect)
+    return database
+
+
+START = datetime(2024, 1, 1)
+
+
+def test_warm_sync_verifies_recent_days_only(historical_data, tmp_path):
+    historical_data.insert(START, 30)
+    assert bar_cache.sync("AAA", cache_dir=tmp_path) == 60
+
+    # a rewrite within the last VERIFY_DAYS days is found, an older one only by a full check
+    historical_data.insert(START + timedelta(days=25), 1, price=11.0, hours=(10,))
+    historical_data.insert(START + timedelta(days=2), 1, price=12.0, hours=(10,))
+    historical_data.queries.clear()
+    assert bar_cache.sync("AAA", cache_dir=tmp_path) == 2
+    assert all("datetime >= ?" in sql for sql in historical_data.digests())
+    bars, meta = bar_cache.read_cache("AAA", tmp_path)
+    assert bars["close"][50] == 11.0 and bars["close"][4] == 10.0
+    assert meta["changed_from"] == 50
+
+    assert bar_cache.sync("AAA", cache_dir=tmp_path, verify_days=None) == 2
+    bars, meta = bar_cache.read_cache("AAA", tmp_path)
+    assert bars["close"][4] == 12.0
+    assert meta["changed_from"] == 4
+    assert bar_cache.sync("AAA", cache_dir=tmp_path, verify_days=None) == 0
+
+
+def test_full_check_is_periodic(historical_data, tmp_path, monkeypatch):
+    historical_data.insert(START, 30)
+    bar_cache.sync("AAA", cache_dir=tmp_path)
+    historical_data.insert(START + timedelta(days=2), 1, price=12.0, hours=(10,))
+    assert bar_cache.sync("AAA", cache_dir=tmp_path) == 0
+
+    monkeypatch.setattr(bar_cache.time, "time", lambda: datetime.now().timestamp() + bar_cache.FULL_VERIFY_INTERVAL)
+    assert bar_cache.sync("AAA", cache_dir=tmp_path) == 2
+    assert bar_cache.read_cache("AAA", tmp_path)[0]["close"][4] == 12.0
+
+
+def test_cache_without_digests_is_not_refetched(historical_data, tmp_path):
+    historical_data.insert(START, 30)
+    bar_cache.sync("AAA", verify=False, cache_dir=tmp_path)
+    assert bar_cache.read_cache("AAA", tmp_path)[1]["days"] is None
+
+    historical_data.queries.clear()
+    assert bar_cache.sync("AAA", cache_dir=tmp_path) == 0
+    assert len(historical_data.queries) == len(historical_data.digests()) + 1  # digests and the new rows
+    _, meta = bar_cache.read_cache("AAA", tmp_path)
+    assert len(meta["days"]) == 30
+    assert meta["version"] == 1
+
+    historical_data.insert(START + timedelta(days=2), 1, price=12.0, hours=(10,))
+    assert bar_cache.sync("AAA", cache_dir=tmp_path, verify_days=None) == 2
@@ -0,0 +1,69 @@
+from datetime import date, datetime, time, timedelta
+
+import coverage_index
+from coverage_index import complete_days, missing_days, missing_windows, plan, window_request
+
+
+def session(day, first=time(4, 0), last=time(19, 59), bars=960):
+    return bars, datetime.combine(day, first), datetime.combine(day, last)
+
+
+def stored(days, **earliest):
+    """Coverage of fully stored sessions, the first one overridden by earliest."""
+    coverage = {day: session(day) for day in days}
+    coverage[days[0]] = session(days[0], **earliest)
+    return coverage
+
+
+JANUARY = coverage_index.trading_days(date(2025, 1, 2), date(2025, 1, 31))
+TODAY = date(2025, 2, 3)
+
+
+def test_stored_sessions_are_complete():
+    coverage = stored(JANUARY)
+    assert complete_days(coverage, TODAY) == set(JANUARY)
+    assert missing_days(coverage, TODAY) == [TODAY]
+    assert plan("AAA", TODAY, coverage=coverage, requested=set()) == [("", "1 D")]
+
+
+def test_earliest_day_starting_late_is_missing_until_requested():
+    # the first bar of a thin stock comes at 4:07, the session was stored anyway
+    coverage = stored(JANUARY, first=time(4, 7))
+    assert missing_days(coverage, TODAY) == [JANUARY[0], TODAY]
+    assert plan("AAA", TODAY, coverage=coverage, requested=set()) == [
+        ("20250103 00:00:00 US/Eastern", "1 D"), ("", "1 D")]
+    assert plan("AAA", TODAY, coverage=coverage, requested={JANUARY[0]}) == [("", "1 D")]
+
+
+def test_day_without_bars_is_covered_once_requested():
+    # 2025-01-09: markets closed for the national day of mourning, the calendar doesn't know
+    closed = date(2025, 1, 9)
+    coverage = stored([day for day in JANUARY if day != closed])
+    assert closed in missing_days(coverage, TODAY)
+    assert closed not in missing_days(coverage, TODAY, requested={closed})
+    assert missing_days(coverage, TODAY, requested={closed}) == [TODAY]
+
+
+def test_today_is_never_complete():
+    coverage = stored(JANUARY + [TODAY])
+    assert TODAY not in complete_days(coverage, TODAY, requested={TODAY})
+    assert missing_days(coverage, TODAY, requested={TODAY}) == [TODAY]
+
+
+def test_new_symbol_looks_back():
+    days = missing_days({}, TODAY, lookback_days=14)
+    assert days == coverage_index.trading_days(TODAY - timedelta(days=14), TODAY)
+    assert missing_days({}, TODAY, lookback_days=14, requested=days[:-1]) == [TODAY]
+
+
+def test_missing_windows():
+    days = [date(2025, 1, 2), date(2025, 1, 3), date(2025, 1, 6), date(2025, 1, 8), date(2025, 1, 9)]
+    assert missing_windows(days, max_days=30) == [(date(2025, 1, 2), date(2025, 1, 6)),
+                                                 (date(2025, 1, 8), date(2025, 1, 9))]
+    assert missing_windows(days[:3], max_days=2) == [(date(2025, 1, 2), date(2025, 1, 3)),
+                                                    (date(2025, 1, 6), date(2025, 1, 6))]
+
+
+def test_window_request():
+    assert window_request(date(2025, 1, 6), date(2025, 1, 10), TODAY) == ("20250111 00:00:00 US/Eastern", "5 D")
+    assert window_request(date(2025, 1, 31), TODAY, TODAY) == ("", "4 D")
@@ -0,0 +1,120 @@
+import gc
+import os
+import types
+
+import pytest
+
+import db
+
+
+class FakeConnection:
+    deallocated = []
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, prepared=False):
+        return object()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.pool.free.append(self)
+
+    def __del__(self):
+        # mariadb's dealloc closes the session on the socket
+        FakeConnection.deallocated.append(id(self))
+
+
+class FakeConnectionPool:
+    def __init__(self, pool_name, pool_size, pool_reset_connection=True):
+        self.size = pool_size
+        self.connections = []
+        self.free = []
+
+    def set_config(self, **options):
+        self.options = options
+
+    def add_connection(self):
+        if len(self.connections) >= self.size:
+            raise fake_mariadb.PoolError("pool is full")
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        self.free.append(connection)
+
+    def get_connection(self):
+        if not self.free:
+            raise fake_mariadb.PoolError("no connection available")
+        return self.free.pop()
+
+    def close(self):
+        pass
+
+
+class FakeError(Exception):
+    pass
+
+
+class FakePoolError(FakeError):
+    pass
+
+
+fake_mariadb = types.SimpleNamespace(ConnectionPool=FakeConnectionPool, Error=FakeError, PoolError=FakePoolError)
+
+
+@pytest.fixture(autouse=True)
+def fake_db(monkeypatch):
+    monkeypatch.setattr(db, "mariadb", fake_mariadb)
+    monkeypatch.setattr(db, "_pools", {})
+    monkeypatch.setattr(db, "_prepared", {})
+
+
+def test_connections_are_reused_with_their_prepared_cursors():
+    conn = db.connect()
+    cursor = db.prepared(conn, "SELECT 1")
+    raw = conn._conn
+    conn.close()
+
+    conn = db.connect()
+    assert conn._conn is raw
+    assert db.prepared(conn, "SELECT 1") is cursor
+    conn.close()
+    assert db.pool_stats()["default"]["opened"] == 1
+
+
+def test_saturated_pool_times_out():
+    db._pools[()] = db.Pool(size=1, acquire_timeout=0.1)
+    held = db.connect()
+    with pytest.raises(FakePoolError):
+        db.connect()
+    stats = db.pool_stats()["default"]
+    assert (stats["in_use"], stats["waited"], stats["timeouts"]) == (1, 1, 1)
+    held.close()
+    db.connect().close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_leaves_the_parents_connections_alone():
+    conn = db.connect()
+    db.prepared(conn, "SELECT 1")
+    inherited = id(conn._conn)
+    conn.close()
+    del conn  # only the module state refers to the pool now
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            gc.collect()
+            child = db.connect()
+            ok = inherited not in FakeConnection.deallocated and id(child._conn) != inherited \
+                and db.pool_stats()["default"]["opened"] == 1
+            os.write(write, b"ok" if ok else b"fail")
+        finally:
+            os._exit(0)
+    os.close(write)
+    result = os.read(read, 16)
+    os.close(read)
+    os.waitpid(pid, 0)
+    assert result == b"ok"
@@ -0,0 +1,34 @@
+import backtrader as bt
+import pytest
+
+from synthetic import minute_bars
+from test_backtrader import build_cerebro, summarize
+
+
+def run(df, fast, **strategy_params):
+    cerebro = build_cerebro(df, stdstats=False, fast=fast, **strategy_params)
+    cerebro.addanalyzer(bt.analyzers.Transactions, _name="tx")
+    results = cerebro.run()
+    return results[0].analyzers.tx.get_analysis(), summarize(cerebro, results)
+
+
+@pytest.mark.parametrize("seed, strategy_params", [
+    (0, {}),
+    (1, {}),
+    (2, {"sma_period": 5, "wma_period": 40, "stop_loss": 0.995, "limit_valid_bars": 1}),
+])
+def test_fast_strategy_matches_mystrategy(seed, strategy_params):
+    df = minute_bars(15_000, seed=seed)
+    slow_transactions, slow_summary = run(df, False, **strategy_params)
+    fast_transactions, fast_summary = run(df, True, **strategy_params)
+
+    assert slow_summary["trades"] > 0
+    assert fast_transactions == slow_transactions
+    assert fast_summary == slow_summary
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_build_cerebro_passes_the_timeframe(fast):
+    cerebro = build_cerebro(minute_bars(500), fast=fast, timeframe="5m")
+    data = cerebro.datas[0]
+    assert (data._timeframe, data._compression) == (bt.TimeFrame.Minutes, 5)
@@ -0,0 +1,50 @@
+import os
+
+import backtrader as bt
+import numpy as np
+import pytest
+
+from synthetic import minute_bars
+from test_backtrader import build_cerebro, summarize
+
+
+def run(data, feed, **run_kwargs):
+    cerebro = build_cerebro(data, stdstats=False, feed=feed)
+    cerebro.addanalyzer(bt.analyzers.Transactions, _name="tx")
+    results = cerebro.run(**run_kwargs)
+    # [size, price, sid, data name, value] without the name, a directory feed is named after its path
+    transactions = {dt: [entry[:3] + entry[4:] for entry in entries]
+                    for dt, entries in results[0].analyzers.tx.get_analysis().items()}
+    return transactions, summarize(cerebro, results)
+
+
+@pytest.fixture(scope="module")
+def df():
+    return minute_bars(20_000)
+
+
+@pytest.fixture(scope="module")
+def expected(df):
+    return run(df, "pandas")
+
+
+def test_array_feed_matches_pandas_feed(df, expected):
+    transactions, summary = run(df, "array")
+    assert expected[1]["trades"] > 0
+    assert transactions == expected[0]
+    assert summary == expected[1]
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+def test_array_feed_with_exactbars(df, expected, memmap, tmp_path):
+    data = df
+    if memmap:
+        # a bar_cache directory of .npy files, as bench_feed's memmap-exactbars mode reads it
+        np.save(os.path.join(tmp_path, "datetime.npy"),
+                df["datetime"].to_numpy(dtype="datetime64[s]").astype(np.int64))
+        for column in ("open", "high", "low", "close", "volume"):
+            np.save(os.path.join(tmp_path, f"{column}.npy"), df[column].to_numpy())
+        data = str(tmp_path)
+    transactions, summary = run(data, "array", exactbars=1)
+    assert transactions == expected[0]
+    assert summary == expected[1]
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from array_feed import frame_columns
+from backtest import limit_order_backtest
+from synthetic import minute_bars
+from test_backtrader import MyStrategy, build_cerebro, strategy_signals
+
+
+def compare(n, seed, cash=7000, **strategy_params):
+    params = {**MyStrategy.params._getpairs(), **strategy_params}
+    columns = frame_columns(minute_bars(n, seed=seed))
+    signals = strategy_signals(columns, params["sma_period"], params["wma_period"])
+    cerebro = build_cerebro(columns, cash=cash, stdstats=False, fast=True, signals=signals, **strategy_params)
+    expected = cerebro.run()[0].analyzers.trades.get_analysis()
+
+    trades, final_cash, value = limit_order_backtest(
+        columns, signals, cash, params["stop_loss"], params["limit_valid_bars"],
+        start=max(params["sma_period"], params["wma_period"]) - 1)
+    closed = [trade for trade in trades if "exit_index" in trade]
+
+    assert len(closed) == len(expected["pnl"])
+    # bit for bit: the same float operations as the broker and the Trade
+    assert np.array_equal([trade["pnl"] for trade in closed], expected["pnl"])
+    assert np.array_equal(np.array([trade["entry_time"] for trade in closed], dtype="datetime64[s]"),
+                          expected["entry_time"])
+    assert np.array_equal(np.array([trade["exit_time"] for trade in closed], dtype="datetime64[s]"),
+                          expected["exit_time"])
+    assert final_cash == cerebro.broker.getcash()
+    assert value == cerebro.broker.getvalue()
+    return trades
+
+
+@pytest.mark.parametrize("seed, strategy_params", [
+    (0, {}),
+    (1, {}),
+    (2, {"limit_valid_bars": 0}),
+    (3, {"limit_valid_bars": 10, "stop_loss": 0.995, "sma_period": 5, "wma_period": 40}),
+])
+def test_matches_fast_strategy(seed, strategy_params):
+    assert compare(20_000, seed, **strategy_params)
+
+
+def test_cash_for_few_shares():
+    # about one share per entry, some signals cannot afford any
+    compare(20_000, 8, cash=20)
+
+
+def test_open_position_at_the_end():
+    # the bars end on a fill bar: the position is still open
+    trades = compare(20_000, 0)
+    cut = trades[len(trades) // 2]["entry_index"] + 1
+    trades = compare(cut, 0)
+    assert "exit_index" not in trades[-1]
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+import bar_cache
+import indicator_cache
+import sweep
+import walkforward
+from indicator_cache import IndicatorCache
+from indicators import moving_averages
+from synthetic import minute_bars
+
+PERIODS = {"sma_periods": (5, 30), "wma_periods": (20,)}
+
+
+def columns(df):
+    result = {name: df[name].to_numpy(dtype=dtype) for name, dtype in bar_cache.COLUMNS.items()}
+    result["datetime"] = df["datetime"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    return result
+
+
+@pytest.fixture
+def bars():
+    return columns(minute_bars(5000, seed=8))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return IndicatorCache(str(tmp_path / "indicators"), bar_cache_dir=str(tmp_path))
+
+
+def write_bars(cache, bars, version, changes):
+    bar_cache.write_cache("AAA", bars, {"rows": len(bars["datetime"]), "version": version, "changes": changes},
+                          cache.bar_cache_dir)
+
+
+def assert_matches(result, close):
+    expected = moving_averages(close, **PERIODS)
+    for key, values in result.items():
+        np.testing.assert_allclose(values, expected[key], rtol=0, atol=1e-9 * np.abs(close).max(), equal_nan=True)
+
+
+def test_appended_bars_extend_the_series(cache, bars):
+    write_bars(cache, {name: values[:4000] for name, values in bars.items()}, 1, {"1": 0})
+    cache.moving_averages("AAA", **PERIODS)
+    assert cache.stats()["computed"] == 3
+
+    write_bars(cache, bars, 2, {"1": 0, "2": 4000})
+    assert_matches(cache.moving_averages("AAA", **PERIODS), bars["close"])
+    assert (cache.stats()["extended"], cache.stats()["computed"]) == (3, 3)
+
+    cache.moving_averages("AAA", **PERIODS)
+    assert cache.stats()["hits"] == 3
+
+
+def test_rewritten_bars_are_recomputed_from_the_change(cache, bars):
+    write_bars(cache, bars, 1, {"1": 0})
+    before = cache.get("AAA", "SMA", 5).copy()
+    rewritten = {name: values.copy() for name, values in bars.items()}
+    rewritten["close"][3000] += 1.0
+    write_bars(cache, rewritten, 2, {"1": 0, "2": 3000})
+
+    after = cache.get("AAA", "SMA", 5)
+    assert cache.stats()["extended"] == 1
+    np.testing.assert_array_equal(after[:3000], before[:3000])
+    assert after[3000] == pytest.approx(before[3000] + 1.0 / 5)
+    assert_matches({("SMA", 5): after}, rewritten["close"])
+
+
+@pytest.mark.parametrize("version, changes, rebuilt", [
+    (3, {"1": 0, "3": 4000}, False),  # the changes of version 2 are not known any more
+    (1, {"1": 0}, True),  # a rebuilt bar cache restarts its versions, the last row shows it
+])
+def test_unknown_changes_invalidate_the_series(cache, bars, version, changes, rebuilt):
+    write_bars(cache, {name: values[:4000] for name, values in bars.items()}, 1, {"1": 0})
+    cache.moving_averages("AAA", **PERIODS)
+    new = {name: values.copy() for name, values in bars.items()}
+    if rebuilt:
+        new["datetime"] -= 86400
+    write_bars(cache, new, version, changes)
+
+    assert_matches(cache.moving_averages("AAA", **PERIODS), new["close"])
+    assert (cache.stats()["extended"], cache.stats()["computed"]) == (0, 6)
+
+
+def test_slice_keeps_the_warm_up(cache, bars):
+    write_bars(cache, bars, 1, {"1": 0})
+    ma = cache.moving_averages("AAA", times=bars["datetime"][1000:2000], **PERIODS)
+    expected = moving_averages(bars["close"], **PERIODS)
+    for key, values in ma.items():
+        assert len(values) == 1000 and not np.isnan(values).any()
+        np.testing.assert_allclose(values, expected[key][1000:2000], rtol=0, atol=1e-9 * bars["close"].max())
+
+
+@pytest.fixture
+def cached_frame(cache, bars, monkeypatch):
+    """The cached bars of AAA, with the default IndicatorCache on them."""
+    write_bars(cache, bars, 1, {"1": 0})
+    monkeypatch.setattr(indicator_cache, "_default", cache)
+    frame = bar_cache.load_frame("AAA", sync_first=False, cache_dir=cache.bar_cache_dir)
+    return frame
+
+
+def test_sweep_signals_from_the_cache(cached_frame, cache, tmp_path):
+    grid = sweep.param_grid(sma_period=[5, 10], wma_period=[20, 40])
+    expected = sweep.run_sweep(cached_frame, grid, str(tmp_path / "plain.jsonl"), processes=2, fast=True)
+    result = sweep.run_sweep(cached_frame, grid, str(tmp_path / "cached.jsonl"), processes=2, fast=True,
+                             symbol="AAA")
+    assert cache.stats()["computed"] == 4
+    key = ["sma_period", "wma_period"]
+    assert expected["trades"].sum() > 0
+    assert result.sort_values(key).reset_index(drop=True).equals(expected.sort_values(key).reset_index(drop=True))
+
+
+@pytest.mark.parametrize("engine", walkforward.ENGINES)
+def test_walk_forward_averages_from_the_cache(cached_frame, cache, engine):
+    grid = sweep.param_grid(sma_period=[5, 10], wma_period=[20, 40], stop_loss=[0.99])
+    expected = walkforward.walk_forward(cached_frame, grid, 2, 1, engine=engine, processes=2)
+    result = walkforward.walk_forward(cached_frame, grid, 2, 1, engine=engine, processes=2, symbol="AAA")
+    assert cache.stats()["computed"] == 4
+    assert len(expected[0]) > 1
+    assert result[0].equals(expected[0])
+    assert result[1].equals(expected[1])
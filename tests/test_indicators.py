@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+from indicators import BLOCK_SIZE, TOLERANCE, StreamingSMA, StreamingWMA, moving_averages, sma, wma
+from synthetic import minute_bars
+
+SMA_PERIODS = (10, 4000)
+WMA_PERIODS = (110, 400)
+
+
+def reference(close):
+    """The pandas rolling windows moving_averages() replaced."""
+    series = pd.Series(close)
+    result = {("SMA", p): series.rolling(window=p).mean().to_numpy() for p in SMA_PERIODS}
+    for p in WMA_PERIODS:
+        weights = np.arange(1, p + 1)
+        result[("WMA", p)] = series.rolling(p).apply(lambda x: (x * weights).sum() / weights.sum(),
+                                                     raw=True).to_numpy()
+    return result
+
+
+@pytest.fixture(scope="module")
+def long_series():
+    # longer than one block, so the windows across block boundaries are compared too
+    close = minute_bars(BLOCK_SIZE + 5000, seed=3)["close"].to_numpy()
+    return close, reference(close)
+
+
+def assert_within_tolerance(result, expected, close):
+    for key, values in expected.items():
+        assert np.array_equal(np.isnan(result[key]), np.isnan(values)), key
+        error = np.nanmax(np.abs(result[key] - values))
+        assert error <= TOLERANCE * np.abs(close).max(), (key, error)
+
+
+def test_matches_rolling_reference_across_blocks(long_series):
+    close, expected = long_series
+    assert len(close) > BLOCK_SIZE
+    assert_within_tolerance(moving_averages(close, SMA_PERIODS, WMA_PERIODS), expected, close)
+
+
+@pytest.mark.parametrize("block_size", [4000, 5003, 20_000])
+def test_block_size_does_not_change_the_result(long_series, block_size):
+    close, expected = long_series
+    assert_within_tolerance(moving_averages(close, SMA_PERIODS, WMA_PERIODS, block_size=block_size),
+                            expected, close)
+
+
+def test_short_series_is_all_nan():
+    close = minute_bars(50)["close"].to_numpy()
+    result = moving_averages(close, (10, 100), (110,))
+    assert not np.isnan(result[("SMA", 10)][9:]).any()
+    assert np.isnan(result[("SMA", 100)]).all()
+    assert np.isnan(result[("WMA", 110)]).all()
+
+
+# the running sums of the streaming indicators stay this close to the batch ones
+STREAMING_TOLERANCE = 1e-11
+STREAMING = [(StreamingSMA, sma), (StreamingWMA, wma)]
+
+
+def stream(indicator, close, revisions=()):
+    """Values of indicator after every bar; each bar is first added as revisions[0] and revised."""
+    values = []
+    for x in close:
+        if revisions:
+            indicator.update(revisions[0])
+            for revision in revisions[1:]:
+                indicator.revise(revision)
+            indicator.revise(x)
+        else:
+            indicator.update(x)
+        values.append(indicator.value)
+    return np.array(values)
+
+
+def assert_matches_batch(values, expected, close):
+    assert np.array_equal(np.isnan(values), np.isnan(expected))
+    assert np.nanmax(np.abs(values - expected)) <= STREAMING_TOLERANCE * np.abs(close).max()
+
+
+@pytest.mark.parametrize("streaming, batch", STREAMING)
+@pytest.mark.parametrize("period", [1, 7, 110])
+def test_streaming_matches_batch(streaming, batch, period):
+    close = minute_bars(5000, seed=4)["close"].to_numpy()
+    assert_matches_batch(stream(streaming(period), close), batch(close, period), close)
+
+
+@pytest.mark.parametrize("streaming, batch", STREAMING)
+def test_revised_last_bar(streaming, batch):
+    # IB sends the forming bar many times, only its last close counts
+    close = minute_bars(3000, seed=5)["close"].to_numpy()
+    values = stream(streaming(20), close, revisions=(25.0, 17.5, 30.0))
+    assert_matches_batch(values, batch(close, 20), close)
+
+
+def test_revise_before_the_first_bar_adds_it():
+    indicator = StreamingWMA(2)
+    indicator.revise(4.0)
+    indicator.update(1.0)
+    assert indicator.count == 2
+    assert indicator.value == (4.0 + 2 * 1.0) / 3
+
+
+@pytest.mark.parametrize("streaming, batch", STREAMING)
+def test_resync(streaming, batch, monkeypatch):
+    monkeypatch.setattr(indicators, "RESYNC_UPDATES", 7)
+    close = minute_bars(2000, seed=6)["close"].to_numpy()
+    indicator = streaming(30)
+    values = stream(indicator, close, revisions=(25.0,))
+    assert indicator.updates == 2 * len(close)
+    assert_matches_batch(values, batch(close, 30), close)
+
+    # a resync recomputes the sums from the window, drifted sums are replaced
+    indicator.total += 1.0
+    if isinstance(indicator, StreamingWMA):
+        indicator.weighted -= 1.0
+    for _ in range(indicators.RESYNC_UPDATES - indicator.updates % indicators.RESYNC_UPDATES):
+        indicator.revise(close[-1])
+    assert indicator.value == pytest.approx(batch(close, 30)[-1], abs=STREAMING_TOLERANCE * close.max())
@@ -0,0 +1,88 @@
+import threading
+from datetime import datetime
+
+from ingest import BarWriter
+
+
+class FakeCursor:
+    def __init__(self, written):
+        self.written = written
+
+    def executemany(self, sql, rows):
+        for row in rows:
+            if row[0] is None:
+                raise TypeError("symbol must not be None")
+        self.written.extend(rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, written):
+        self.written = written
+        self.closed = False
+
+    def cursor(self, prepared=False):
+        return FakeCursor(self.written)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def rows(n, symbol="TEST"):
+    return [(symbol, datetime(2024, 1, 2, 9, 30 + i % 30), 1.0, 1.0, 1.0, 1.0, 100) for i in range(n)]
+
+
+def finishes(func, timeout=10):
+    thread = threading.Thread(target=func, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_writes_batches():
+    written = []
+    writer = BarWriter(batch_size=10, queue_batches=1, connect=lambda: FakeConnection(written))
+    for row in rows(25):
+        writer.add(row)
+    writer.close()
+    assert len(written) == 25
+    assert writer.stats()["rows_written"] == 25
+    assert writer.stats()["batches_written"] == 3
+
+
+def test_bad_row_drops_its_batch_and_writer_keeps_going():
+    written = []
+    writer = BarWriter(batch_size=10, queue_batches=1, connect=lambda: FakeConnection(written))
+
+    def feed():
+        for row in rows(10) + rows(10, symbol=None) + rows(40):
+            writer.add(row)
+        writer.flush()
+
+    # more batches than the queue holds: a dead writer thread would block add()
+    assert finishes(feed)
+    assert isinstance(writer.error, TypeError)
+    assert writer.rows_failed == 10
+    assert writer.rows_written == 50
+    assert finishes(writer.close)
+
+
+def test_failing_connect_does_not_block_the_caller():
+    def connect():
+        raise ValueError("bad connection options")
+
+    writer = BarWriter(batch_size=5, queue_batches=1, connect=connect)
+
+    def feed():
+        for row in rows(30):
+            writer.add(row)
+        writer.close()
+
+    assert finishes(feed)
+    assert writer.rows_failed == 30
+    assert isinstance(writer.error, ValueError)
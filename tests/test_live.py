@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from array_feed import frame_columns
+from live import CrossoverMonitor
+from synthetic import minute_bars
+from test_backtrader import strategy_signals
+
+SMA_PERIOD, WMA_PERIOD, STOP_LOSS = 5, 20, 0.995
+
+
+@pytest.fixture(scope="module")
+def bars():
+    columns = frame_columns(minute_bars(4000, seed=7))
+    columns["datetime"] = columns["datetime"].astype("datetime64[s]").astype(np.int64)
+    return columns
+
+
+def bar_times(bars):
+    return [datetime(1970, 1, 1) + timedelta(seconds=int(t)) for t in bars["datetime"]]
+
+
+def replay(monitor, bars, forming=True):
+    """Feed the bars as TWS does with keepUpToDate: the forming bar is sent again on every change."""
+    # Python floats as from ibapi, round() of np.float64 rounds halves differently
+    for bar_time, open_, close in zip(bar_times(bars), bars["open"].tolist(), bars["close"].tolist()):
+        if forming:
+            monitor.on_bar(bar_time, open_, open_)
+            monitor.on_bar(bar_time, open_, (open_ + close) / 2)
+        monitor.on_bar(bar_time, open_, close)
+
+
+def expected_signals(bars):
+    """Signals of the MyStrategy rules on the batch SMA/WMA of strategy_signals()."""
+    signals = strategy_signals(bars, SMA_PERIOD, WMA_PERIOD)
+    times, close = bar_times(bars), bars["close"]
+    expected, entry_price = [], None
+    # the last bar is still forming, it is evaluated when the next one starts
+    for i in range(len(close) - 1):
+        if signals["flat"][i]:
+            continue
+        if entry_price is None:
+            if signals["entry"][i]:
+                entry_price = close[i]
+                expected.append(("entry", times[i], close[i]))
+        else:
+            stop = close[i] < entry_price * STOP_LOSS
+            if signals["exit"][i] and not stop:
+                expected.append(("exit", times[i], close[i]))
+                entry_price = None
+            elif stop and not signals["exit"][i]:
+                expected.append(("stop", times[i], close[i]))
+                entry_price = None
+    return expected
+
+
+@pytest.mark.parametrize("forming", [False, True])
+def test_signals_on_replayed_bars(bars, forming):
+    emitted = []
+    monitor = CrossoverMonitor(SMA_PERIOD, WMA_PERIOD, STOP_LOSS,
+                               on_signal=lambda *signal: emitted.append(signal))
+    monitor.live = True
+    replay(monitor, bars, forming)
+
+    expected = expected_signals(bars)
+    assert {kind for kind, _, _ in expected} == {"entry", "exit", "stop"}
+    assert emitted == expected
+    assert len(monitor.latencies) == len(emitted)
+
+
+def test_history_is_replayed_silently(bars):
+    emitted = []
+    monitor = CrossoverMonitor(SMA_PERIOD, WMA_PERIOD, STOP_LOSS,
+                               on_signal=lambda *signal: emitted.append(signal))
+    history = 3000
+    replay(monitor, {name: values[:history] for name, values in bars.items()})
+    assert emitted == []
+    monitor.live = True
+    replay(monitor, {name: values[history:] for name, values in bars.items()})
+
+    # the position carried over from the history decides the first live signals
+    assert emitted == [signal for signal in expected_signals(bars) if signal[1] >= bar_times(bars)[history - 1]]
+    assert monitor.latency_report().startswith(f"signals: {len(emitted)}")
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bar_cache
+import bars
+import rollups
+from sessions import RTH, segments
+from synthetic import minute_bars
+from test_backtrader import build_cerebro, closed_trade_stats, strategy_signals
+
+# two days and a half, so the last buckets of every timeframe are incomplete
+MINUTES = 2 * 960 + 400
+
+
+def frame_columns(df):
+    """Column arrays as in the bar cache, datetime in epoch seconds."""
+    columns = {name: df[name].to_numpy(dtype=dtype) for name, dtype in bars.COLUMNS.items()}
+    columns["datetime"] = df["datetime"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    return columns
+
+
+def resample(df, timeframe):
+    """pandas reference, with the labels of rollups.rollup()."""
+    seconds = rollups.TIMEFRAMES[timeframe]
+    offset = "0min" if seconds == 86400 else f"{rollups.SESSION_OPEN % seconds}s"
+    resampled = df.resample(f"{seconds}s", on="datetime", offset=offset).agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}).dropna().reset_index()
+    if seconds == 86400:
+        resampled["datetime"] += pd.Timedelta(seconds=rollups.SESSION_OPEN)
+    return resampled.astype({"volume": np.int64})
+
+
+@pytest.mark.parametrize("timeframe", rollups.ROLLUPS)
+def test_rollup_matches_resample(timeframe):
+    df = minute_bars(MINUTES)
+    result = bars.to_frame(rollups.rollup(frame_columns(df), timeframe))
+    pd.testing.assert_frame_equal(result.astype({"volume": np.int64}), resample(df, timeframe))
+
+
+def test_daily_bars_are_labeled_at_the_open():
+    times = rollups.rollup(frame_columns(minute_bars(MINUTES)), "1d")["datetime"]
+    assert (times % 86400 == rollups.SESSION_OPEN).all()
+    assert (segments(times) == RTH).all()
+
+
+def test_append_matches_full_rollup(tmp_path):
+    columns = frame_columns(minute_bars(MINUTES))
+    base = MINUTES - 300  # within the last day
+    bar_cache.write_cache("AAA", {name: values[:base] for name, values in columns.items()},
+                          {"rows": base, "version": 1, "changes": {"1": 0}}, tmp_path)
+    rollups.sync_rollups("AAA", rollups.ROLLUPS, tmp_path)
+    bar_cache.write_cache("AAA", columns, {"rows": MINUTES, "version": 2, "changes": {"1": 0, "2": base}}, tmp_path)
+    aggregated = rollups.sync_rollups("AAA", rollups.ROLLUPS, tmp_path)
+
+    assert aggregated["1d"] == 1  # only the last day again
+    for timeframe in rollups.ROLLUPS:
+        expected = rollups.rollup(columns, timeframe)
+        stored = rollups.read_rollup("AAA", timeframe, tmp_path)
+        for name in expected:
+            np.testing.assert_array_equal(stored[name], expected[name])
+
+
+def test_rollup_of_another_format_is_rebuilt(tmp_path):
+    columns = frame_columns(minute_bars(MINUTES))
+    bar_cache.write_cache("AAA", columns, {"rows": MINUTES, "version": 1, "changes": {"1": 0}}, tmp_path)
+    rollups.sync_rollups("AAA", ("1d",), tmp_path)
+    cached, meta = bar_cache.read_cache(rollups.cache_name("AAA", "1d"), tmp_path)
+    old = {name: np.array(values) for name, values in cached.items()}
+    old["datetime"] -= rollups.SESSION_OPEN  # daily bars as FORMAT 1 labeled them
+    bar_cache.write_cache(rollups.cache_name("AAA", "1d"), old, {**meta, "format": 1}, tmp_path)
+
+    assert rollups.sync_rollups("AAA", ("1d",), tmp_path) == {"1d": 3}
+    assert (rollups.read_rollup("AAA", "1d", tmp_path)["datetime"] % 86400 == rollups.SESSION_OPEN).all()
+
+
+def test_strategy_trades_on_daily_bars():
+    daily = rollups.rollup(frame_columns(minute_bars(120 * 960)), "1d")
+    assert strategy_signals(daily, 3, 5)["entry"].any()
+    cerebro = build_cerebro(daily, stdstats=False, timeframe="1d", sma_period=3, wma_period=5)
+    assert closed_trade_stats(cerebro, cerebro.run())["trades"] > 0
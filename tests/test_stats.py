@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from stats import compound, longest_run, max_drawdown, trade_stats
+from synthetic import minute_bars
+from test_backtrader import build_cerebro, closed_trade_stats, summarize
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_trade_stats_matches_trade_analyzer(seed):
+    cerebro = build_cerebro(minute_bars(20_000, seed=seed), stdstats=False, fast=True)
+    results = cerebro.run()
+    ta = results[0].analyzers.ta.get_analysis()
+    stats = closed_trade_stats(cerebro, results)
+
+    assert stats["trades"] == ta.total.closed > 0
+    assert stats["wins"] == ta.won.total
+    assert stats["losses"] == ta.lost.total
+    assert stats["longest_loss_streak"] == ta.streak.lost.longest
+    assert stats["won_total"] == ta.won.pnl.total
+    assert stats["lost_total"] == ta.lost.pnl.total
+    assert stats["risk_reward"] == ta.won.pnl.average / -ta.lost.pnl.average
+    assert stats["winrate"] == ta.won.total / ta.total.closed
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_bounded_memory_run(fast):
+    # exactbars=1 keeps no history: the analyzers must not read it after the run
+    df = minute_bars(8_000, seed=2)
+    expected = build_cerebro(df, stdstats=False, fast=fast)
+    expected_summary = summarize(expected, expected.run())
+    cerebro = build_cerebro(df, stdstats=False, fast=fast)
+    results = cerebro.run(exactbars=1)
+    assert summarize(cerebro, results) == expected_summary
+    assert results[0].analyzers.trades.get_analysis()["end"] == df["datetime"].iloc[-1]
+
+
+def test_trade_stats_by_hand():
+    stats = trade_stats([10.0, -5.0, -5.0, 0.0, -1.0], 100)
+    assert (stats["trades"], stats["wins"], stats["losses"]) == (5, 2, 3)
+    assert stats["longest_loss_streak"] == 2  # a pnl of 0 counts as won
+    assert stats["final_deposit"] == 99.0
+    assert stats["max_drawdown"] == pytest.approx(11 / 110)
+
+
+def test_compound_multiplies_in_loop_order():
+    returns, equity = compound([10.0, 20.0], [11.0, 19.0], 7000)
+    deposit = 7000
+    for trade_return in returns:
+        deposit *= (1 + trade_return)
+    assert equity[-1] == deposit
+    assert np.allclose(returns, [0.1, -0.05])
+
+
+def test_helpers():
+    assert longest_run([True, True, False, True]) == 2
+    assert longest_run([]) == 0
+    assert max_drawdown([100.0, 120.0, 90.0, 130.0]) == pytest.approx(0.25)
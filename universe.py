@@ -0,0 +1,190 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+import zlib
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from array_feed import frame_columns
+from backtest import limit_order_backtest
+from stats import compound, trade_stats
+from test_backtrader import MyStrategy, build_cerebro, fetch_historical_data, strategy_signals, summarize
+from test_strategy import calculate_moving_averages, iterative_backtest
+
+ENGINES = ("iterative", "mystrategy", "limit")
+DEFAULT_CASH = 7000
+
+
+def _load(symbol, synthetic):
+    if synthetic:
+        from synthetic import minute_bars
+        # a different but repeatable random walk per symbol
+        return minute_bars(synthetic, seed=zlib.crc32(symbol.encode()))
+    return fetch_historical_data(symbol)
+
+
+def _run_iterative(df, symbol, cash, synthetic):
+    # the test_strategy pipeline: cached moving averages, warm-up rows dropped, closed trades only
+    df = calculate_moving_averages(df, None if synthetic else symbol).dropna().reset_index(drop=True)
+    trade_list = []
+    iterative_backtest(df, trade_list)
+    closed = [trade for trade in trade_list if "exit_price" in trade]
+    _, equity = compound([t["entry_price"] for t in closed], [t["exit_price"] for t in closed], cash)
+    exit_time = np.array([t["exit_time"] for t in closed], dtype="datetime64[s]")
+    metrics = trade_stats(np.diff(equity), cash,
+                          np.array([t["entry_time"] for t in closed], dtype="datetime64[s]"), exit_time,
+                          df["datetime"].iloc[0], df["datetime"].iloc[-1])
+    return metrics, exit_time, equity[1:]
+
+
+def _run_mystrategy(df, cash, fast, strategy_params):
+    cerebro = build_cerebro(df, cash=cash, stdstats=False, fast=fast, **strategy_params)
+    results = cerebro.run(maxcpus=1)
+    metrics = summarize(cerebro, results)
+    trades = results[0].analyzers.trades.get_analysis()
+    # the last point is the broker value at the last bar, an open position included
+    exit_time = np.append(trades["exit_time"], np.datetime64(df["datetime"].iloc[-1], "s"))
+    equity = np.append(cash + np.cumsum(trades["pnl"]), cerebro.broker.getvalue())
+    return metrics, exit_time, equity
+
+
+def _run_limit(df, cash, strategy_params):
+    # MyStrategy's trades and broker value without cerebro (see backtest.limit_order_backtest)
+    params = {**MyStrategy.params._getpairs(), **strategy_params}
+    columns = frame_columns(df)
+    signals = strategy_signals(columns, params["sma_period"], params["wma_period"])
+    trades, _, value = limit_order_backtest(columns, signals, cash, params["stop_loss"], params["limit_valid_bars"],
+                                            start=max(params["sma_period"], params["wma_period"]) - 1)
+    closed = [trade for trade in trades if "exit_index" in trade]
+    pnl = np.array([trade["pnl"] for trade in closed], dtype=np.float64)
+    exit_time = np.array([trade["exit_time"] for trade in closed], dtype="datetime64[s]")
+    times = columns["datetime"]
+    metrics = trade_stats(pnl, cash, np.array([trade["entry_time"] for trade in closed], dtype="datetime64[s]"),
+                          exit_time, times[0], times[-1])
+    # like summarize(): the broker value, an open position included
+    metrics.update(final_deposit=value, profitability=value / cash - 1)
+    equity = np.append(cash + np.cumsum(pnl), value)
+    return metrics, np.append(exit_time, np.datetime64(times[-1], "s")), equity
+
+
+def run_symbol(symbol, engine="iterative", cash=DEFAULT_CASH, fast=False, synthetic=None, strategy_params=None):
+    """Backtest one symbol in a worker, returns (result row, equity curve).
+
+    The row holds the symbol, its bar count, the run time and the metrics of
+    the engine (or an error); the curve is (times, equity after each trade).
+    """
+    start = time.perf_counter()
+    try:
+        df = _load(symbol, synthetic)
+        if df is None or not len(df):
+            raise ValueError("no bars")
+        if engine == "iterative":
+            metrics, exit_time, equity = _run_iterative(df, symbol, cash, synthetic)
+        elif engine == "limit":
+            metrics, exit_time, equity = _run_limit(df, cash, strategy_params or {})
+        else:
+            metrics, exit_time, equity = _run_mystrategy(df, cash, fast, strategy_params or {})
+    except Exception as err:
+        return {"symbol": symbol, "error": f"{type(err).__name__}: {err}"}, None
+    row = {"symbol": symbol, "bars": len(df), "seconds": time.perf_counter() - start, **metrics}
+    return row, (exit_time, equity)
+
+
+def portfolio_equity(curves, cash=DEFAULT_CASH):
+    """Equal-weight portfolio of per-symbol equity curves.
+
+    Every symbol gets cash / len(curves) and follows its own curve (each one
+    run with `cash`), the portfolio value at a time is the sum of the
+    symbols' values after their last trade until then.
+    """
+    curves = {symbol: curve for symbol, curve in curves.items() if curve is not None}
+    if not curves:
+        return pd.DataFrame(columns=["datetime", "equity"])
+    times = np.unique(np.concatenate([np.asarray(t, dtype="datetime64[s]") for t, _ in curves.values()]))
+    share = cash / len(curves)
+    total = np.zeros(len(times))
+    for exit_time, equity in curves.values():
+        exit_time = np.asarray(exit_time, dtype="datetime64[s]")
+        # value of the symbol at every portfolio time: its equity after the last exit so far
+        steps = np.concatenate(([cash], np.asarray(equity, dtype=np.float64)))
+        order = np.argsort(exit_time, kind="stable")
+        at = np.searchsorted(exit_time[order], times, side="right")
+        total += steps[np.concatenate(([0], order + 1))[at]] / cash * share
+    return pd.DataFrame({"datetime": times, "equity": total})
+
+
+def run_universe(symbols, engine="iterative", cash=DEFAULT_CASH, processes=None, results_path=None, fast=False,
+                 synthetic=None, **strategy_params):
+    """Backtest every symbol in parallel worker processes.
+
+    Each worker loads the bars of its symbol once (bar cache, synced with
+    the DB over the process's own connection pool) and runs
+    iterative_backtest (engine="iterative"), MyStrategy ("mystrategy",
+    FastStrategy with fast=True) or its array replay ("limit", the same
+    trades without cerebro). Rows are streamed to results_path as
+    JSON lines as the symbols finish. Returns (table, portfolio): one row per
+    symbol and the equal-weight portfolio_equity() of their curves.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {ENGINES}")
+    symbols = list(dict.fromkeys(symbols))
+    run = partial(run_symbol, engine=engine, cash=cash, fast=fast, synthetic=synthetic,
+                  strategy_params=strategy_params)
+    rows, curves = [], {}
+    processes = min(processes or os.cpu_count(), len(symbols))
+    out = open(results_path, "w") if results_path else None
+    try:
+        with mp.Pool(processes) as pool:
+            for i, (row, curve) in enumerate(pool.imap_unordered(run, symbols), start=1):
+                rows.append(row)
+                curves[row["symbol"]] = curve
+                if out:
+                    out.write(json.dumps(row, default=str) + "\n")
+                    out.flush()
+                status = row.get("error") or f"{row['trades']} trades, {row['profitability']:.2%}"
+                print(f"Universe: {i}/{len(symbols)} {row['symbol']}: {status}")
+    finally:
+        if out:
+            out.close()
+
+    order = {symbol: i for i, symbol in enumerate(symbols)}
+    table = pd.DataFrame(sorted(rows, key=lambda row: order[row["symbol"]]))
+    return table, portfolio_equity(curves, cash)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crossover backtest over a universe of symbols")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--engine", choices=ENGINES, default="iterative")
+    parser.add_argument("--fast", action="store_true", help="run FastStrategy on precomputed signals")
+    parser.add_argument("--sma", type=int, default=None)
+    parser.add_argument("--wma", type=int, default=None)
+    parser.add_argument("--stop-loss", type=float, default=None)
+    parser.add_argument("--cash", type=float, default=DEFAULT_CASH)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--synthetic", type=int, default=None, metavar="BARS",
+                        help="synthetic.minute_bars(BARS) per symbol instead of the DB")
+    parser.add_argument("--out", default="universe", help="output prefix")
+    args = parser.parse_args()
+
+    params = {key: value for key, value in
+              (("sma_period", args.sma), ("wma_period", args.wma), ("stop_loss", args.stop_loss))
+              if value is not None}
+    if params and args.engine == "iterative":
+        parser.error("--sma/--wma/--stop-loss apply to --engine mystrategy/limit, iterative_backtest has fixed ones")
+
+    with profiling.run_from_env("universe"):
+        results, portfolio = run_universe(args.symbols, args.engine, args.cash, args.processes,
+                                          f"{args.out}_results.jsonl", args.fast, args.synthetic, **params)
+    portfolio.to_csv(f"{args.out}_portfolio.csv", index=False)
+
+    pd.set_option("display.max_columns", None)
+    pd.set_option("display.width", 1200)
+    print(results.to_string(index=False))
+    final = portfolio["equity"].iloc[-1] if len(portfolio) else args.cash
+    print(f"Equal-weight portfolio: {args.cash} -> {final:.2f} ({final / args.cash - 1:.2%})")
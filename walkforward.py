@@ -0,0 +1,318 @@
+import argparse
+import multiprocessing as mp
+import os
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from backtest import crossover_backtest
+from indicators import moving_averages
+from stats import compound, trade_stats
+from sweep import attach_bars, attach_series, cached_averages, param_grid, share_bars, share_series
+from test_backtrader import build_cerebro, fetch_historical_data, strategy_signals, summarize
+
+ENGINES = ("array", "backtrader")
+DEFAULT_CASH = 7000
+
+# Bars attached from shared memory, column arrays per worker process
+_worker_bars = None
+_worker_shm = None
+# Moving averages of all the bars from the IndicatorCache of the parent (or None)
+_worker_ma = None
+_worker_ma_shm = None
+
+
+def _attach(spec, ma_spec=None):
+    global _worker_bars, _worker_shm, _worker_ma, _worker_ma_shm
+    _worker_shm, _worker_bars = attach_bars(spec)
+    if ma_spec is not None:
+        _worker_ma_shm, _worker_ma = attach_series(ma_spec)
+
+
+def make_folds(times, train_days, test_days, step_days=None):
+    """Rolling train/test windows over the trading days of times.
+
+    Every fold trains on train_days days and tests on the test_days days
+    right after them, the next fold starts step_days (default test_days)
+    later, so the test windows follow each other without overlap.
+    Returns a list of dicts with the row ranges [train_lo, train_hi) and
+    [test_lo, test_hi), test_lo == train_hi.
+    """
+    step_days = step_days or test_days
+    days = np.asarray(times, dtype="datetime64[D]")
+    _, day_starts = np.unique(days, return_index=True)
+    bounds = np.append(day_starts, len(days))
+    folds = []
+    first = 0
+    while first + train_days + test_days <= len(day_starts):
+        folds.append({
+            "fold": len(folds),
+            "train_lo": int(bounds[first]),
+            "train_hi": int(bounds[first + train_days]),
+            "test_lo": int(bounds[first + train_days]),
+            "test_hi": int(bounds[first + train_days + test_days]),
+        })
+        first += step_days
+    return folds
+
+
+def _fold_bars(fold, warmup):
+    """Column arrays of the fold plus warmup bars before its train window, and their first row."""
+    lo = max(fold["train_lo"] - warmup, 0)
+    return {name: values[lo:fold["test_hi"]] for name, values in _worker_bars.items()}, lo
+
+
+def _fold_averages(bars, grid, offset):
+    if _worker_ma is not None:
+        return {key: series[offset:offset + len(bars["close"])] for key, series in _worker_ma.items()}
+    # one pass over the fold for every period of the grid points of the task
+    return moving_averages(bars["close"],
+                           sma_periods=sorted({p["sma_period"] for p in grid}),
+                           wma_periods=sorted({p["wma_period"] for p in grid}))
+
+
+def _run_array(bars, ma, params, lo, hi, cash):
+    """crossover_backtest on rows [lo, hi) of the fold, an open trade is closed at the last bar."""
+    # one bar before lo is needed to see a cross on bar lo
+    first = max(lo - 1, 0)
+    window = slice(first, hi)
+    close = bars["close"][window]
+    times = bars["datetime"][window]
+    _, _, _, trades = crossover_backtest(close, ma[("SMA", params["sma_period"])][window],
+                                         ma[("WMA", params["wma_period"])][window],
+                                         params["stop_loss"], times, start=lo - first if lo > first else 2)
+    if trades and "exit_price" not in trades[-1]:
+        trades[-1].update(exit_index=len(close) - 1, exit_time=times[-1], exit_price=close[-1])
+
+    entry_price = np.array([t["entry_price"] for t in trades], dtype=np.float64)
+    exit_price = np.array([t["exit_price"] for t in trades], dtype=np.float64)
+    _, equity = compound(entry_price, exit_price, cash)
+    entry_time = np.array([t["entry_time"] for t in trades], dtype="datetime64[s]")
+    exit_time = np.array([t["exit_time"] for t in trades], dtype="datetime64[s]")
+    metrics = trade_stats(np.diff(equity), cash, entry_time, exit_time, times[lo - first], times[-1])
+    # the curve ends with the deposit at the end of the window, also when there were no trades
+    return metrics, np.append(exit_time, np.datetime64(times[-1], "s")), np.append(equity[1:], equity[-1])
+
+
+def _run_backtrader(bars, signals, params, lo, hi, cash):
+    """FastStrategy on rows [lo, hi) of the fold, an open position counts at its last value."""
+    # the strategy waits for max(periods) bars before its first next(), start
+    # the feed that many bars early so trading starts on bar lo
+    minperiod = max(params["sma_period"], params["wma_period"])
+    first = max(lo - minperiod + 1, 0)
+    window = slice(first, hi)
+    columns = {name: values[window] for name, values in bars.items()}
+    cerebro = build_cerebro(columns, cash=cash, stdstats=False, fast=True,
+                            signals={name: values[window] for name, values in signals.items()},
+                            **params)
+    results = cerebro.run(maxcpus=1)
+    metrics = summarize(cerebro, results)
+    trades = results[0].analyzers.trades.get_analysis()
+    exit_time = np.append(trades["exit_time"], np.datetime64(columns["datetime"][-1], "s"))
+    equity = np.append(cash + np.cumsum(trades["pnl"]), cerebro.broker.getvalue())
+    return metrics, exit_time, equity
+
+
+def _signals_for(bars, ma, params, cache):
+    key = (params["sma_period"], params["wma_period"])
+    if key not in cache:
+        cache[key] = strategy_signals(bars, *key, ma=ma)
+    return cache[key]
+
+
+def _evaluate(bars, ma, grid, lo, hi, engine, cash):
+    signals = {}
+    for params in grid:
+        if engine == "array":
+            yield params, _run_array(bars, ma, params, lo, hi, cash)
+        else:
+            yield params, _run_backtrader(bars, _signals_for(bars, ma, params, signals), params, lo, hi, cash)
+
+
+def train_task(task):
+    """Metrics of every grid point of the task on the train window of its fold."""
+    fold, grid, engine, cash, warmup = task
+    bars, offset = _fold_bars(fold, warmup)
+    ma = _fold_averages(bars, grid, offset)
+    lo, hi = fold["train_lo"] - offset, fold["train_hi"] - offset
+    return fold["fold"], [(params, metrics) for params, (metrics, _, _) in
+                          _evaluate(bars, ma, grid, lo, hi, engine, cash)]
+
+
+def test_task(task):
+    """Out of sample run of the chosen parameters on the test window of the fold."""
+    fold, params, engine, cash, warmup = task
+    bars, offset = _fold_bars(fold, warmup)
+    ma = _fold_averages(bars, [params], offset)
+    lo, hi = fold["test_lo"] - offset, fold["test_hi"] - offset
+    [(_, (metrics, exit_time, equity))] = _evaluate(bars, ma, [params], lo, hi, engine, cash)
+    return fold["fold"], metrics, exit_time, equity
+
+
+def _chunks(grid, n):
+    n = max(1, min(n, len(grid)))
+    return [grid[i::n] for i in range(n)]
+
+
+def _best(rows, objective):
+    # the first grid point wins a tie; a missing metric (no trades) never wins
+    best = None
+    for params, metrics in rows:
+        value = metrics.get(objective)
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            continue
+        if best is None or value > best[1][objective]:
+            best = (params, metrics)
+    return best or rows[0]
+
+
+def stitch(fold_curves, cash=DEFAULT_CASH):
+    """One equity curve from the test runs of consecutive folds.
+
+    Each fold starts with cash, its curve is scaled so that it starts with
+    the final equity of the previous fold instead, i.e. the deposit is
+    carried from one test window to the next.
+    """
+    rows = []
+    carried = cash
+    for fold, exit_time, equity in fold_curves:
+        scaled = np.asarray(equity, dtype=np.float64) / cash * carried
+        rows.append(pd.DataFrame({"fold": fold, "datetime": exit_time, "equity": scaled}))
+        if len(scaled):
+            carried = float(scaled[-1])
+    if not rows:
+        return pd.DataFrame(columns=["fold", "datetime", "equity"])
+    return pd.concat(rows, ignore_index=True)
+
+
+def walk_forward(df, grid, train_days, test_days, step_days=None, engine="array", objective="profitability",
+                 cash=DEFAULT_CASH, processes=None, grid_chunks=None, symbol=None):
+    """Walk-forward optimization of sma_period/wma_period/stop_loss.
+
+    For every fold of make_folds() all grid points are run on the train
+    window, the one with the largest `objective` (a trade_stats/summarize
+    key) is run on the following test window. engine="array" is
+    crossover_backtest (the test_strategy rules), "backtrader" is
+    FastStrategy (the MyStrategy rules, with the same trades).
+
+    Folds and grid points run on a process pool over bars in shared memory.
+    A task covers one fold and a share of its grid (grid_chunks per fold,
+    by default enough to keep every process busy) and computes the moving
+    averages of the fold once for all of its grid points; the bars before
+    a window are used as indicator warm-up. With symbol (df are its cached
+    bars) the moving averages come from the IndicatorCache instead, read once
+    by this process for all the bars and shared with the workers.
+
+    Returns (folds, equity): one row per fold with its windows, the chosen
+    parameters, their train score and the test metrics, and the stitched
+    out of sample equity (see stitch()).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {ENGINES}")
+    for params in grid:
+        missing = {"sma_period", "wma_period", "stop_loss"} - set(params)
+        if missing:
+            raise ValueError(f"grid point {params} has no {', '.join(sorted(missing))}")
+
+    times = df["datetime"].to_numpy(dtype="datetime64[ns]")
+    folds = make_folds(times, train_days, test_days, step_days)
+    if not folds:
+        raise ValueError(f"{len(np.unique(times.astype('datetime64[D]')))} days of bars are not enough "
+                         f"for one fold of {train_days} + {test_days} days")
+    warmup = max(max(p["sma_period"], p["wma_period"]) for p in grid)
+    processes = processes or os.cpu_count()
+    grid_chunks = grid_chunks or -(-processes // len(folds))
+
+    shm, spec = share_bars(df)
+    ma_shm, ma_spec = share_series(cached_averages(symbol, df, grid)) if symbol else (None, None)
+    try:
+        with mp.Pool(processes, initializer=_attach, initargs=(spec, ma_spec)) as pool:
+            with profiling.stage("train"):
+                tasks = [(fold, chunk, engine, cash, warmup) for fold in folds for chunk in _chunks(grid, grid_chunks)]
+                scores = {fold["fold"]: [] for fold in folds}
+                for i, (number, rows) in enumerate(pool.imap_unordered(train_task, tasks), start=1):
+                    scores[number].extend(rows)
+                    if i % 10 == 0 or i == len(tasks):
+                        print(f"Walk-forward: {i}/{len(tasks)} train tasks done.")
+
+            order = {_key(params): i for i, params in enumerate(grid)}
+            chosen = {}
+            for number, rows in scores.items():
+                rows.sort(key=lambda row: order[_key(row[0])])
+                chosen[number] = _best(rows, objective)
+
+            with profiling.stage("test"):
+                tasks = [(fold, chosen[fold["fold"]][0], engine, cash, warmup) for fold in folds]
+                tested = {number: (metrics, exit_time, equity)
+                          for number, metrics, exit_time, equity in pool.imap_unordered(test_task, tasks)}
+    finally:
+        shm.close()
+        shm.unlink()
+        if ma_shm is not None:
+            ma_shm.close()
+            ma_shm.unlink()
+
+    rows = []
+    for fold in folds:
+        number = fold["fold"]
+        params, train_metrics = chosen[number]
+        metrics = tested[number][0]
+        rows.append({
+            "fold": number,
+            "train_start": times[fold["train_lo"]],
+            "train_end": times[fold["train_hi"] - 1],
+            "test_start": times[fold["test_lo"]],
+            "test_end": times[fold["test_hi"] - 1],
+            **params,
+            f"train_{objective}": train_metrics.get(objective),
+            **{f"test_{key}": value for key, value in metrics.items() if key != "initial_deposit"},
+        })
+    equity = stitch([(fold["fold"], tested[fold["fold"]][1], tested[fold["fold"]][2]) for fold in folds], cash)
+    return pd.DataFrame(rows), equity
+
+
+def _key(params):
+    return tuple(sorted(params.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward optimization of the SMA/WMA crossover")
+    parser.add_argument("--symbol", default="RGTI")
+    parser.add_argument("--synthetic", type=int, default=None, metavar="BARS",
+                        help="run on synthetic.minute_bars(BARS) instead of the symbol's bars")
+    parser.add_argument("--sma", type=int, nargs="+", default=[10])
+    parser.add_argument("--wma", type=int, nargs="+", default=[110])
+    parser.add_argument("--stop-loss", type=float, nargs="+", default=[0.99])
+    parser.add_argument("--train-days", type=int, default=60)
+    parser.add_argument("--test-days", type=int, default=20)
+    parser.add_argument("--step-days", type=int, default=None, help="default --test-days")
+    parser.add_argument("--engine", choices=ENGINES, default="array")
+    parser.add_argument("--objective", default="profitability")
+    parser.add_argument("--cash", type=float, default=DEFAULT_CASH)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--out", default=None, help="output prefix, default walkforward_<symbol>")
+    args = parser.parse_args()
+
+    with profiling.run_from_env("walkforward"):
+        if args.synthetic:
+            from synthetic import minute_bars
+            bars = minute_bars(args.synthetic)
+            name, symbol = "synthetic", None
+        else:
+            bars = fetch_historical_data(args.symbol)
+            name = symbol = args.symbol
+        wf_grid = param_grid(sma_period=args.sma, wma_period=args.wma, stop_loss=args.stop_loss)
+        fold_table, stitched = walk_forward(bars, wf_grid, args.train_days, args.test_days, args.step_days,
+                                            args.engine, args.objective, args.cash, args.processes,
+                                            symbol=symbol)
+
+    prefix = args.out or f"walkforward_{name}"
+    fold_table.to_csv(f"{prefix}_folds.csv", index=False)
+    stitched.to_csv(f"{prefix}_equity.csv", index=False)
+
+    pd.set_option("display.max_columns", None)
+    pd.set_option("display.width", 1200)
+    print(fold_table.to_string(index=False))
+    final = stitched["equity"].iloc[-1] if len(stitched) else args.cash
+    print(f"Stitched out of sample: {args.cash} -> {final:.2f} ({final / args.cash - 1:.2%})")